@@ -131,14 +131,22 @@ def responder_stream(
 
     def nodo_tools(state: dict) -> Iterator[Evento]:
         reg = state["registro"]
+        llamadas = state["tool_calls"]
         t0 = time.perf_counter()
-        for tc in state["tool_calls"]:
+        # Las tools de un turno son independientes: se anuncian todas y corren
+        # en paralelo; los mensajes `tool` regresan en el orden que las pidió el modelo.
+        for tc in llamadas:
             yield Evento("paso", {"tool": tc.nombre, "argumentos": tc.argumentos})
-            tt0 = time.perf_counter()
-            resultado = reg.ejecutar(tc)
-            state["tel"].tool_timings.append(
-                {"tool": tc.nombre, "ms": round((time.perf_counter() - tt0) * 1000, 1)}
-            )
+        resultados = reg.ejecutar_varios(
+            llamadas,
+            paralelas=settings.llm_tools_paralelas,
+            timeout_s=settings.llm_tool_timeout_s or None,
+        )
+        for tc, (resultado, ms, vencida) in zip(llamadas, resultados):
+            timing: dict[str, Any] = {"tool": tc.nombre, "ms": round(ms, 1)}
+            if vencida:
+                timing["timeout"] = True
+            state["tel"].tool_timings.append(timing)
             state["messages"].append(
                 {"role": "tool", "tool_name": tc.nombre, "content": resultado}
             )
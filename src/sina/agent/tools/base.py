@@ -12,6 +12,8 @@ from __future__ import annotations
 
 import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from dataclasses import dataclass, field
 from typing import Any, Callable
 
@@ -81,6 +83,69 @@ class RegistroTools:
             return _serializar({"error": f"fallo en {llamada.nombre}: {e}"})
         return _serializar(resultado)
 
+    def ejecutar_varios(
+        self,
+        llamadas: list[ToolCall],
+        paralelas: int = 4,
+        timeout_s: float | None = None,
+    ) -> list[tuple[str, float, bool]]:
+        """
+        Ejecuta las tools de un turno, hasta `paralelas` a la vez, y devuelve
+        [(resultado, ms, vencida)] en el MISMO orden de `llamadas` (el modelo
+        recibe los mensajes `tool` siempre en ese orden); `ms` es la duración
+        real de cada llamada. Cada una tiene `timeout_s` desde que arranca: la
+        que se pasa devuelve un error corregible y su hilo se abandona (no
+        bloquea la respuesta).
+        """
+        if not llamadas:
+            return []
+        inicios: list[float | None] = [None] * len(llamadas)
+
+        def medir(i: int, llamada: ToolCall) -> tuple[str, float]:
+            inicios[i] = time.perf_counter()
+            resultado = self.ejecutar(llamada)
+            return resultado, (time.perf_counter() - inicios[i]) * 1000
+
+        if timeout_s is None and (paralelas <= 1 or len(llamadas) == 1):
+            return [(*medir(i, tc), False) for i, tc in enumerate(llamadas)]
+
+        # Pool por turno: un hilo colgado solo afecta a su turno, nunca a otros.
+        paralelas = max(1, min(paralelas, len(llamadas)))
+        pool = ThreadPoolExecutor(max_workers=paralelas, thread_name_prefix="tool")
+        try:
+            t0 = time.perf_counter()
+            futuros = [pool.submit(medir, i, tc) for i, tc in enumerate(llamadas)]
+            # Una llamada en cola (pool lleno) no arranca su reloj, pero tampoco
+            # espera para siempre si las de adelante se colgaron.
+            tope_cola = None if timeout_s is None else t0 + timeout_s * -(-len(llamadas) // paralelas)
+            salida: list[tuple[str, float, bool]] = []
+            for i, (tc, futuro) in enumerate(zip(llamadas, futuros)):
+                while True:
+                    if timeout_s is None:
+                        limite = None
+                    elif inicios[i] is None:
+                        limite = max(0.0, tope_cola - time.perf_counter())
+                    else:
+                        limite = max(0.0, inicios[i] + timeout_s - time.perf_counter())
+                    try:
+                        salida.append((*futuro.result(timeout=limite), False))
+                        break
+                    except FuturesTimeout:
+                        if inicios[i] is not None and time.perf_counter() < inicios[i] + timeout_s:
+                            continue  # arrancó mientras esperábamos: su reloj empieza ahí
+                        futuro.cancel()
+                        log.warning("Tool %s excedió %.1fs", tc.nombre, timeout_s)
+                        desde = inicios[i] if inicios[i] is not None else t0
+                        salida.append((
+                            _serializar({"error": f"{tc.nombre} tardó demasiado; intenta con una consulta más acotada"}),
+                            (time.perf_counter() - desde) * 1000,
+                            True,
+                        ))
+                        break
+            return salida
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
 
 def _serializar(resultado: Any) -> str:
     """
@@ -4,37 +4,44 @@ from __future__ import annotations
 from typing import Any
 
 from sina.agent.tools.base import ContextoConsulta, Tool
-from sina.config.canasta import CANASTA_BASICA
-from sina.db.repository import SupermercadoRepository
+from sina.config.canasta import CANASTA_BASICA, resumir_canasta
+from sina.db.repository import CanastaMejorRepository, SupermercadoRepository
 
 
 def _tools(ctx: ContextoConsulta) -> list[Tool]:
     repo = SupermercadoRepository()
+    canasta = CanastaMejorRepository()
+
+    def _mejores_en_vivo() -> dict[str, list[dict]]:
+        # Tabla precalculada aún vacía: una búsqueda por lote con el primer
+        # término de cada rubro (p. ej. "Aceite"); sin desglose por tienda.
+        resultados = repo.buscar_muchos([terminos[0] for terminos in CANASTA_BASICA.values()], limit=5)
+        return {
+            item: [min(filas, key=lambda f: f["precio"])]
+            for item, filas in zip(CANASTA_BASICA, resultados) if filas
+        }
 
     def armar_canasta(presupuesto: float | None = None) -> dict[str, Any]:
-        items = []
-        total = 0.0
-        for item, terminos in CANASTA_BASICA.items():
-            # Usa el primer término de búsqueda del item (p. ej. "Aceite").
-            filas = repo.buscar(q=terminos[0], limit=5)
-            if not filas:
-                items.append({"item": item, "encontrado": False})
-                continue
-            mejor = min(filas, key=lambda f: f["precio"])
-            total += mejor["precio"]
-            items.append({
-                "item": item,
+        resumen = resumir_canasta(canasta.mejores() or _mejores_en_vivo())
+        items = [
+            {"item": i["item"], "encontrado": False} if not i["encontrado"] else {
+                "item": i["item"],
                 "encontrado": True,
-                "producto": mejor["producto"],
-                "precio": mejor["precio"],
-                "tienda": mejor["tienda"],
-            })
+                "producto": i["opciones"][0]["producto"],
+                "precio": i["opciones"][0]["precio"],
+                "tienda": i["opciones"][0]["tienda"],
+            }
+            for i in resumen["items"]
+        ]
+        total = resumen["costo_canasta_minima"]
 
         resultado: dict[str, Any] = {
             "items": items,
-            "encontrados": sum(1 for i in items if i.get("encontrado")),
-            "total_items": len(CANASTA_BASICA),
-            "costo_canasta_minima": round(total, 2),
+            "encontrados": resumen["encontrados"],
+            "total_items": resumen["total_items"],
+            "costo_canasta_minima": total,
+            "costo_por_tienda": {t: d["total"] for t, d in resumen["tiendas"].items()
+                                 if not d["faltantes"]},
         }
         if presupuesto is not None:
             resultado["presupuesto"] = presupuesto
@@ -47,7 +54,8 @@ def _tools(ctx: ContextoConsulta) -> list[Tool]:
             nombre="armar_canasta",
             descripcion=(
                 "Arma la canasta básica (aceite, arroz, frijol, huevo, leche, etc.) eligiendo el "
-                "producto más barato de cada rubro y suma el costo mínimo. Opcional: comparar contra un presupuesto."
+                "producto más barato de cada rubro y suma el costo mínimo; incluye el costo de la "
+                "canasta completa en cada tienda. Opcional: comparar contra un presupuesto."
             ),
             parametros={
                 "properties": {
@@ -4,7 +4,7 @@ from __future__ import annotations
 from typing import Any
 
 from sina.agent.tools.base import ContextoConsulta, Tool
-from sina.db.repository import MunicipioRepository
+from sina.db.indice_ubicaciones import get_indice_ubicaciones
 from sina.scraping.gobierno.cne_gas_lp import get_precios_gas_lp, get_localidades_by_municipio
 
 
@@ -61,10 +61,10 @@ def _tools(ctx: ContextoConsulta) -> list[Tool]:
         municipio = (municipio or ctx.municipio or "").strip()
         if not estado or not municipio:
             return {"necesita": "municipio", "mensaje": "Necesito estado y municipio."}
-        ids = MunicipioRepository().obtener_ids(estado, municipio)
+        ids = get_indice_ubicaciones().resolver_municipio(estado, municipio)
         if ids is None:
             return {"error": f"no encontré el municipio '{municipio}' en '{estado}'."}
-        entidad_id, municipio_id = ids
+        _, _, entidad_id, municipio_id = ids
         locs = get_localidades_by_municipio(entidad_id, municipio_id)
         return {"estado": estado, "municipio": municipio,
                 "localidades": [l.get("nombre") for l in locs]}
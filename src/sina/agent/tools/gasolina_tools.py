@@ -1,86 +1,110 @@
-"""Tool de gasolina: precios por municipio, con orden por precio o cercanía."""
+"""
+Tool de gasolina: precios por municipio (top-N en SQL) o alrededor del usuario
+(índice espacial en memoria, cruza límites municipales).
+"""
 from __future__ import annotations
 
 from typing import Any
 
-from sina.agent.geo import haversine_km
 from sina.agent.tools.base import ContextoConsulta, Tool
-from sina.db.repository import MunicipioRepository
-from sina.scraping.gobierno.cre_gasolina import get_precios_gasolina
-
-# Sinónimos de tipo de combustible → columna del modelo.
-_TIPO_A_COLUMNA = {
-    "regular": "magna", "magna": "magna", "verde": "magna",
-    "premium": "premium", "roja": "premium",
-    "diesel": "diesel", "diésel": "diesel",
-}
+from sina.db.indice_gasolineras import COLUMNA_POR_TIPO, get_indice_gasolineras
+from sina.db.indice_ubicaciones import get_indice_ubicaciones
+from sina.db.models import gasolina_vigente
+from sina.db.repository import GasolinaRepository
+from sina.scraping.gobierno.cre_gasolina import get_precios_gasolina, refrescar_gasolina_en_background
 
 
 def _tools(ctx: ContextoConsulta) -> list[Tool]:
+    def _mejores_del_municipio(ids: tuple, columna: str, top_n: int) -> dict[str, Any]:
+        # La vigencia sale de la misma consulta (`fecha_datos`): vigente → caché;
+        # vencido → se sirve y se refresca en background; sin filas → primera
+        # carga CRE en línea (con caché negativa y single-flight) y se relee.
+        estado, municipio, entidad_id, municipio_id = ids
+        repo = GasolinaRepository()
+        consulta = repo.mejores_estaciones(estado, municipio, columna, limit=top_n)
+        if consulta["filas"]:
+            if gasolina_vigente(consulta["fecha_datos"]):
+                return {**consulta, "fuente": "cache"}
+            refrescar_gasolina_en_background(estado, municipio, entidad_id, municipio_id)
+            return {**consulta, "fuente": "cache_vencido"}
+        res = get_precios_gasolina(estado, municipio, entidad_id, municipio_id)
+        if res.get("status") != "ok":
+            return {"error": res.get("detail", "no pude obtener precios de gasolina.")}
+        return {**repo.mejores_estaciones(estado, municipio, columna, limit=top_n), "fuente": res.get("fuente")}
+
     def buscar_gasolina(
         tipo: str = "regular",
         municipio: str | None = None,
         estado: str | None = None,
         ordenar_por: str = "precio",
         top_n: int = 5,
+        radio_km: float | None = None,
     ) -> dict[str, Any]:
+        columna = COLUMNA_POR_TIPO.get(tipo.strip().lower())
+        if columna is None:
+            return {"error": f"tipo de combustible no reconocido: {tipo}",
+                    "tipos_validos": ["regular", "premium", "diesel"]}
+
+        top_n = max(1, min(int(top_n), 10))
+        radio_km = float(radio_km) if radio_km else None
+        usar_cercania = ordenar_por == "cercania" and ctx.tiene_coordenadas
+        alrededor = ctx.tiene_coordenadas and (usar_cercania or radio_km is not None)
+
         estado = (estado or ctx.estado or "").strip()
         municipio = (municipio or ctx.municipio or "").strip()
-        if not estado or not municipio:
+        if not alrededor and (not estado or not municipio):
             return {"necesita": "municipio",
                     "mensaje": "Necesito el estado y municipio para buscar gasolina."}
 
-        columna = _TIPO_A_COLUMNA.get(tipo.strip().lower())
-        if columna is None:
-            return {"error": f"tipo de combustible no reconocido: {tipo}",
-                    "tipos_validos": ["regular", "premium", "diesel"]}
-
-        ids = MunicipioRepository().obtener_ids(estado, municipio)
-        if ids is None:
+        ids = get_indice_ubicaciones().resolver_municipio(estado, municipio) if estado and municipio else None
+        if ids is None and not alrededor:
             return {"error": f"no encontré el municipio '{municipio}' en '{estado}'."}
-        entidad_id, municipio_id = ids
 
-        res = get_precios_gasolina(estado, municipio, entidad_id, municipio_id)
-        if res.get("status") != "ok":
-            return {"error": res.get("detail", "no pude obtener precios de gasolina.")}
+        if ids is not None:
+            estado, municipio = ids[0], ids[1]
 
-        filas = [d for d in res.get("datos", []) if d.get(columna) is not None]
-        if not filas:
-            return {"total": 0,
-                    "mensaje": f"no hay precios de {tipo} en {municipio}, {estado}."}
-
-        usar_cercania = ordenar_por == "cercania" and ctx.tiene_coordenadas
-        resultados = []
-        for d in filas:
-            item = {
-                "nombre": d.get("nombre"),
-                "direccion": d.get("direccion"),
-                "precio": d.get(columna),
-                "latitud": d.get("latitud"),
-                "longitud": d.get("longitud"),
+        if alrededor:
+            # Alrededor del usuario: k vecinos (o las más baratas en el radio)
+            # desde el índice espacial, sin importar el municipio. Sin refresco
+            # del municipio: el índice ya responde y no se esperaría a la CRE
+            # por filas que luego no se usan.
+            resultados = get_indice_gasolineras().cercanas(
+                ctx.lat, ctx.lng, k=top_n,
+                radio_km=radio_km,
+                columna=columna,
+                ordenar_por="distancia" if usar_cercania else "precio",
+            )
+            campos = ("nombre", "direccion", "municipio", "precio", "latitud", "longitud", "distancia_km")
+            resultados = [{c: r[c] for c in campos} for r in resultados]
+            if not resultados:
+                cerca = f" a menos de {radio_km:g} km" if radio_km else ""
+                return {"total": 0, "mensaje": f"no hay precios de {tipo}{cerca} de tu ubicación."}
+            return {
+                "tipo": tipo,
+                "estado": estado or None,
+                "municipio": municipio or None,
+                "fuente": "indice",
+                "ordenado_por": "cercania" if usar_cercania else "precio",
+                "radio_km": radio_km,
+                "total": len(resultados),
+                "resultados": resultados,
             }
-            if usar_cercania and d.get("latitud") is not None and d.get("longitud") is not None:
-                item["distancia_km"] = round(
-                    haversine_km(ctx.lat, ctx.lng, d["latitud"], d["longitud"]), 2
-                )
-            resultados.append(item)
-
-        if usar_cercania:
-            resultados = [r for r in resultados if "distancia_km" in r]
-            resultados.sort(key=lambda r: r["distancia_km"])
-        else:
-            resultados.sort(key=lambda r: r["precio"])
 
-        top_n = max(1, min(int(top_n), 10))
+        consulta = _mejores_del_municipio(ids, columna, top_n)
+        if "error" in consulta:
+            return consulta
+        if not consulta["filas"]:
+            return {"total": 0,
+                    "mensaje": f"no hay precios de {tipo} en {municipio}, {estado}."}
         return {
             "tipo": tipo,
             "estado": estado,
             "municipio": municipio,
-            "fuente": res.get("fuente"),
-            "fecha_datos": res.get("fecha_datos"),
-            "ordenado_por": "cercania" if usar_cercania else "precio",
-            "total": len(resultados),
-            "resultados": resultados[:top_n],
+            "fuente": consulta["fuente"],
+            "fecha_datos": consulta["fecha_datos"],
+            "ordenado_por": "precio",
+            "total": consulta["total"],
+            "resultados": consulta["filas"],
         }
 
     return [
@@ -89,7 +113,9 @@ def _tools(ctx: ContextoConsulta) -> list[Tool]:
             descripcion=(
                 "Precios de gasolina (regular/premium/diesel) en un municipio. "
                 "Ordena por precio (más barata primero) o por cercanía si el usuario "
-                "compartió su ubicación. Si no se da municipio/estado, usa el del contexto."
+                "compartió su ubicación; con ubicación, 'cercania' y 'radio_km' buscan "
+                "alrededor de él aunque sea otro municipio. Si no se da municipio/estado, "
+                "usa el del contexto."
             ),
             parametros={
                 "properties": {
@@ -100,6 +126,8 @@ def _tools(ctx: ContextoConsulta) -> list[Tool]:
                     "ordenar_por": {"type": "string", "enum": ["precio", "cercania"],
                                     "description": "Criterio de orden. 'cercania' requiere ubicación del usuario."},
                     "top_n": {"type": "integer", "description": "Cuántas estaciones devolver (1-10)."},
+                    "radio_km": {"type": "number",
+                                 "description": "Solo estaciones a menos de esta distancia (requiere ubicación del usuario)."},
                 },
                 "required": ["tipo"],
             },
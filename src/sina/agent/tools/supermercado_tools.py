@@ -36,8 +36,8 @@ def _tools(ctx: ContextoConsulta) -> list[Tool]:
             return {"error": "la lista de items está vacía."}
         detalle = []
         total_mejor = 0.0
-        for item in items:
-            filas = repo.buscar(q=str(item).strip(), limit=5)
+        resultados = repo.buscar_muchos([str(item).strip() for item in items], limit=5)
+        for item, filas in zip(items, resultados):
             if not filas:
                 detalle.append({"item": item, "encontrado": False})
                 continue
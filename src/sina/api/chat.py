@@ -23,6 +23,7 @@ from sina.api.deps import require_csrf, require_csrf_si_sesion, require_session,
 from sina.api.ratelimit import limiter
 from sina.config.app_settings import settings
 from sina.db.chat_store import ChatStore, ConversacionesLlenas
+from sina.db.indice_gasolineras import geocodificar_inverso
 from sina.moderacion.moderar import ResultadoModeracion, moderar
 
 log = logging.getLogger(__name__)
@@ -147,6 +148,16 @@ def chat(
     ctx = ContextoConsulta(
         estado=u.estado, municipio=u.municipio, localidad=u.localidad, lat=u.lat, lng=u.lng
     )
+    # Solo geolocalización del navegador: el municipio sale de las coordenadas
+    # (offline), así las tools no tienen que pedírselo al usuario.
+    if ctx.tiene_coordenadas and not (ctx.estado and ctx.municipio):
+        try:
+            ubicacion = geocodificar_inverso(ctx.lat, ctx.lng)
+        except Exception:  # noqa: BLE001
+            log.exception("Geocodificación inversa falló; se sigue sin municipio")
+            ubicacion = None
+        if ubicacion is not None:
+            ctx.estado, ctx.municipio = ubicacion[0], ubicacion[1]
 
     # Resolver conversación (solo con sesión + Mongo disponible).
     store = ChatStore() if sesion is not None else None
@@ -0,0 +1,64 @@
+"""
+Respuestas condicionales (ETag / Last-Modified → 304) para los endpoints de precios.
+
+Los precios cambian a lo más diario (gasolina) o semanal (gas LP), pero cada
+GET recalculaba y re-serializaba todo el payload. Los endpoints calculan primero
+una "versión" barata de los datos (un `max()` indexado + contadores, ver
+`version_*` en los repositorios) y, si el cliente ya tiene esa versión
+(`If-None-Match`, o `If-Modified-Since` cuando no manda ETag), responden 304 sin
+cargar una sola fila. Solo se aplica mientras el caché está vigente: con datos
+vencidos la respuesta normal dispara el refresco (stale-while-revalidate) y no
+lleva validadores.
+"""
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Mapping
+
+
+def etag_fuerte(*partes: Any) -> str:
+    """ETag fuerte (entre comillas) derivado de la versión de los datos y los parámetros."""
+    huella = "\x1f".join("" if p is None else str(p) for p in partes)
+    return '"' + hashlib.sha256(huella.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _utc_segundos(fecha: datetime) -> datetime:
+    """UTC con resolución de segundos (la de las fechas HTTP); naive = UTC."""
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return fecha.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def cabeceras_cache(etag: str, ultima: datetime | None) -> dict[str, str]:
+    """ETag + Last-Modified + `no-cache` (el navegador guarda, pero revalida siempre)."""
+    cabeceras = {"ETag": etag, "Cache-Control": "no-cache"}
+    if ultima is not None:
+        cabeceras["Last-Modified"] = format_datetime(_utc_segundos(ultima), usegmt=True)
+    return cabeceras
+
+
+def no_modificado(headers: Mapping[str, str], etag: str, ultima: datetime | None) -> bool:
+    """
+    True si la copia del cliente sigue siendo válida (RFC 9110 §13.1): manda
+    `If-None-Match` (comparación débil, admite `*` y listas); solo sin él se
+    considera `If-Modified-Since`.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        candidatos = {c.strip().removeprefix("W/") for c in if_none_match.split(",")}
+        return etag in candidatos
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and ultima is not None:
+        try:
+            desde = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if desde.tzinfo is None:
+            desde = desde.replace(tzinfo=timezone.utc)
+        return _utc_segundos(ultima) <= desde
+    return False
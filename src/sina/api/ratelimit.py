@@ -1,14 +1,65 @@
 """
 Rate limiting con slowapi (por IP). Límite base generoso para lecturas públicas
 (los GET de precios ya van cacheados) y estricto en auth para frenar
-enumeración/credential-stuffing. Para límites GLOBALES al escalar
-horizontalmente, respaldar con Redis (storage_uri) — en memoria es por-instancia.
+enumeración/credential-stuffing.
+
+Por defecto los contadores viven en memoria (por worker). Con
+RATE_LIMIT_STORAGE_URI=sina-compartida:// viven en la caché compartida (ver
+`cache_compartida`) y el límite es GLOBAL entre workers, a cambio de que cada
+request haga tres idas a la DB (INCR + dos lecturas para las cabeceras) que
+`SlowAPIMiddleware` ejecuta sin salir del event loop; por eso es opcional.
+Admite cualquier URI de `limits` (p. ej. `redis://...`). Si el almacén falla,
+slowapi cae a memoria en vez de responder 500.
 """
+import os
+
+from limits.storage import Storage
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from sqlalchemy.exc import SQLAlchemyError
+
+from sina.db.cache_compartida import get_almacen_compartido
+
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+
+
+class AlmacenLimites(Storage):
+    """Storage de `limits` (ventana fija) sobre los contadores de la caché compartida."""
+
+    STORAGE_SCHEME = ["sina-compartida"]
+
+    @property
+    def base_exceptions(self) -> type[Exception] | tuple[type[Exception], ...]:
+        return SQLAlchemyError
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        return get_almacen_compartido().incrementar(f"limite:{key}", expiry, amount)[0]
+
+    def get(self, key: str) -> int:
+        return get_almacen_compartido().contador(f"limite:{key}")[0]
+
+    def get_expiry(self, key: str) -> float:
+        return get_almacen_compartido().contador(f"limite:{key}")[1]
+
+    def check(self) -> bool:
+        try:
+            get_almacen_compartido().contador("limite:check")
+            return True
+        except Exception:  # noqa: BLE001
+            return False
+
+    def reset(self) -> int | None:
+        get_almacen_compartido().borrar_prefijo("limite:")
+        return None
+
+    def clear(self, key: str) -> None:
+        get_almacen_compartido().borrar([f"limite:{key}"])
+
 
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["240/minute"],
     headers_enabled=True,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    in_memory_fallback_enabled=True,
 )
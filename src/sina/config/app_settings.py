@@ -16,6 +16,11 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 log = logging.getLogger(__name__)
 
 
+def _primera_carga_timeout_s() -> float:
+    """Mismo valor que `refresco.PRIMERA_CARGA_TIMEOUT_S` (sin importar el scraping)."""
+    return float(os.getenv("PRIMERA_CARGA_TIMEOUT_S", "45"))
+
+
 class AppSettings(BaseSettings):
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", extra="ignore"
@@ -50,6 +55,15 @@ class AppSettings(BaseSettings):
     llm_temperature: float = Field(default=0.2, alias="LLM_TEMPERATURE")
     # Tope de iteraciones del grafo (rondas de tool-calling) por respuesta.
     llm_max_iters: int = Field(default=6, alias="LLM_MAX_ITERS")
+    # Tools pedidas en un mismo turno: cuántas corren a la vez (1 = en serie) y
+    # el tope de segundos de cada una (al vencer, el modelo recibe un error).
+    # Por defecto cubre la espera de una primera carga de CRE/CNE
+    # (PRIMERA_CARGA_TIMEOUT_S) más un margen para la consulta misma: con menos,
+    # la tool se corta mientras la carga sigue y el usuario no recibe precios.
+    llm_tools_paralelas: int = Field(default=4, alias="LLM_TOOLS_PARALELAS")
+    llm_tool_timeout_s: float = Field(
+        default_factory=lambda: _primera_carga_timeout_s() + 15.0, alias="LLM_TOOL_TIMEOUT_S"
+    )
 
     # ── Moderación de consultas del chat ──────────────────────────────────
     # Feature flag de la capa de moderación (clasificador + baneo progresivo).
@@ -90,6 +104,17 @@ class AppSettings(BaseSettings):
             return [o.strip() for o in v.split(",") if o.strip()]
         return v
 
+    @field_validator("llm_tool_timeout_s")
+    @classmethod
+    def _tool_timeout_cubre_primera_carga(cls, v: float) -> float:
+        if v and v < _primera_carga_timeout_s():
+            log.warning(
+                "LLM_TOOL_TIMEOUT_S=%s es menor que PRIMERA_CARGA_TIMEOUT_S=%s: las tools de "
+                "gasolina/gas LP pueden cortarse durante la primera carga de una ubicación.",
+                v, _primera_carga_timeout_s(),
+            )
+        return v
+
     @property
     def is_prod(self) -> bool:
         return self.environment.lower() in {"prod", "production"}
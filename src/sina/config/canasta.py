@@ -120,4 +120,42 @@ def _resumen_vacio() -> dict:
         "n_cadenas": 0,
         "n_items": 0,
         "n_productos_total": 0,
-    }
\ No newline at end of file
+    }
+
+def resumir_canasta(mejores: dict[str, list[dict]]) -> dict:
+    """
+    A partir de {rubro: [mejor producto por tienda, del más barato al más caro]}
+    (`CanastaMejorRepository.mejores`) arma la comparación que consumen el
+    endpoint y el agente: la canasta mínima (el más barato de cada rubro en
+    cualquier tienda) y el costo de la canasta en cada tienda, con los rubros
+    que le faltan.
+    """
+    items = []
+    minima = 0.0
+    por_tienda: dict[str, dict] = {}
+    for item in CANASTA_BASICA:
+        opciones = mejores.get(item, [])
+        items.append({"item": item, "encontrado": bool(opciones), "opciones": opciones})
+        if opciones:
+            minima += opciones[0]["precio"]
+        for o in opciones:
+            tienda = por_tienda.setdefault(o["tienda"], {"total": 0.0, "items": 0})
+            tienda["total"] += o["precio"]
+            tienda["items"] += 1
+
+    tiendas = {
+        nombre: {
+            "total": round(t["total"], 2),
+            "items": t["items"],
+            "faltantes": [i["item"] for i in items
+                          if nombre not in {o["tienda"] for o in i["opciones"]}],
+        }
+        for nombre, t in sorted(por_tienda.items(), key=lambda kv: (-kv[1]["items"], kv[1]["total"]))
+    }
+    return {
+        "items": items,
+        "tiendas": tiendas,
+        "costo_canasta_minima": round(minima, 2),
+        "encontrados": sum(1 for i in items if i["encontrado"]),
+        "total_items": len(CANASTA_BASICA),
+    }
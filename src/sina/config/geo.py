@@ -0,0 +1,25 @@
+"""Utilidades geográficas (distancias entre coordenadas), sin dependencias de capa."""
+from __future__ import annotations
+
+import math
+
+# Kilómetros por grado de latitud (y de longitud en el ecuador), con R = 6371 km.
+KM_POR_GRADO = 6371.0 * math.pi / 180
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Distancia en kilómetros entre dos coordenadas (fórmula de haversine).
+
+    Espeja `frontend/src/lib/geo.ts` (R = 6371 km) para que el "cerca de mí" del
+    chat coincida con el de la página de Gasolina.
+    """
+    r = 6371.0
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = (
+        math.sin(d_lat / 2) ** 2
+        + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon / 2) ** 2
+    )
+    return r * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
@@ -0,0 +1,167 @@
+"""
+Benchmark recall/latencia: búsqueda exacta vs. índice ANN (HNSW / IVFFlat).
+
+Crea una tabla sintética (`_benchmark_ann`, se borra al final salvo
+`--conservar`) con vectores agrupados en clusters (como productos
+parecidos entre sí), de la misma dimensión que `supermercados.embedding`. Para
+cada consulta calcula el top-k EXACTO (scan secuencial, antes de crear el índice) y lo
+compara con el top-k del índice a varios `ef_search` / `probes`:
+
+    uv run python -m sina.db.benchmark_ann                      # 1 000 000 filas, HNSW
+    uv run python -m sina.db.benchmark_ann --filas 200000 --ivfflat
+    uv run python -m sina.db.benchmark_ann --ef 20 40 100 200 --consultas 200
+
+Solo PostgreSQL + pgvector. Generar e indexar un millón de vectores de 1024
+dims tarda varios minutos y ocupa ~4 GB; usa `--filas`/`--dim` para probar
+en chico.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+from sqlalchemy import text
+
+from sina.config.credentials import DB_URL
+from sina.db.repository import (
+    HNSW_EF_CONSTRUCTION,
+    HNSW_M,
+    IVFFLAT_LISTS,
+    _engine,
+)
+from sina.embedder.base import EMBEDDING_DIM
+
+_TABLA = "_benchmark_ann"
+_LOTE_GENERACION = 100_000
+
+
+def _generar(conn, filas: int, dim: int, clusters: int, ruido: float) -> None:
+    """Centros aleatorios + ruido (sin normalizar: la distancia coseno no depende de la norma)."""
+    conn.execute(text(f"DROP TABLE IF EXISTS {_TABLA}"))
+    conn.execute(text(f"CREATE TABLE {_TABLA} (id bigint PRIMARY KEY, embedding vector({dim}))"))
+    conn.execute(text("DROP TABLE IF EXISTS _benchmark_centros"))
+    conn.execute(text(
+        "CREATE TEMP TABLE _benchmark_centros AS "
+        "SELECT k, array_agg(random() - 0.5 ORDER BY d) AS c "
+        "FROM generate_series(0, :k - 1) k, generate_series(1, :dim) d GROUP BY k"
+    ), {"k": clusters, "dim": dim})
+    for desde in range(0, filas, _LOTE_GENERACION):
+        hasta = min(filas, desde + _LOTE_GENERACION)
+        conn.execute(text(
+            f"INSERT INTO {_TABLA} (id, embedding) "
+            "SELECT i, (SELECT array_agg(x + (random() - 0.5) * :ruido ORDER BY o) "
+            "           FROM unnest(c.c) WITH ORDINALITY u(x, o))::vector "
+            "FROM generate_series(:desde, :hasta - 1) i "
+            "JOIN _benchmark_centros c ON c.k = i % :k"
+        ), {"desde": desde, "hasta": hasta, "k": clusters, "ruido": ruido})
+        conn.commit()
+        print(f"  [+] {hasta}/{filas} vectores")
+
+
+def _consultas(conn, n: int, clusters: int, ruido: float) -> list[str]:
+    """Vectores de consulta con la misma distribución (no están en la tabla)."""
+    return conn.execute(text(
+        "SELECT (SELECT array_agg(x + (random() - 0.5) * :ruido ORDER BY o) "
+        "        FROM unnest(c.c) WITH ORDINALITY u(x, o))::vector::text "
+        "FROM generate_series(1, :n) i "
+        "JOIN _benchmark_centros c ON c.k = (i * 7919) % :k"
+    ), {"n": n, "k": clusters, "ruido": ruido}).scalars().all()
+
+
+def _top_k(conn, vector: str, k: int, ajustes: dict[str, str]) -> tuple[list[int], float]:
+    with conn.begin():
+        for parametro, valor in ajustes.items():
+            conn.execute(text("SELECT set_config(:p, :v, true)"), {"p": parametro, "v": valor})
+        inicio = time.perf_counter()
+        ids = conn.execute(text(
+            f"SELECT id FROM {_TABLA} ORDER BY embedding <=> CAST(:v AS vector) LIMIT :k"
+        ), {"v": vector, "k": k}).scalars().all()
+        return ids, (time.perf_counter() - inicio) * 1000
+
+
+def _medir(conn, consultas: list[str], k: int, ajustes: dict[str, str],
+           exactos: list[list[int]] | None) -> dict:
+    latencias, recalls, resultados = [], [], []
+    for i, vector in enumerate(consultas):
+        ids, ms = _top_k(conn, vector, k, ajustes)
+        latencias.append(ms)
+        resultados.append(ids)
+        if exactos is not None:
+            recalls.append(len(set(ids) & set(exactos[i])) / k)
+    latencias.sort()
+    return {
+        "p50_ms": statistics.median(latencias),
+        "p95_ms": latencias[min(len(latencias) - 1, int(0.95 * len(latencias)))],
+        "recall": statistics.mean(recalls) if recalls else 1.0,
+        "ids":    resultados,
+    }
+
+
+def correr(filas: int, dim: int, k: int, n_consultas: int, ef: list[int], probes: list[int],
+           ivfflat: bool, clusters: int, ruido: float, conservar: bool) -> list[dict]:
+    if not DB_URL.startswith("postgresql"):
+        raise RuntimeError("El benchmark ANN requiere PostgreSQL (pgvector).")
+
+    resultados: list[dict] = []
+    with _engine.connect() as conn:
+        try:
+            print(f"[+] Generando {filas} vectores de {dim} dims en {clusters} clusters...")
+            _generar(conn, filas, dim, clusters, ruido)
+            conn.execute(text(f"ANALYZE {_TABLA}"))
+            conn.commit()
+            consultas = _consultas(conn, n_consultas, clusters, ruido)
+            conn.commit()
+
+            # Exacto: sin índice todavía → scan secuencial (la verdad de referencia).
+            exacto = _medir(conn, consultas, k, {}, None)
+            resultados.append({"metodo": "exacto", "parametro": "-", "construccion_s": 0.0, **exacto})
+
+            if ivfflat:
+                indice = f"ivfflat (embedding vector_cosine_ops) WITH (lists = {IVFFLAT_LISTS})"
+                barrido = [("ivfflat.probes", p) for p in probes]
+            else:
+                indice = (f"hnsw (embedding vector_cosine_ops) WITH (m = {HNSW_M}, "
+                          f"ef_construction = {HNSW_EF_CONSTRUCTION})")
+                barrido = [("hnsw.ef_search", e) for e in ef]
+            print(f"[+] Construyendo índice {indice}...")
+            inicio = time.perf_counter()
+            conn.execute(text(f"CREATE INDEX ix_{_TABLA}_ann ON {_TABLA} USING {indice}"))
+            conn.commit()
+            construccion = time.perf_counter() - inicio
+
+            for parametro, valor in barrido:
+                ann = _medir(conn, consultas, k, {parametro: str(valor)}, exacto["ids"])
+                resultados.append({"metodo": parametro.split(".")[0], "parametro": f"{parametro}={valor}",
+                                   "construccion_s": construccion, **ann})
+        finally:
+            if not conservar:
+                conn.rollback()
+                conn.execute(text(f"DROP TABLE IF EXISTS {_TABLA}"))
+                conn.commit()
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall/latencia: búsqueda exacta vs. índice ANN.")
+    parser.add_argument("--filas", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--k", type=int, default=10, help="top-k por consulta (default 10)")
+    parser.add_argument("--consultas", type=int, default=100)
+    parser.add_argument("--ef", type=int, nargs="+", default=[20, 40, 100, 200],
+                        help="valores de hnsw.ef_search a barrer")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 5, 10, 20],
+                        help="valores de ivfflat.probes a barrer (con --ivfflat)")
+    parser.add_argument("--ivfflat", action="store_true", help="mide IVFFlat en vez de HNSW")
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--ruido", type=float, default=0.6,
+                        help="dispersión alrededor de cada centro (más = clusters menos definidos)")
+    parser.add_argument("--conservar", action="store_true", help="no borra la tabla sintética")
+    args = parser.parse_args()
+
+    print(f"{'método':<8} {'parámetro':<22} {'recall@' + str(args.k):>10} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'índice s':>9}")
+    for r in correr(args.filas, args.dim, args.k, args.consultas, args.ef, args.probes,
+                    args.ivfflat, args.clusters, args.ruido, args.conservar):
+        print(f"{r['metodo']:<8} {r['parametro']:<22} {r['recall']:>10.3f} "
+              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['construccion_s']:>9.1f}")
@@ -0,0 +1,133 @@
+"""
+Benchmark de escritura masiva (`BaseRepository._upsert_masivo`).
+
+Compara filas/segundo de cada estrategia sobre una tabla desechable
+(`_benchmark_bulk`, se crea y se borra aquí; no toca las tablas de la app):
+
+  - un_insert: un solo INSERT multi-VALUES con todas las filas (lo de antes;
+    en SQLite queda acotado al límite de parámetros por sentencia).
+  - lotes:     INSERT multi-VALUES de DB_LOTE_UPSERT filas.
+  - copy:      COPY a tabla temporal + un INSERT ... SELECT ... ON CONFLICT
+               (solo PostgreSQL).
+
+Cada estrategia corre dos pasadas: carga inicial (todo inserta) y re-upsert con
+~10% de precios cambiados (el resto lo salta el WHERE de cambio).
+
+    uv run python -m sina.db.benchmark_bulk                 # 20 000 filas
+    uv run python -m sina.db.benchmark_bulk --filas 100000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Float, Integer, String
+from sqlalchemy.orm import DeclarativeBase
+
+from sina.db.repository import LOTE_UPSERT, BaseRepository, _cambio_en, _dialect_insert
+
+
+class _Base(DeclarativeBase):
+    pass
+
+
+class FilaBenchmark(_Base):
+    """Forma parecida a `gasolineras`: clave natural única + precios."""
+    __tablename__ = "_benchmark_bulk"
+
+    id        = Column(Integer, primary_key=True, autoincrement=True)
+    clave     = Column(String, unique=True, nullable=False)
+    nombre    = Column(String, nullable=False)
+    municipio = Column(String, nullable=False)
+    magna     = Column(Float, nullable=True)
+    premium   = Column(Float, nullable=True)
+    diesel    = Column(Float, nullable=True)
+    fecha     = Column(DateTime(timezone=True), nullable=False)
+
+
+class _BenchmarkRepository(BaseRepository[FilaBenchmark]):
+    model = FilaBenchmark
+
+    def upsert(self, filas: list[dict], estrategia: str, lote: int | None) -> dict:
+        excluded = _dialect_insert(self.model).excluded
+        return self._upsert_masivo(filas, lambda ins: ins.on_conflict_do_update(
+            index_elements=["clave"],
+            set_={
+                "nombre":  excluded.nombre,
+                "magna":   excluded.magna,
+                "premium": excluded.premium,
+                "diesel":  excluded.diesel,
+                "fecha":   excluded.fecha,
+            },
+            where=_cambio_en(self.model, excluded, ["nombre", "magna", "premium", "diesel"]),
+        ), estrategia=estrategia, lote=lote)
+
+
+def _filas(n: int) -> list[dict]:
+    ahora = datetime.now(timezone.utc)
+    return [
+        {
+            "clave":     f"PL/{i:07d}/EXP/ES/2015",
+            "nombre":    f"Estación {i}",
+            "municipio": f"municipio {i % 2500}",
+            "magna":     round(random.uniform(21, 25), 2),
+            "premium":   round(random.uniform(23, 27), 2),
+            "diesel":    round(random.uniform(24, 28), 2) if i % 7 else None,
+            "fecha":     ahora,
+        }
+        for i in range(n)
+    ]
+
+
+def _cronometrar(fn) -> tuple[dict, float]:
+    inicio = time.perf_counter()
+    conteo = fn()
+    return conteo, time.perf_counter() - inicio
+
+
+def correr(n_filas: int = 20_000, lote: int = LOTE_UPSERT) -> list[dict]:
+    """Devuelve una fila de resultados por (estrategia, pasada)."""
+    repo = _BenchmarkRepository()
+    tabla = FilaBenchmark.__table__
+    estrategias: list[tuple[str, str, int | None]] = [
+        ("un_insert", "lotes", n_filas),
+        ("lotes",     "lotes", lote),
+    ]
+    if repo.engine.dialect.name == "postgresql":
+        estrategias.append(("copy", "copy", None))
+
+    resultados = []
+    try:
+        for nombre, estrategia, tam in estrategias:
+            tabla.drop(repo.engine, checkfirst=True)
+            tabla.create(repo.engine)
+            filas = _filas(n_filas)
+
+            conteo, seg = _cronometrar(lambda: repo.upsert(filas, estrategia, tam))
+            resultados.append({"estrategia": nombre, "pasada": "carga", "segundos": seg,
+                               "filas_s": n_filas / seg, **conteo})
+
+            for f in random.sample(filas, max(1, n_filas // 10)):
+                f["magna"] = round(f["magna"] + 0.1, 2)
+            conteo, seg = _cronometrar(lambda: repo.upsert(filas, estrategia, tam))
+            resultados.append({"estrategia": nombre, "pasada": "re-upsert", "segundos": seg,
+                               "filas_s": n_filas / seg, **conteo})
+    finally:
+        tabla.drop(repo.engine, checkfirst=True)
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Filas/seg de cada estrategia de upsert masivo.")
+    parser.add_argument("--filas", type=int, default=20_000, help="filas por corrida (default 20000)")
+    parser.add_argument("--lote", type=int, default=LOTE_UPSERT,
+                        help=f"filas por INSERT en la estrategia 'lotes' (default {LOTE_UPSERT})")
+    args = parser.parse_args()
+
+    print(f"{'estrategia':<10} {'pasada':<10} {'seg':>8} {'filas/s':>10} "
+          f"{'insert':>8} {'update':>8} {'igual':>8}")
+    for r in correr(args.filas, args.lote):
+        print(f"{r['estrategia']:<10} {r['pasada']:<10} {r['segundos']:>8.2f} {r['filas_s']:>10.0f} "
+              f"{r['insertados']:>8} {r['actualizados']:>8} {r['sin_cambios']:>8}")
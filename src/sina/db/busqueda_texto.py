@@ -0,0 +1,40 @@
+"""
+Consulta de texto completo para el fallback SQLite (FTS5) de la búsqueda de productos.
+
+En PostgreSQL la columna generada `supermercados.busqueda` usa la configuración
+`sina_es` (unaccent + stemmer español) y la consulta sale de
+`websearch_to_tsquery('sina_es', q)`. FTS5 no trae stemmer español: el
+tokenizer `unicode61 remove_diacritics 2` ya ignora acentos ("azúcar" =
+"azucar") y aquí se aproxima el stemming quitando el plural a cada término y
+buscándolo como prefijo ("tortillas" → "tortilla"* encuentra tortilla y tortillas).
+"""
+from __future__ import annotations
+
+import re
+
+from sina.db.indice_ubicaciones import normalizar_nombre
+
+_TOKEN = re.compile(r"\w+")
+_MIN_RAIZ = 3
+
+
+def raiz_es(token: str) -> str:
+    """Quita el plural español (-es tras consonante, -s) sin dejar raíces de menos de 3 letras."""
+    if len(token) > _MIN_RAIZ + 2 and token.endswith("es") and token[-3] not in "aeiou":
+        return token[:-2]        # limones → limon, frijoles → frijol
+    if len(token) > _MIN_RAIZ + 1 and token.endswith("s"):
+        return token[:-1]        # tortillas → tortilla, galletas → galleta
+    return token
+
+
+def consulta_fts5(q: str) -> str | None:
+    """
+    Expresión MATCH de FTS5 para `q`: todos los términos (AND), cada uno como
+    prefijo de su raíz. Los términos van entre comillas, así que la sintaxis de
+    FTS5 (AND/OR/NEAR, `-`, `:`) que escriba el usuario no se interpreta.
+    None si `q` no tiene ningún término.
+    """
+    terminos = _TOKEN.findall(normalizar_nombre(q))
+    if not terminos:
+        return None
+    return " AND ".join(f'"{raiz_es(t)}"*' for t in terminos)
@@ -0,0 +1,484 @@
+"""
+Caché compartida entre workers (L2) y difusión de invalidaciones.
+
+Con varios workers de uvicorn cada uno calentaba su propia copia de todo lo que
+vive en memoria (health, caché de respuestas, índices), repetía los refrescos
+contra CRE/CNE que ya había lanzado otro worker y aplicaba su propio rate limit.
+Este módulo pone un nivel compartido DETRÁS de esas cachés en memoria (L1), sin
+servicios externos:
+
+  - PostgreSQL: tabla `UNLOGGED` `cache_compartida` en la misma DB (sin WAL:
+    escrituras baratas; si PG se cae se vacía, que para una caché da igual).
+  - SQLite (dev): un archivo aparte junto a la DB (`sina_cache.db`), para que el
+    tráfico de la caché no compita por el candado de escritura con los scrapers.
+
+Cada entrada es `clave → (valor bytes | contador, expira epoch)`: sirve para
+valores con TTL (`obtener`/`guardar`), reservas atómicas "solo si no existe"
+(`reservar`, dedupe de refrescos) y contadores con ventana (`incrementar`, rate
+limit). Las invalidaciones se difunden por canal (`publicar_invalidacion` →
+handlers de `suscribir` en los DEMÁS workers): LISTEN/NOTIFY en PostgreSQL y,
+sin él, una tabla de mensajes que cada worker sondea cada
+CACHE_COMPARTIDA_SONDEO_S segundos.
+
+CACHE_COMPARTIDA=memoria deja todo en el proceso (un solo worker, pruebas).
+Los usos de la L2 degradan a "solo L1" si falla: es una caché, no una fuente.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import select
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+log = logging.getLogger(__name__)
+
+CACHE_COMPARTIDA = os.getenv("CACHE_COMPARTIDA", "db").strip().lower()   # db | memoria
+CACHE_COMPARTIDA_URL = os.getenv("CACHE_COMPARTIDA_URL", "")
+CACHE_COMPARTIDA_SONDEO_S = float(os.getenv("CACHE_COMPARTIDA_SONDEO_S", "2"))
+
+CANAL_NOTIFY = "sina_cache"
+_PURGA_CADA_S = 300
+# NOTIFY admite 8000 bytes de payload; con más claves se invalida el canal entero.
+_MAX_CLAVES_MENSAJE = 200
+
+# Identifica a este proceso: un worker ignora sus propios mensajes.
+ORIGEN = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class AlmacenMemoria:
+    """L2 dentro del proceso (mismo contrato que `AlmacenSQL`); no difunde nada."""
+
+    def __init__(self, reloj: Callable[[], float] = time.time) -> None:
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self._datos: dict[str, tuple[bytes | None, int, float]] = {}
+
+    def _viva(self, clave: str, ahora: float) -> tuple[bytes | None, int, float] | None:
+        fila = self._datos.get(clave)
+        if fila is not None and fila[2] <= ahora:
+            del self._datos[clave]
+            fila = None
+        return fila
+
+    def obtener(self, clave: str) -> tuple[bytes, float] | None:
+        with self._lock:
+            fila = self._viva(clave, self._reloj())
+            return None if fila is None or fila[0] is None else (fila[0], fila[2])
+
+    def guardar(self, clave: str, valor: bytes, ttl_s: float) -> None:
+        with self._lock:
+            self._datos[clave] = (valor, 0, self._reloj() + ttl_s)
+
+    def reservar(self, clave: str, ttl_s: float) -> bool:
+        with self._lock:
+            ahora = self._reloj()
+            if self._viva(clave, ahora) is not None:
+                return False
+            self._datos[clave] = (None, 0, ahora + ttl_s)
+            return True
+
+    def incrementar(self, clave: str, ttl_s: float, cantidad: int = 1) -> tuple[int, float]:
+        with self._lock:
+            ahora = self._reloj()
+            fila = self._viva(clave, ahora)
+            contador, expira = (fila[1], fila[2]) if fila else (0, ahora + ttl_s)
+            self._datos[clave] = (None, contador + cantidad, expira)
+            return contador + cantidad, expira
+
+    def contador(self, clave: str) -> tuple[int, float]:
+        with self._lock:
+            ahora = self._reloj()
+            fila = self._viva(clave, ahora)
+            return (fila[1], fila[2]) if fila else (0, ahora)
+
+    def borrar(self, claves: Iterable[str]) -> None:
+        with self._lock:
+            for clave in claves:
+                self._datos.pop(clave, None)
+
+    def borrar_prefijo(self, prefijo: str) -> None:
+        with self._lock:
+            for clave in [c for c in self._datos if c.startswith(prefijo)]:
+                del self._datos[clave]
+
+    def publicar(self, mensaje: dict) -> None:
+        """Un solo proceso: no hay otros workers a quienes avisar."""
+
+    def escuchar(self, entregar: Callable[[dict], None], parar: threading.Event) -> None:
+        parar.wait()
+
+
+class AlmacenSQL:
+    """
+    L2 en una tabla SQL (`UNLOGGED` en PostgreSQL). Perezoso: el engine y las
+    tablas se preparan en el primer uso, no al importar.
+    """
+
+    _TIPOS = {
+        "postgresql": ("CREATE UNLOGGED TABLE", "BYTEA", "DOUBLE PRECISION", "BIGSERIAL PRIMARY KEY"),
+        "sqlite":     ("CREATE TABLE", "BLOB", "REAL", "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    }
+
+    def __init__(self, url: str = "") -> None:
+        self._url = url
+        self._engine = None
+        self._lock = threading.Lock()
+        self._proxima_purga = time.monotonic() + _PURGA_CADA_S
+
+    # ── Preparación ──
+    def _motor(self):
+        if self._engine is not None:
+            return self._engine
+        with self._lock:
+            if self._engine is None:
+                self._engine = self._preparar(self._crear_engine())
+        return self._engine
+
+    def _crear_engine(self):
+        from sqlalchemy import create_engine, event  # noqa: PLC0415
+        from sqlalchemy.engine import make_url  # noqa: PLC0415
+
+        url = self._url
+        if not url:
+            from sina.db.repository import _engine  # noqa: PLC0415
+            if _engine.dialect.name == "postgresql":
+                return _engine    # misma DB y mismo pool: la tabla es UNLOGGED
+            # SQLite: archivo propio junto a la DB principal.
+            db = Path(make_url(str(_engine.url)).database or "sina_data.db")
+            url = f"sqlite:///{db.with_name('sina_cache.db')}"
+
+        if not url.startswith("sqlite"):
+            return create_engine(url, pool_pre_ping=True, pool_size=2, max_overflow=2)
+        engine = create_engine(url, connect_args={"timeout": 2, "check_same_thread": False})
+
+        @event.listens_for(engine, "connect")
+        def _pragmas(dbapi_conn, _):
+            cur = dbapi_conn.cursor()
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=OFF")     # es una caché: perderla no importa
+            cur.execute("PRAGMA busy_timeout=2000")
+            cur.close()
+
+        return engine
+
+    def _preparar(self, engine):
+        from sqlalchemy import text  # noqa: PLC0415
+        from sqlalchemy.exc import IntegrityError, ProgrammingError  # noqa: PLC0415
+
+        crear, binario, real, serial = self._TIPOS[engine.dialect.name]
+        ddl = [
+            f"{crear} IF NOT EXISTS cache_compartida (clave TEXT PRIMARY KEY, valor {binario}, "
+            f"contador BIGINT NOT NULL DEFAULT 0, expira {real} NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS ix_cache_compartida_expira ON cache_compartida (expira)",
+            f"{crear} IF NOT EXISTS cache_invalidaciones (id {serial}, origen TEXT NOT NULL, "
+            f"mensaje TEXT NOT NULL, creado {real} NOT NULL)",
+        ]
+        try:
+            with engine.begin() as conn:
+                for sentencia in ddl:
+                    conn.execute(text(sentencia))
+        except (IntegrityError, ProgrammingError):
+            # Dos workers creando la tabla a la vez en PG: la ganó el otro.
+            log.debug("Tablas de caché compartida creadas por otro worker")
+        return engine
+
+    def _usa_notify(self, engine) -> bool:
+        return engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+
+    def _ejecutar(self, sql: str, params: dict | None = None, expandir: tuple[str, ...] = ()):
+        from sqlalchemy import bindparam, text  # noqa: PLC0415
+
+        sentencia = text(sql)
+        if expandir:
+            sentencia = sentencia.bindparams(*(bindparam(n, expanding=True) for n in expandir))
+        with self._motor().begin() as conn:
+            resultado = conn.execute(sentencia, params or {})
+            return resultado.fetchall() if resultado.returns_rows else []
+
+    # ── Valores con TTL ──
+    def obtener(self, clave: str) -> tuple[bytes, float] | None:
+        filas = self._ejecutar(
+            "SELECT valor, expira FROM cache_compartida "
+            "WHERE clave = :clave AND expira > :ahora AND valor IS NOT NULL",
+            {"clave": clave, "ahora": time.time()},
+        )
+        return (bytes(filas[0][0]), filas[0][1]) if filas else None
+
+    def guardar(self, clave: str, valor: bytes, ttl_s: float) -> None:
+        self._ejecutar(
+            "INSERT INTO cache_compartida (clave, valor, contador, expira) "
+            "VALUES (:clave, :valor, 0, :expira) "
+            "ON CONFLICT (clave) DO UPDATE SET valor = excluded.valor, contador = 0, "
+            "expira = excluded.expira",
+            {"clave": clave, "valor": valor, "expira": time.time() + ttl_s},
+        )
+
+    def reservar(self, clave: str, ttl_s: float) -> bool:
+        """Crea la clave solo si no existe (o venció): True si la reserva es nuestra."""
+        ahora = time.time()
+        return bool(self._ejecutar(
+            "INSERT INTO cache_compartida (clave, valor, contador, expira) "
+            "VALUES (:clave, NULL, 0, :expira) "
+            "ON CONFLICT (clave) DO UPDATE SET valor = NULL, contador = 0, expira = excluded.expira "
+            "WHERE cache_compartida.expira <= :ahora "
+            "RETURNING clave",
+            {"clave": clave, "expira": ahora + ttl_s, "ahora": ahora},
+        ))
+
+    # ── Contadores con ventana (rate limit) ──
+    def incrementar(self, clave: str, ttl_s: float, cantidad: int = 1) -> tuple[int, float]:
+        """Suma `cantidad` en la ventana vigente (o abre una de `ttl_s`): (valor, expira)."""
+        ahora = time.time()
+        fila = self._ejecutar(
+            "INSERT INTO cache_compartida (clave, valor, contador, expira) "
+            "VALUES (:clave, NULL, :n, :expira) "
+            "ON CONFLICT (clave) DO UPDATE SET "
+            "contador = CASE WHEN cache_compartida.expira <= :ahora THEN :n "
+            "ELSE cache_compartida.contador + :n END, "
+            "expira = CASE WHEN cache_compartida.expira <= :ahora THEN excluded.expira "
+            "ELSE cache_compartida.expira END "
+            "RETURNING contador, expira",
+            {"clave": clave, "n": cantidad, "expira": ahora + ttl_s, "ahora": ahora},
+        )[0]
+        return int(fila[0]), float(fila[1])
+
+    def contador(self, clave: str) -> tuple[int, float]:
+        ahora = time.time()
+        filas = self._ejecutar(
+            "SELECT contador, expira FROM cache_compartida WHERE clave = :clave AND expira > :ahora",
+            {"clave": clave, "ahora": ahora},
+        )
+        return (int(filas[0][0]), float(filas[0][1])) if filas else (0, ahora)
+
+    # ── Borrado ──
+    def borrar(self, claves: Iterable[str]) -> None:
+        claves = list(claves)
+        for i in range(0, len(claves), 500):
+            self._ejecutar(
+                "DELETE FROM cache_compartida WHERE clave IN :claves",
+                {"claves": claves[i:i + 500]}, expandir=("claves",),
+            )
+
+    def borrar_prefijo(self, prefijo: str) -> None:
+        self._ejecutar(
+            "DELETE FROM cache_compartida WHERE substr(clave, 1, :n) = :prefijo",
+            {"n": len(prefijo), "prefijo": prefijo},
+        )
+
+    def purgar(self) -> None:
+        ahora = time.time()
+        self._ejecutar("DELETE FROM cache_compartida WHERE expira <= :ahora", {"ahora": ahora})
+        self._ejecutar("DELETE FROM cache_invalidaciones WHERE creado < :limite",
+                       {"limite": ahora - _PURGA_CADA_S})
+
+    # ── Difusión ──
+    def publicar(self, mensaje: dict) -> None:
+        payload = json.dumps(mensaje, ensure_ascii=False)
+        if self._usa_notify(self._motor()):
+            self._ejecutar("SELECT pg_notify(:canal, :payload)", {"canal": CANAL_NOTIFY, "payload": payload})
+        else:
+            self._ejecutar(
+                "INSERT INTO cache_invalidaciones (origen, mensaje, creado) VALUES (:origen, :mensaje, :ahora)",
+                {"origen": mensaje.get("origen", ORIGEN), "mensaje": payload, "ahora": time.time()},
+            )
+
+    def escuchar(self, entregar: Callable[[dict], None], parar: threading.Event) -> None:
+        """Bucle del hilo receptor: entrega cada mensaje y purga vencidas de vez en cuando."""
+        while not parar.is_set():
+            try:
+                if self._usa_notify(self._motor()):
+                    self._escuchar_notify(entregar, parar)
+                else:
+                    self._sondear(entregar, parar)
+            except Exception:  # noqa: BLE001
+                log.warning("Receptor de invalidaciones caído; reintento en 5 s", exc_info=True)
+                parar.wait(5)
+
+    def _mantenimiento(self) -> None:
+        if time.monotonic() < self._proxima_purga:
+            return
+        self._proxima_purga = time.monotonic() + _PURGA_CADA_S
+        try:
+            self.purgar()
+        except Exception:  # noqa: BLE001
+            log.warning("No se pudo purgar la caché compartida", exc_info=True)
+
+    def _escuchar_notify(self, entregar, parar: threading.Event) -> None:
+        """LISTEN en una conexión dedicada (fuera del pool, la sostiene el hilo receptor)."""
+        crudo = self._motor().raw_connection()
+        conexion = crudo.driver_connection
+        crudo.detach()
+        try:
+            conexion.autocommit = True
+            conexion.cursor().execute(f"LISTEN {CANAL_NOTIFY}")
+            while not parar.is_set():
+                if select.select([conexion], [], [], 1.0)[0]:
+                    conexion.poll()
+                    while conexion.notifies:
+                        entregar(json.loads(conexion.notifies.pop(0).payload))
+                self._mantenimiento()
+        finally:
+            crudo.close()
+
+    def _sondear(self, entregar, parar: threading.Event) -> None:
+        """
+        Sin NOTIFY: lee los mensajes nuevos de `cache_invalidaciones` por id (en
+        SQLite las escrituras son seriales, así que los ids se confirman en orden).
+        """
+        ultimo = self._ejecutar("SELECT coalesce(max(id), 0) FROM cache_invalidaciones")[0][0]
+        while not parar.wait(CACHE_COMPARTIDA_SONDEO_S):
+            for id_, mensaje in self._ejecutar(
+                "SELECT id, mensaje FROM cache_invalidaciones "
+                "WHERE id > :ultimo AND origen <> :origen ORDER BY id",
+                {"ultimo": ultimo, "origen": ORIGEN},
+            ):
+                ultimo = id_
+                entregar(json.loads(mensaje))
+            self._mantenimiento()
+
+
+# ── Singleton + difusión ──
+_almacen: AlmacenMemoria | AlmacenSQL | None = None
+_handlers: dict[str, list[Callable[[list[str] | None], None]]] = {}
+_parar = threading.Event()
+_receptor: threading.Thread | None = None
+
+
+def get_almacen_compartido() -> AlmacenMemoria | AlmacenSQL:
+    """L2 según CACHE_COMPARTIDA (barato: el backend SQL se conecta en su primer uso)."""
+    global _almacen
+    if _almacen is None:
+        _almacen = AlmacenMemoria() if CACHE_COMPARTIDA == "memoria" else AlmacenSQL(CACHE_COMPARTIDA_URL)
+    return _almacen
+
+
+def suscribir(canal: str, handler: Callable[[list[str] | None], None]) -> None:
+    """`handler(claves)` corre cuando OTRO worker invalida `canal` (None = todo el canal)."""
+    _handlers.setdefault(canal, []).append(handler)
+
+
+def _entregar(mensaje: dict) -> None:
+    if mensaje.get("origen") == ORIGEN:
+        return
+    for handler in _handlers.get(mensaje.get("canal", ""), ()):
+        try:
+            handler(mensaje.get("claves"))
+        except Exception:  # noqa: BLE001
+            log.exception("Error aplicando invalidación de %s", mensaje.get("canal"))
+
+
+def publicar_invalidacion(canal: str, claves: Iterable[str] | None = None) -> None:
+    """
+    Avisa a los demás workers que `claves` de `canal` (o todo el canal, con None)
+    ya no valen. El worker que publica invalida su propia L1 por su cuenta.
+    """
+    claves = None if claves is None else list(claves)
+    if claves is not None and not claves:
+        return
+    if claves is not None and len(claves) > _MAX_CLAVES_MENSAJE:
+        claves = None
+    try:
+        get_almacen_compartido().publicar({"origen": ORIGEN, "canal": canal, "claves": claves})
+    except Exception:  # noqa: BLE001
+        log.warning("No se pudo difundir la invalidación de %s", canal, exc_info=True)
+
+
+def iniciar_difusion() -> None:
+    """Arranca el hilo receptor de invalidaciones (lifespan de la app)."""
+    global _receptor
+    if _receptor is not None and _receptor.is_alive():
+        return
+    _parar.clear()
+    _receptor = threading.Thread(
+        target=get_almacen_compartido().escuchar, args=(_entregar, _parar),
+        name="cache-compartida", daemon=True,
+    )
+    _receptor.start()
+
+
+def detener_difusion() -> None:
+    _parar.set()
+
+
+# ── Valores calculados con L1 + L2 ──
+_l1: dict[str, tuple[float, Any]] = {}
+_l1_lock = threading.Lock()
+# Cuánto espera un worker a que otro termine el cálculo antes de hacerlo él
+# mismo (también es el TTL de la reserva: si el que calcula muere, vence sola).
+_ESPERA_CALCULO_S = 5.0
+_SONDEO_CALCULO_S = 0.05
+_dormir: Callable[[float], None] = time.sleep
+
+
+def obtener_o_calcular(clave: str, ttl_s: float, calcular: Callable[[], Any]) -> Any:
+    """
+    Valor JSON-serializable con TTL en dos niveles: memoria del proceso → caché
+    compartida → `calcular()`. Tras vencer el TTL, el worker que gana la reserva
+    `calculando:<clave>` recalcula; los demás sondean la L2 hasta
+    _ESPERA_CALCULO_S y, si no llega, calculan ellos (degradado, no bloqueado).
+    El valor siempre sale tal como queda tras JSON (fechas en ISO), venga de
+    `calcular()`, de la L1 o de la L2.
+    """
+    ahora = time.time()
+    with _l1_lock:
+        en_l1 = _l1.get(clave)
+    if en_l1 is not None and en_l1[0] > ahora:
+        return en_l1[1]
+
+    almacen = get_almacen_compartido()
+    en_l2 = _leer_l2(almacen, clave)
+    if en_l2 is None:
+        try:
+            propio = almacen.reservar(f"calculando:{clave}", _ESPERA_CALCULO_S)
+        except Exception:  # noqa: BLE001
+            propio = True
+        limite = time.time() + _ESPERA_CALCULO_S
+        while not propio and en_l2 is None and time.time() < limite:
+            _dormir(_SONDEO_CALCULO_S)
+            en_l2 = _leer_l2(almacen, clave)
+        if en_l2 is None:
+            en_l2 = _calcular_y_publicar(almacen, clave, ttl_s, calcular, propio)
+
+    valor, expira = json.loads(en_l2[0]), en_l2[1]
+    with _l1_lock:
+        _l1[clave] = (expira, valor)
+    return valor
+
+
+def _leer_l2(almacen: AlmacenMemoria | AlmacenSQL, clave: str) -> tuple[bytes, float] | None:
+    try:
+        return almacen.obtener(f"valor:{clave}")
+    except Exception:  # noqa: BLE001
+        log.warning("Caché compartida no disponible para %s", clave, exc_info=True)
+        return None
+
+
+def _calcular_y_publicar(almacen: AlmacenMemoria | AlmacenSQL, clave: str, ttl_s: float,
+                         calcular: Callable[[], Any], reservado: bool) -> tuple[bytes, float]:
+    """Calcula, guarda en la L2 y libera la reserva (si era nuestra)."""
+    try:
+        datos = json.dumps(calcular(), default=_a_json).encode()
+        try:
+            almacen.guardar(f"valor:{clave}", datos, ttl_s)
+        except Exception:  # noqa: BLE001
+            log.warning("No se pudo guardar %s en la caché compartida", clave, exc_info=True)
+        return datos, time.time() + ttl_s
+    finally:
+        if reservado:
+            try:
+                almacen.borrar([f"calculando:{clave}"])
+            except Exception:  # noqa: BLE001
+                log.warning("No se pudo liberar la reserva de %s (vence sola)", clave, exc_info=True)
+
+
+def _a_json(valor: Any) -> Any:
+    """Fechas en ISO 8601 (como las serializa FastAPI)."""
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()
+    return str(valor)
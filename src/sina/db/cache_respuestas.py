@@ -0,0 +1,238 @@
+"""
+Caché en memoria de respuestas por ubicación (JSON ya serializado).
+
+Cada vista del dashboard volvía a leer la DB y a serializar el mismo payload,
+aunque el resultado de un municipio no cambia en 24 h (gasolina) ni el de una
+localidad hasta el sábado siguiente (gas LP). Aquí se guardan los BYTES de la
+respuesta (más su ETag/Last-Modified) por ubicación, así que un acierto no toca
+la DB ni vuelve a codificar JSON:
+
+  - la clave es la misma de `verificaciones_fuente`: `gasolina:estado/municipio`
+    o `gas_lp:entidad/municipio/localidad` (`clave_respuesta`);
+  - cada entrada vence EXACTAMENTE al perder vigencia sus datos
+    (`gasolina_vigente_hasta` / `gas_lp_vigente_hasta`), nunca sirve datos vencidos;
+  - los upserts y las verificaciones de esa ubicación la invalidan.
+
+Solo se guardan respuestas de caché vigente (`fuente == "cache"`): las vencidas
+siguen pasando por el refresco. LRU acotada por CACHE_RESPUESTAS_MAX (0 la apaga).
+
+Detrás de la LRU de cada worker va la caché compartida (`cache_compartida`): lo
+que serializa un worker lo reutilizan los demás, y una invalidación borra la
+entrada compartida y se difunde a las LRU de los otros workers.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable
+
+from sina.db.cache_compartida import (
+    AlmacenMemoria, AlmacenSQL, get_almacen_compartido, publicar_invalidacion, suscribir,
+)
+
+log = logging.getLogger(__name__)
+
+CACHE_RESPUESTAS_MAX = int(os.getenv("CACHE_RESPUESTAS_MAX", "4096"))
+
+
+def clave_respuesta(fuente: str, clave: str) -> str:
+    """Misma clave que `verificaciones_fuente` (fuente + ubicación), con prefijo de fuente."""
+    return f"{fuente}:{clave}"
+
+
+@dataclass(frozen=True)
+class EntradaRespuesta:
+    cuerpo: bytes
+    cabeceras: dict[str, str]
+    ultima: datetime | None      # para If-Modified-Since
+    expira: float                # epoch (time.time())
+
+    def a_bytes(self) -> bytes:
+        """Cabecera JSON + salto de línea + cuerpo tal cual (formato en la caché compartida)."""
+        meta = {"cabeceras": self.cabeceras, "ultima": self.ultima.isoformat() if self.ultima else None}
+        return json.dumps(meta).encode() + b"\n" + self.cuerpo
+
+    @classmethod
+    def de_bytes(cls, datos: bytes, expira: float) -> EntradaRespuesta:
+        meta, cuerpo = datos.split(b"\n", 1)
+        meta = json.loads(meta)
+        ultima = datetime.fromisoformat(meta["ultima"]) if meta["ultima"] else None
+        return cls(cuerpo, meta["cabeceras"], ultima, expira)
+
+
+class CacheRespuestas:
+    """
+    LRU thread-safe {clave: EntradaRespuesta} con vencimiento absoluto por entrada;
+    con `compartido`, los fallos de la LRU se buscan ahí y lo guardado se copia ahí.
+
+    Cada invalidación sube la generación de su clave (`limpiar`, la de todas):
+    quien toma `generacion(clave)` antes de leer la DB y la pasa a `guardar` no
+    deja en caché una respuesta que una invalidación ya dejó vieja a medio camino.
+    """
+
+    def __init__(
+        self,
+        capacidad: int = 4096,
+        reloj: Callable[[], float] = time.time,
+        compartido: AlmacenMemoria | AlmacenSQL | None = None,
+    ) -> None:
+        self.capacidad = capacidad
+        self._reloj = reloj
+        self._compartido = compartido
+        self._lock = threading.Lock()
+        self._datos: OrderedDict[str, EntradaRespuesta] = OrderedDict()
+        # Acotado por el número de ubicaciones (solo crece con claves invalidadas).
+        self._generaciones: dict[str, int] = {}
+        self._epoca = 0
+        self._aciertos = 0
+        self._aciertos_compartida = 0
+        self._fallos = 0
+
+    @property
+    def habilitada(self) -> bool:
+        return self.capacidad > 0
+
+    def obtener(self, clave: str) -> EntradaRespuesta | None:
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and entrada.expira <= self._reloj():
+                del self._datos[clave]
+                entrada = None
+            if entrada is not None:
+                self._datos.move_to_end(clave)
+                self._aciertos += 1
+                return entrada
+
+        entrada = self._de_compartida(clave)
+        with self._lock:
+            if entrada is None:
+                self._fallos += 1
+                return None
+            self._aciertos_compartida += 1
+            self._meter(clave, entrada)
+            return entrada
+
+    def _de_compartida(self, clave: str) -> EntradaRespuesta | None:
+        if self._compartido is None or not self.habilitada:
+            return None
+        try:
+            encontrada = self._compartido.obtener(f"respuesta:{clave}")
+        except Exception:  # noqa: BLE001
+            log.warning("Caché compartida no disponible (respuestas)", exc_info=True)
+            return None
+        return EntradaRespuesta.de_bytes(*encontrada) if encontrada else None
+
+    def _meter(self, clave: str, entrada: EntradaRespuesta) -> None:
+        """Inserta en la LRU (con el lock tomado) y desaloja lo más viejo."""
+        self._datos[clave] = entrada
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.capacidad:
+            self._datos.popitem(last=False)
+
+    def generacion(self, clave: str) -> tuple[int, int]:
+        """Marca de invalidaciones de `clave`; cambia con cada `invalidar`/`limpiar` que la toca."""
+        with self._lock:
+            return self._epoca, self._generaciones.get(clave, 0)
+
+    def guardar(
+        self,
+        clave: str,
+        cuerpo: bytes,
+        cabeceras: dict[str, str],
+        vigente_hasta: datetime | None,
+        ultima: datetime | None = None,
+        generacion: tuple[int, int] | None = None,
+    ) -> bool:
+        """
+        Guarda hasta `vigente_hasta` (aware); sin fecha o ya vencida no se guarda,
+        ni tampoco si la `generacion` tomada antes de cargar ya no es la actual.
+        Devuelve si se guardó.
+        """
+        if not self.habilitada or vigente_hasta is None:
+            return False
+        expira = vigente_hasta.timestamp()
+        ttl_s = expira - self._reloj()
+        if ttl_s <= 0:
+            return False
+        entrada = EntradaRespuesta(cuerpo, dict(cabeceras), ultima, expira)
+        with self._lock:
+            if generacion is not None and generacion != (self._epoca, self._generaciones.get(clave, 0)):
+                return False
+            self._meter(clave, entrada)
+        if self._compartido is not None:
+            try:
+                self._compartido.guardar(f"respuesta:{clave}", entrada.a_bytes(), ttl_s)
+            except Exception:  # noqa: BLE001
+                log.warning("No se pudo guardar en la caché compartida (respuestas)", exc_info=True)
+        return True
+
+    def invalidar(self, claves: Iterable[str], compartida: bool = True) -> int:
+        """
+        Borra las claves dadas de la LRU (y de la caché compartida, salvo
+        `compartida=False`); devuelve cuántas había en la LRU.
+        """
+        claves = list(claves)
+        with self._lock:
+            borradas = sum(self._datos.pop(c, None) is not None for c in claves)
+            for c in claves:
+                self._generaciones[c] = self._generaciones.get(c, 0) + 1
+        if compartida and self._compartido is not None:
+            try:
+                self._compartido.borrar(f"respuesta:{c}" for c in claves)
+            except Exception:  # noqa: BLE001
+                log.warning("No se pudo invalidar la caché compartida (respuestas)", exc_info=True)
+        return borradas
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+            self._epoca += 1
+
+    def resumen(self) -> dict:
+        with self._lock:
+            total = self._aciertos + self._aciertos_compartida + self._fallos
+            return {
+                "entradas":     len(self._datos),
+                "capacidad":    self.capacidad,
+                "aciertos":     self._aciertos,
+                "aciertos_compartida": self._aciertos_compartida,
+                "fallos":       self._fallos,
+                "tasa_acierto": round((total - self._fallos) / total, 3) if total else None,
+            }
+
+
+# ── Singleton (una LRU por proceso, sobre la caché compartida) ──
+_cache = CacheRespuestas(CACHE_RESPUESTAS_MAX, compartido=get_almacen_compartido())
+
+
+def get_cache_respuestas() -> CacheRespuestas:
+    return _cache
+
+
+def invalidar_respuestas(fuente: str, claves: Iterable[str]) -> None:
+    """
+    Invalida las respuestas de esas ubicaciones (claves de `verificaciones_fuente`)
+    aquí, en la caché compartida y en las LRU de los demás workers.
+    """
+    if not _cache.habilitada:
+        return
+    claves = [clave_respuesta(fuente, c) for c in claves]
+    if claves:
+        _cache.invalidar(claves)
+        publicar_invalidacion("respuestas", claves)
+
+
+def _invalidar_desde_otro_worker(claves: list[str] | None) -> None:
+    if claves is None:
+        _cache.limpiar()
+    else:
+        _cache.invalidar(claves, compartida=False)
+
+
+suscribir("respuestas", _invalidar_desde_otro_worker)
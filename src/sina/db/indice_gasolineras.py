@@ -0,0 +1,257 @@
+"""
+Índice espacial en memoria de gasolineras (rejilla de celdas lat/lng).
+
+"Cerca de mí" solo podía ordenar las gasolineras de UN municipio (índice
+`(estado, municipio)`), así que una estación a 500 m pero cruzando el límite
+municipal no aparecía. Aquí todas las estaciones con coordenadas y algún precio
+se reparten en celdas de `celda_grados` (0.05° ≈ 5.5 km); una consulta de k
+vecinos recorre anillos de celdas alrededor del punto y se detiene en cuanto el
+anillo ya no puede contener nada más cerca que el k-ésimo encontrado. Son unas
+cuantas celdas por consulta, sin ir a la DB, sin importar el municipio.
+
+El mismo índice es un geocodificador inverso offline: el municipio de un punto
+es el que domina entre sus gasolineras más cercanas (`municipio_en`), y
+`geocodificar_inverso` lo resuelve a IDs con el índice de ubicaciones.
+
+Se marca como obsoleto cuando `upsert_ubicaciones`/`upsert_precios` cambian
+algo (`invalidar_indice_gasolineras()`) y se reconstruye, una query, en la
+siguiente consulta. Cada worker tiene su copia: la invalidación se difunde a los
+demás (`cache_compartida`) y, por si se pierde un aviso, el índice también se
+reconstruye cuando tiene más de GASOLINERAS_INDICE_TTL_S segundos.
+"""
+from __future__ import annotations
+
+import heapq
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Iterable
+
+from sina.config.geo import KM_POR_GRADO, haversine_km
+from sina.db.cache_compartida import publicar_invalidacion, suscribir
+
+log = logging.getLogger(__name__)
+
+GASOLINERAS_INDICE_TTL_S = float(os.getenv("GASOLINERAS_INDICE_TTL_S", "900"))
+
+# Sinónimos de tipo de combustible → columna de `gasolineras`.
+COLUMNA_POR_TIPO = {
+    "regular": "magna", "magna": "magna", "verde": "magna",
+    "premium": "premium", "roja": "premium",
+    "diesel": "diesel", "diésel": "diesel",
+}
+
+
+@dataclass(frozen=True)
+class EstacionRef:
+    """Gasolinera indexada (mismas columnas que `PrecioGasolina`)."""
+    numero: str
+    estado: str
+    municipio: str
+    nombre: str | None
+    direccion: str | None
+    latitud: float
+    longitud: float
+    magna: float | None
+    premium: float | None
+    diesel: float | None
+    fecha_registro: datetime | None = None
+
+
+class IndiceGasolineras:
+    """
+    Rejilla {(fila, columna): [EstacionRef]} con celdas de `celda_grados`.
+
+    `estaciones`: filas con los campos de `EstacionRef` en ese orden; las que no
+    tienen coordenadas o no tienen ningún precio se descartan.
+    """
+
+    def __init__(self, estaciones: Iterable[tuple], celda_grados: float = 0.05) -> None:
+        self.celda = celda_grados
+        self._celdas: dict[tuple[int, int], list[EstacionRef]] = {}
+        self.total = 0
+        for fila in estaciones:
+            ref = EstacionRef(*fila)
+            if ref.latitud is None or ref.longitud is None:
+                continue
+            if ref.magna is None and ref.premium is None and ref.diesel is None:
+                continue
+            self._celdas.setdefault(self._celda_de(ref.latitud, ref.longitud), []).append(ref)
+            self.total += 1
+        if self._celdas:
+            filas = [f for f, _ in self._celdas]
+            columnas = [c for _, c in self._celdas]
+            self._limites = (min(filas), max(filas), min(columnas), max(columnas))
+        else:
+            self._limites = (0, -1, 0, -1)
+
+    def _celda_de(self, lat: float, lng: float) -> tuple[int, int]:
+        return math.floor(lat / self.celda), math.floor(lng / self.celda)
+
+    def _anillo(self, fila: int, columna: int, r: int) -> Iterable[EstacionRef]:
+        """Estaciones de las celdas a distancia (Chebyshev) exactamente `r` de la celda dada."""
+        if r == 0:
+            yield from self._celdas.get((fila, columna), ())
+            return
+        for dc in range(-r, r + 1):
+            yield from self._celdas.get((fila - r, columna + dc), ())
+            yield from self._celdas.get((fila + r, columna + dc), ())
+        for df in range(-r + 1, r):
+            yield from self._celdas.get((fila + df, columna - r), ())
+            yield from self._celdas.get((fila + df, columna + r), ())
+
+    def _anillos_hasta_cubrir(self, fila: int, columna: int) -> int:
+        """Anillo a partir del cual ya no queda ninguna celda ocupada por recorrer."""
+        f_min, f_max, c_min, c_max = self._limites
+        return max(abs(fila - f_min), abs(fila - f_max), abs(columna - c_min), abs(columna - c_max))
+
+    def _km_cubiertos(self, lat: float, r: int) -> float:
+        """
+        Tras recorrer los anillos 0..r, nada fuera de ellos está a menos de esta
+        distancia del punto (conservador: la celda del punto cuenta como 0 y la
+        longitud se encoge con el coseno de la latitud más alejada del ecuador).
+        """
+        grados = r * self.celda
+        lat_extrema = min(abs(lat) + grados, 89.9)
+        return grados * KM_POR_GRADO * math.cos(math.radians(lat_extrema))
+
+    def cercanas(
+        self,
+        lat: float,
+        lng: float,
+        k: int = 5,
+        radio_km: float | None = None,
+        columna: str | None = None,
+        ordenar_por: str = "distancia",
+    ) -> list[dict]:
+        """
+        Hasta `k` gasolineras alrededor de (lat, lng) como dicts con
+        `distancia_km` (y `precio` si se pidió `columna`). Por distancia son
+        los k vecinos más cercanos (dentro de `radio_km` si viene); por
+        precio, las k más baratas dentro de `radio_km` (obligatorio), empate
+        por distancia. Con `columna` solo cuentan las que tienen ese precio.
+        """
+        por_precio = ordenar_por == "precio"
+        if por_precio and not radio_km:
+            raise ValueError("ordenar por precio requiere radio_km")
+        if k <= 0 or not self._celdas:
+            return []
+
+        fila, columna_celda = self._celda_de(lat, lng)
+        ultimo = self._anillos_hasta_cubrir(fila, columna_celda)
+        # Max-heap de los k mejores: (-clave, desempate, distancia, ref).
+        mejores: list[tuple] = []
+        dentro: list[tuple[float, float, EstacionRef]] = []
+        r = 0
+        while r <= ultimo:
+            for ref in self._anillo(fila, columna_celda, r):
+                precio = getattr(ref, columna) if columna else None
+                if columna and precio is None:
+                    continue
+                distancia = haversine_km(lat, lng, ref.latitud, ref.longitud)
+                if radio_km and distancia > radio_km:
+                    continue
+                if por_precio:
+                    dentro.append((precio, distancia, ref))
+                elif len(mejores) < k:
+                    heapq.heappush(mejores, (-distancia, ref.numero, distancia, ref))
+                elif distancia < mejores[0][2]:
+                    heapq.heapreplace(mejores, (-distancia, ref.numero, distancia, ref))
+            cubierto = self._km_cubiertos(lat, r)
+            if radio_km and cubierto >= radio_km:
+                break
+            if not por_precio and len(mejores) == k and cubierto >= mejores[0][2]:
+                break
+            r += 1
+
+        if por_precio:
+            elegidas = [(d, ref) for _, d, ref in sorted(dentro, key=lambda t: (t[0], t[1]))[:k]]
+        else:
+            elegidas = sorted(((d, ref) for _, _, d, ref in mejores), key=lambda t: t[0])
+        salida = []
+        for distancia, ref in elegidas:
+            item = asdict(ref)
+            if columna:
+                item["precio"] = getattr(ref, columna)
+            item["distancia_km"] = round(distancia, 2)
+            salida.append(item)
+        return salida
+
+    def municipio_en(self, lat: float, lng: float, k: int = 5, max_km: float = 25.0) -> tuple[str, str] | None:
+        """
+        (estado, municipio) del punto por votación de sus `k` gasolineras más
+        cercanas, pesada por 1/distancia (una estación mal capturada no decide
+        sola). None si la más cercana está a más de `max_km` (fuera de zona).
+        """
+        vecinas = self.cercanas(lat, lng, k=k, radio_km=max_km)
+        if not vecinas:
+            return None
+        votos: dict[tuple[str, str], float] = {}
+        for v in vecinas:
+            clave = (v["estado"], v["municipio"])
+            votos[clave] = votos.get(clave, 0.0) + 1.0 / (v["distancia_km"] + 0.05)
+        return max(votos, key=votos.__getitem__)
+
+
+# ── Singleton perezoso (mismo patrón que `get_indice_ubicaciones`) ──
+_indice: IndiceGasolineras | None = None
+_construido_en = 0.0
+_obsoleto = False
+_lock = threading.Lock()
+
+
+def recargar_indice_gasolineras() -> IndiceGasolineras:
+    """(Re)construye el índice desde la DB: una query, sin ORM."""
+    global _indice, _construido_en, _obsoleto
+    from sina.db.repository import GasolinaRepository  # noqa: PLC0415
+
+    with _lock:
+        _obsoleto = False
+    t0 = time.perf_counter()
+    indice = IndiceGasolineras(GasolinaRepository().filas_indice())
+    with _lock:
+        _indice, _construido_en = indice, time.monotonic()
+    log.info("Índice de gasolineras cargado: %d estaciones en %d celdas (%.0f ms)",
+             indice.total, len(indice._celdas), (time.perf_counter() - t0) * 1000)
+    return indice
+
+
+def invalidar_indice_gasolineras(difundir: bool = True) -> None:
+    """Marca el índice como obsoleto (aquí y en los demás workers): se reconstruye en la siguiente consulta."""
+    global _obsoleto
+    with _lock:
+        _obsoleto = True
+    if difundir:
+        publicar_invalidacion("gasolineras")
+
+
+suscribir("gasolineras", lambda _claves: invalidar_indice_gasolineras(difundir=False))
+
+
+def geocodificar_inverso(lat: float, lng: float) -> tuple[str, str, int, str] | None:
+    """
+    (lat, lng) → (estado, municipio, entidad_id, municipio_id), mismo formato que
+    `IndiceUbicaciones.resolver_municipio`; None si no hay gasolineras cerca.
+    """
+    from sina.db.indice_ubicaciones import get_indice_ubicaciones  # noqa: PLC0415
+
+    encontrado = get_indice_gasolineras().municipio_en(lat, lng)
+    if encontrado is None:
+        return None
+    return get_indice_ubicaciones().resolver_municipio(*encontrado)
+
+
+def get_indice_gasolineras() -> IndiceGasolineras:
+    """Devuelve el índice; lo (re)construye si no existe, se invalidó o venció su TTL."""
+    indice = _indice
+    if indice is None or _obsoleto or time.monotonic() - _construido_en > GASOLINERAS_INDICE_TTL_S:
+        # Sin candado a propósito: al vencer el TTL varios hilos pueden hacer la
+        # query a la vez. `_obsoleto` se limpia ANTES de la query, así que un
+        # cambio que llega a media reconstrucción vuelve a marcarlo; si una
+        # reconstrucción más vieja termina al último, el TTL acota cuánto dura.
+        indice = recargar_indice_gasolineras()
+    return indice
@@ -0,0 +1,188 @@
+"""
+Índice en memoria del catálogo de ubicaciones (estados, municipios, localidades).
+
+Cada request de `/api/v1/gasolina` y `/api/v1/gas-lp` resolvía nombres → IDs con
+dos o tres `ILIKE` contra `cne_entidades`/`cne_municipios`/`cne_localidades`.
+El catálogo es chico y casi inmutable, así que se carga UNA vez (lifespan) en
+diccionarios con clave normalizada (minúsculas, sin acentos, espacios colapsados)
+y la resolución pasa a ser un lookup O(1) sin ir a la DB.
+
+Se recarga al re-sembrar el catálogo (`seeder`) o al insertar localidades nuevas
+(`save_localidades_to_db`) vía `recargar_indice_ubicaciones()`; esos mismos
+puntos avisan a los demás workers (`difundir_cambio_ubicaciones`), que descartan
+su copia y la recargan en la siguiente consulta.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Iterable
+
+from sina.db.cache_compartida import publicar_invalidacion, suscribir
+
+log = logging.getLogger(__name__)
+
+
+def normalizar_nombre(texto: str) -> str:
+    """Clave de búsqueda: minúsculas, sin acentos y con espacios colapsados."""
+    texto = unicodedata.normalize("NFD", texto or "")
+    texto = "".join(c for c in texto if unicodedata.category(c) != "Mn")
+    return " ".join(texto.lower().split())
+
+
+@dataclass(frozen=True)
+class LocalidadRef:
+    """Localidad resuelta (mismos atributos que usa el pipeline de `Localidad`)."""
+    entidad_id: int
+    municipio_id: str
+    localidad_id: int
+    nombre: str
+
+
+class IndiceUbicaciones:
+    """
+    Catálogo indexado por nombre normalizado y por IDs.
+
+    `municipios`: filas (entidad_id, entidad_nombre, municipio_id, municipio_nombre).
+    `localidades`: filas (entidad_id, municipio_id, localidad_id, nombre).
+    Los nombres se conservan tal cual vienen de la DB para mostrarlos/persistirlos.
+    """
+
+    def __init__(
+        self,
+        municipios: Iterable[tuple[int, str, str, str]],
+        localidades: Iterable[tuple[int, str, int, str]] = (),
+    ) -> None:
+        self._entidades: dict[str, int] = {}
+        self._nombre_entidad: dict[int, str] = {}
+        self._municipios: dict[tuple[int, str], str] = {}
+        self._nombre_municipio: dict[tuple[int, str], str] = {}
+        self._localidades: dict[tuple[int, str, str], LocalidadRef] = {}
+        self._localidades_por_id: dict[tuple[int, str, int], LocalidadRef] = {}
+        self._por_municipio: dict[tuple[int, str], list[LocalidadRef]] = {}
+
+        for entidad_id, entidad_nombre, municipio_id, municipio_nombre in municipios:
+            self._entidades.setdefault(normalizar_nombre(entidad_nombre), entidad_id)
+            self._nombre_entidad.setdefault(entidad_id, entidad_nombre)
+            self._municipios.setdefault(
+                (entidad_id, normalizar_nombre(municipio_nombre)), municipio_id
+            )
+            self._nombre_municipio.setdefault((entidad_id, municipio_id), municipio_nombre)
+
+        for entidad_id, municipio_id, localidad_id, nombre in localidades:
+            ref = LocalidadRef(entidad_id, municipio_id, localidad_id, nombre)
+            # Primera coincidencia gana (mismo criterio que el `.first()` del ILIKE).
+            self._localidades.setdefault(
+                (entidad_id, municipio_id, normalizar_nombre(nombre)), ref
+            )
+            self._localidades_por_id.setdefault((entidad_id, municipio_id, localidad_id), ref)
+            self._por_municipio.setdefault((entidad_id, municipio_id), []).append(ref)
+
+        self._nombres_validos: frozenset[str] = frozenset(self._entidades) | frozenset(
+            nombre for _, nombre in self._municipios
+        )
+        self._catalogo: dict[str, list[str]] | None = None
+
+    # ── Resolución por nombre ──────────────────────────────────
+    def es_nombre_valido(self, nombre: str) -> bool:
+        """True si `nombre` es un estado o municipio del catálogo."""
+        return normalizar_nombre(nombre) in self._nombres_validos
+
+    def resolver_municipio(self, estado: str, municipio: str) -> tuple[str, str, int, str] | None:
+        """
+        (estado, municipio, entidad_id, municipio_id) con los nombres canónicos en
+        minúsculas (los que se guardan en `gasolineras`), o None si no existe.
+        """
+        entidad_id = self._entidades.get(normalizar_nombre(estado))
+        if entidad_id is None:
+            return None
+        municipio_id = self._municipios.get((entidad_id, normalizar_nombre(municipio)))
+        if municipio_id is None:
+            return None
+        return (
+            self._nombre_entidad[entidad_id].lower(),
+            self._nombre_municipio[(entidad_id, municipio_id)].lower(),
+            entidad_id,
+            municipio_id,
+        )
+
+    def resolver_localidad(self, estado: str, municipio: str, localidad: str) -> LocalidadRef | None:
+        ubicacion = self.resolver_municipio(estado, municipio)
+        if ubicacion is None:
+            return None
+        _, _, entidad_id, municipio_id = ubicacion
+        return self._localidades.get((entidad_id, municipio_id, normalizar_nombre(localidad)))
+
+    # ── Resolución por IDs ─────────────────────────────────────
+    def localidad_por_ids(self, entidad_id: int, municipio_id: str, localidad_id: int) -> LocalidadRef | None:
+        return self._localidades_por_id.get((entidad_id, municipio_id, localidad_id))
+
+    def localidades_de(self, entidad_id: int, municipio_id: str) -> list[LocalidadRef]:
+        """Localidades de un municipio, orden alfabético (lo que lista la UI)."""
+        return sorted(self._por_municipio.get((entidad_id, municipio_id), []), key=lambda l: l.nombre)
+
+    def nombre_entidad(self, entidad_id: int) -> str | None:
+        return self._nombre_entidad.get(entidad_id)
+
+    def nombre_municipio(self, entidad_id: int, municipio_id: str) -> str | None:
+        return self._nombre_municipio.get((entidad_id, municipio_id))
+
+    def catalogo(self) -> dict[str, list[str]]:
+        """
+        { estado: [municipios] } en minúsculas (mismo formato que `obtener_catalogo`).
+        Se arma una vez por índice: el índice es inmutable y recargarlo crea otro.
+        """
+        if self._catalogo is None:
+            catalogo: dict[str, list[str]] = {}
+            for (entidad_id, _), nombre in self._nombre_municipio.items():
+                catalogo.setdefault(self._nombre_entidad[entidad_id].lower(), []).append(nombre.lower())
+            self._catalogo = {estado: sorted(municipios) for estado, municipios in catalogo.items()}
+        return self._catalogo
+
+
+# ── Singleton perezoso (mismo patrón que `get_embedding_service`) ──
+_indice: IndiceUbicaciones | None = None
+_lock = threading.Lock()
+
+
+def recargar_indice_ubicaciones() -> IndiceUbicaciones:
+    """(Re)construye el índice desde la DB: dos queries, sin ORM."""
+    global _indice
+    from sina.db.repository import LocalidadRepository, MunicipioRepository  # noqa: PLC0415
+
+    indice = IndiceUbicaciones(
+        MunicipioRepository().filas_catalogo(),
+        LocalidadRepository().filas_catalogo(),
+    )
+    with _lock:
+        _indice = indice
+    log.info(
+        "Índice de ubicaciones cargado: %d municipios, %d localidades",
+        len(indice._nombre_municipio), len(indice._localidades_por_id),
+    )
+    return indice
+
+
+def difundir_cambio_ubicaciones() -> None:
+    """Tras recargar el índice por un cambio en el catálogo: que los demás workers lo recarguen."""
+    publicar_invalidacion("ubicaciones")
+
+
+def _descartar_indice(_claves: list[str] | None) -> None:
+    global _indice
+    with _lock:
+        _indice = None
+
+
+suscribir("ubicaciones", _descartar_indice)
+
+
+def get_indice_ubicaciones() -> IndiceUbicaciones:
+    """Devuelve el índice cargado; lo construye la primera vez si hace falta."""
+    indice = _indice
+    if indice is None:
+        # Carrera inofensiva: dos hilos pueden construirlo a la vez; gana el último.
+        indice = recargar_indice_ubicaciones()
+    return indice
@@ -1,16 +1,63 @@
 # src/sina/db/models.py
 from sqlalchemy import (
     DateTime, Date, ForeignKey, UniqueConstraint, Index,
-    Column, Integer, String, Float, Boolean, Text, JSON
+    Column, Integer, String, Float, Boolean, Text, JSON, func
 )
 from sqlalchemy.orm import declarative_base, relationship, mapped_column
 from sina.config.timezone import get_mexico_now, to_mexico_tz
 from datetime import datetime, timedelta, timezone
 from pgvector.sqlalchemy import Vector
+from sina.embedder.base import EMBEDDING_DIM
 from typing import cast
 
 Base = declarative_base()
 
+
+# ── Reglas de vigencia ───────────────────────────────────────
+# Funciones sueltas (además de `esta_vigente` en cada modelo) para poder evaluar
+# la vigencia sobre una fecha que ya viene calculada en SQL (p. ej. un max()),
+# sin hidratar el objeto ORM.
+def gasolina_vigente(fecha: datetime | None) -> bool:
+    """Gasolina se actualiza casi diario: vigente si tiene menos de 24 horas."""
+    if fecha is None:
+        return False
+    fecha_mx = to_mexico_tz(fecha)   # naive → se asume UTC
+    ahora_mx = get_mexico_now()
+    return (ahora_mx - fecha_mx).total_seconds() < 86400  # 24 horas en segundos
+
+
+def gas_lp_vigente(fecha: datetime | None) -> bool:
+    """Gas LP se actualiza cada sábado: vigente si es posterior al último sábado (hora MX)."""
+    if fecha is None:
+        return False
+    fecha_mx = to_mexico_tz(fecha)
+    ahora_mx = get_mexico_now()
+
+    # Obtener el último sábado en zona horaria de México
+    dias_desde_sabado = (ahora_mx.date().weekday() - 5) % 7
+    ultimo_sabado = ahora_mx.replace(
+        hour=0, minute=0, second=0, microsecond=0
+    ) - timedelta(days=dias_desde_sabado)
+
+    return fecha_mx >= ultimo_sabado
+
+
+def gasolina_vigente_hasta(fecha: datetime | None) -> datetime | None:
+    """Instante (hora MX) en que `gasolina_vigente(fecha)` deja de ser cierto."""
+    if fecha is None:
+        return None
+    return to_mexico_tz(fecha) + timedelta(seconds=86400)
+
+
+def gas_lp_vigente_hasta(fecha: datetime | None) -> datetime | None:
+    """Instante (hora MX) en que `gas_lp_vigente(fecha)` deja de ser cierto: el sábado siguiente, 00:00."""
+    if fecha is None:
+        return None
+    fecha_mx = to_mexico_tz(fecha)
+    dias_a_sabado = (5 - fecha_mx.weekday()) % 7 or 7
+    return fecha_mx.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=dias_a_sabado)
+
+
 # PrecioQQP (PROFECO / "Quién es Quién en los Precios") fue eliminado en jul 2026:
 # la fuente se reemplazó por scraping directo (`Supermercado`). La tabla
 # `qqp_precios` puede quedar huérfana en DBs existentes (create_all no borra).
@@ -74,7 +121,10 @@ class Supermercado(Base):
     unidad = Column(String, nullable=True)
     vigencia_inicio = Column(Date, nullable=True)
     vigencia_fin = Column(Date, nullable=True)
-    embedding = mapped_column(Vector(), nullable=True)
+    # Dimensión fija (MRL, ver sina.embedder.base): requisito del índice HNSW.
+    embedding = mapped_column(Vector(EMBEDDING_DIM), nullable=True)
+    # sha256(modelo|dim|texto) con que se generó `embedding`: si no cambia, el vector se reutiliza.
+    embedding_hash = Column(String(64), nullable=True)
     fecha_actualizacion = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
     __table_args__ = (
@@ -86,6 +136,8 @@ class Supermercado(Base):
         Index("ix_supermercado_departamento", "departamento"),
         Index("ix_supermercado_categoria", "categoria"),
         Index("ix_supermercado_fuente", "fuente"),
+        Index("ix_supermercado_embedding_hash", "embedding_hash"),
+        Index("ix_supermercado_fecha_actualizacion", "fecha_actualizacion"),
     )
 
     def __repr__(self):
@@ -131,15 +183,7 @@ class PrecioGasolina(Base):
         Gasolina se actualiza casi diario.
         Consideramos vigente si tiene menos de 24 horas.
         """
-        if self.fecha_registro is None:
-            return False
-        fecha: datetime = cast(datetime, self.fecha_registro)
-        if fecha.tzinfo is None:
-            fecha = fecha.replace(tzinfo=timezone.utc)
-        fecha_mx = to_mexico_tz(fecha)
-        ahora_mx = get_mexico_now()
-        delta = ahora_mx - fecha_mx
-        return delta.total_seconds() < 86400  # 24 horas en segundos
+        return gasolina_vigente(cast(datetime | None, self.fecha_registro))
 
 class EntidadFederativa(Base):
     """Catálogo de estados de México (CNE)."""
@@ -253,10 +297,14 @@ class GasLPPrecio(Base):
 
 
     __table_args__ = (
-        UniqueConstraint(
+        # COALESCE: los autotanques no tienen capacidad (NULL) y en un UNIQUE los
+        # NULL nunca chocan, así que cada refresco duplicaba sus filas. Los upserts
+        # usan esta misma expresión como objetivo de ON CONFLICT.
+        Index(
+            "uq_gas_lp_clave",
             "entidad_id", "municipio_id", "localidad_id",
-            "numero_permiso", "tipo", "capacidad_recipiente",
-            name="uq_gas_lp_precio"
+            "numero_permiso", "tipo", func.coalesce(capacidad_recipiente, 0),
+            unique=True,
         ),
     )
 
@@ -272,20 +320,77 @@ class GasLPPrecio(Base):
         Gas LP se actualiza semanalmente (cada sábado).
         Usamos la fecha de México para determinar vigencia.
         """
-        fecha: datetime = cast(datetime, self.fecha_extraccion)
-        if fecha.tzinfo is None:
-            fecha = fecha.replace(tzinfo=timezone.utc)
-        fecha_mx = to_mexico_tz(fecha)
-        ahora_mx = get_mexico_now()
-        
-        # Obtener el último sábado en zona horaria de México
-        hoy_mx = ahora_mx.date()
-        dias_desde_sabado = (hoy_mx.weekday() - 5) % 7
-        ultimo_sabado = ahora_mx.replace(
-            hour=0, minute=0, second=0, microsecond=0
-        ) - timedelta(days=dias_desde_sabado)
-        
-        return fecha_mx >= ultimo_sabado
+        return gas_lp_vigente(cast(datetime, self.fecha_extraccion))
+
+
+class VerificacionFuente(Base):
+    """
+    Última consulta a una API de gobierno por ubicación, traiga o no datos.
+    `filas=0` es la caché NEGATIVA: "se preguntó en T y no había nada" (p. ej.
+    municipios rurales sin gasolineras), para no volver a bloquear el request
+    contra CRE/CNE hasta que venza el TTL. Los errores de transporte NO se
+    registran: solo respuestas reales de la fuente.
+    """
+    __tablename__ = "verificaciones_fuente"
+
+    fuente        = Column(String, primary_key=True)   # "gasolina" | "gas_lp"
+    clave         = Column(String, primary_key=True)   # "sonora/hermosillo" | "26/030/1"
+    verificado_en = Column(DateTime(timezone=True), nullable=False,
+                           default=lambda: datetime.now(timezone.utc))
+    filas         = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<VerificacionFuente {self.fuente}:{self.clave} filas={self.filas}>"
+
+
+class ColaEmbedding(Base):
+    """
+    Cola durable de productos pendientes de vectorizar. Los upserts solo
+    encolan (sin esperar al modelo); el worker (`sina.embedder.cola`) la drena
+    en lotes con `FOR UPDATE SKIP LOCKED`, así que varios workers no se pisan y
+    una caída no pierde trabajo: lo no confirmado sigue en la cola.
+    """
+    __tablename__ = "cola_embeddings"
+
+    supermercado_id = Column(Integer, ForeignKey("supermercados.id", ondelete="CASCADE"), primary_key=True)
+    # Defaults del lado del servidor: se encola con INSERT ... SELECT.
+    encolado_en     = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    intentos        = Column(Integer, nullable=False, server_default="0")
+    ultimo_error    = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_cola_embeddings_encolado", "encolado_en"),
+    )
+
+    def __repr__(self):
+        return f"<ColaEmbedding supermercado={self.supermercado_id} intentos={self.intentos}>"
+
+
+class CanastaMejor(Base):
+    """
+    Precalculado: el producto más barato entre las mejores coincidencias de
+    cada rubro de la canasta básica (`CANASTA_BASICA`), por tienda. Se
+    recalcula por tienda al terminar su scrape o al persistir un flyer
+    (`CanastaMejorRepository.refrescar`), así que armar/comparar la canasta es
+    una lectura de ~14 filas por tienda en vez de una búsqueda por rubro.
+    """
+    __tablename__ = "canasta_mejores"
+
+    item            = Column(String, primary_key=True)    # rubro: "Aceite", "Leche"...
+    tienda          = Column(String, primary_key=True)
+    producto        = Column(String, nullable=False)
+    precio          = Column(Float, nullable=False)
+    pid             = Column(Integer, nullable=True)      # None si viene de flyer
+    marca           = Column(String, nullable=True)
+    unidad          = Column(String, nullable=True)
+    fuente          = Column(String, nullable=False, default="scraping")
+    # Fin de la promo (flyer): al leer se descartan las vencidas sin esperar al refresco.
+    vigencia_fin    = Column(Date, nullable=True)
+    actualizado_en  = Column(DateTime(timezone=True), nullable=False,
+                             default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f"<CanastaMejor {self.item}@{self.tienda} {self.producto} ${self.precio}>"
 
 
 class Usuario(Base):
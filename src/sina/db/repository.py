@@ -1,26 +1,48 @@
+import io
 import logging
 from typing import Generic, TypeVar
 from contextlib import contextmanager
 from typing import cast as typing_cast
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from sqlalchemy import (
+    Float,
+    Integer,
+    String,
+    case,
+    cast,
     create_engine,
     insert,
     delete,
     select,
     event,
+    func,
+    column,
+    literal,
+    literal_column,
+    or_,
+    table,
     text,
-    update)
+    true,
+    update,
+    values)
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from pgvector.sqlalchemy import Vector
 from sina.db.models import (
     Base, PrecioGasolina,
     EntidadFederativa, Municipio, Localidad, GasLPPrecio,
-    CatalogoConfig, Supermercado, Usuario, ChatHistorial,
+    CatalogoConfig, Supermercado, Usuario, ChatHistorial, VerificacionFuente, ColaEmbedding,
+    CanastaMejor,
+    gasolina_vigente, gas_lp_vigente, gasolina_vigente_hasta, gas_lp_vigente_hasta,
 )
 from sina.config.credentials import DB_URL
-from sina.config.timezone import get_mexico_now
+from sina.embedder.base import EMBEDDING_DIM
+from sina.db.busqueda_texto import consulta_fts5
+from sina.config.timezone import get_mexico_now, to_mexico_tz
+from sina.db.indice_gasolineras import invalidar_indice_gasolineras
+from sina.db.cache_respuestas import invalidar_respuestas
 
 log = logging.getLogger(__name__)
 
@@ -102,8 +124,238 @@ if DB_URL.startswith("postgresql"):
             "ON supermercados (fuente)"
         ))
 
+# `embedding_hash` (reutilizar vectores entre upserts). Ambos dialectos: el
+# modelo ORM la selecciona siempre, así que una DB de dev vieja sin la columna
+# rompería cualquier consulta de productos.
+with _engine.begin() as conn:
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE supermercados ADD COLUMN IF NOT EXISTS embedding_hash VARCHAR(64)"))
+    elif "embedding_hash" not in {
+        fila[1] for fila in conn.execute(text("PRAGMA table_info(supermercados)"))
+    }:
+        conn.execute(text("ALTER TABLE supermercados ADD COLUMN embedding_hash VARCHAR(64)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_supermercado_embedding_hash ON supermercados (embedding_hash)"
+    ))
+    # `max(fecha_actualizacion)` (versión del catálogo para ETag/304) sin scan.
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_supermercado_fecha_actualizacion ON supermercados (fecha_actualizacion)"
+    ))
+
+# ── Búsqueda vectorial: dimensión fija + índice ANN ─────────────
+# Sin índice, `ORDER BY embedding <=> :q LIMIT k` es un scan secuencial de toda
+# la tabla por consulta. El índice exige dimensión fija: la columna se alinea a
+# EMBEDDING_DIM (vectores existentes de más dims se recortan por MRL — sin
+# renormalizar: la distancia coseno no depende de la norma —; los de menos quedan
+# NULL para el backfill). Solo PostgreSQL.
+EMBEDDING_INDICE     = _os.getenv("EMBEDDING_INDICE", "hnsw").strip().lower()   # hnsw | ivfflat
+HNSW_M               = int(_os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(_os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH       = int(_os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_LISTS        = int(_os.getenv("IVFFLAT_LISTS", "100"))
+IVFFLAT_PROBES       = int(_os.getenv("IVFFLAT_PROBES", "10"))
+
+_INDICES_ANN = {
+    "hnsw": (
+        "ix_supermercado_embedding_hnsw",
+        f"hnsw (embedding vector_cosine_ops) WITH (m = {HNSW_M}, "
+        f"ef_construction = {HNSW_EF_CONSTRUCTION})",
+    ),
+    "ivfflat": (
+        "ix_supermercado_embedding_ivfflat",
+        f"ivfflat (embedding vector_cosine_ops) WITH (lists = {IVFFLAT_LISTS})",
+    ),
+}
+if EMBEDDING_INDICE not in _INDICES_ANN:
+    raise ValueError(f"EMBEDDING_INDICE desconocido: '{EMBEDDING_INDICE}' (usa 'hnsw' o 'ivfflat')")
+
+if DB_URL.startswith("postgresql"):
+    with _engine.begin() as conn:
+        dim_actual = conn.execute(text(
+            "SELECT atttypmod FROM pg_attribute "
+            "WHERE attrelid = 'supermercados'::regclass AND attname = 'embedding'"
+        )).scalar()
+        if dim_actual != EMBEDDING_DIM:
+            for nombre, _ in _INDICES_ANN.values():
+                conn.execute(text(f"DROP INDEX IF EXISTS {nombre}"))
+            conn.execute(text(
+                f"ALTER TABLE supermercados ALTER COLUMN embedding TYPE vector({EMBEDDING_DIM}) "
+                f"USING CASE WHEN vector_dims(embedding) >= {EMBEDDING_DIM} "
+                f"THEN ((embedding::real[])[1:{EMBEDDING_DIM}])::vector END"
+            ))
+            log.info("supermercados.embedding: vector(%s) → vector(%d)",
+                     dim_actual if dim_actual and dim_actual > 0 else "", EMBEDDING_DIM)
+        # Solo el índice elegido: dos índices ANN duplican el costo de cada escritura.
+        for tipo, (nombre, _) in _INDICES_ANN.items():
+            if tipo != EMBEDDING_INDICE:
+                conn.execute(text(f"DROP INDEX IF EXISTS {nombre}"))
+        nombre, definicion = _INDICES_ANN[EMBEDDING_INDICE]
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nombre} ON supermercados USING {definicion}"))
+        # Parcial: encolar los productos sin vector no recorre toda la tabla.
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_supermercado_sin_embedding "
+            "ON supermercados (id) WHERE embedding IS NULL"
+        ))
+
+# Embeddings fuera del camino del upsert: con EMBEDDINGS_ASINCRONOS (default) los
+# productos nuevos se guardan sin vector y se encolan en `cola_embeddings`; el
+# worker (`sina.embedder.cola`) los vectoriza en lotes de EMBEDDINGS_COLA_LOTE.
+# Con 0 se vuelve a vectorizar dentro del upsert (sin worker que drene la cola).
+EMBEDDINGS_ASINCRONOS        = _os.getenv("EMBEDDINGS_ASINCRONOS", "1").strip().lower() in ("1", "true", "yes", "on")
+EMBEDDINGS_COLA_LOTE         = int(_os.getenv("EMBEDDINGS_COLA_LOTE", "256"))
+EMBEDDINGS_COLA_MAX_INTENTOS = int(_os.getenv("EMBEDDINGS_COLA_MAX_INTENTOS", "5"))
+
+
+# ── Texto completo en español ─────────────────────────────────
+# El índice trigram no hace stemming ("tortillas" ≠ "tortilla") ni ignora
+# acentos ("azúcar" ≠ "azucar"). PostgreSQL: configuración `sina_es` (unaccent +
+# stemmer español) y columna GENERADA `busqueda` (producto > marca > categoría,
+# pesos A/B/C) con índice GIN; la columna no está en el modelo ORM (SQLite no
+# tiene tsvector). SQLite: tabla virtual FTS5 de contenido externo, sincronizada
+# por triggers (acentos vía remove_diacritics; plural vía `consulta_fts5`).
+if _engine.dialect.name == "postgresql":
+    with _engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+        conn.execute(text(
+            "DO $$ BEGIN "
+            "IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'sina_es') THEN "
+            "CREATE TEXT SEARCH CONFIGURATION sina_es (COPY = spanish); "
+            "ALTER TEXT SEARCH CONFIGURATION sina_es "
+            "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem; "
+            "END IF; END $$"
+        ))
+        conn.execute(text(
+            "ALTER TABLE supermercados ADD COLUMN IF NOT EXISTS busqueda tsvector "
+            "GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('sina_es', coalesce(producto, '')), 'A') || "
+            "setweight(to_tsvector('sina_es', coalesce(marca, '')), 'B') || "
+            "setweight(to_tsvector('sina_es', coalesce(categoria, '')), 'C')"
+            ") STORED"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_supermercados_busqueda "
+            "ON supermercados USING gin (busqueda)"
+        ))
+else:
+    with _engine.begin() as conn:
+        nueva = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'supermercados_fts'"
+        )).first() is None
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS supermercados_fts USING fts5("
+            "producto, marca, categoria, content='supermercados', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS supermercados_fts_ai AFTER INSERT ON supermercados BEGIN "
+            "INSERT INTO supermercados_fts (rowid, producto, marca, categoria) "
+            "VALUES (new.id, new.producto, new.marca, new.categoria); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS supermercados_fts_ad AFTER DELETE ON supermercados BEGIN "
+            "INSERT INTO supermercados_fts (supermercados_fts, rowid, producto, marca, categoria) "
+            "VALUES ('delete', old.id, old.producto, old.marca, old.categoria); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS supermercados_fts_au "
+            "AFTER UPDATE OF producto, marca, categoria ON supermercados BEGIN "
+            "INSERT INTO supermercados_fts (supermercados_fts, rowid, producto, marca, categoria) "
+            "VALUES ('delete', old.id, old.producto, old.marca, old.categoria); "
+            "INSERT INTO supermercados_fts (rowid, producto, marca, categoria) "
+            "VALUES (new.id, new.producto, new.marca, new.categoria); END"
+        ))
+        if nueva:
+            conn.execute(text("INSERT INTO supermercados_fts (supermercados_fts) VALUES ('rebuild')"))
+
+
+# Búsqueda de productos: modo por defecto, candidatos por rama del modo híbrido
+# y constante de Reciprocal Rank Fusion (60 = valor del paper de Cormack et al.).
+MODOS_BUSQUEDA      = ("auto", "hibrido", "semantico", "fts", "texto")
+BUSQUEDA_MODO       = _os.getenv("BUSQUEDA_MODO", "auto")
+BUSQUEDA_CANDIDATOS = int(_os.getenv("BUSQUEDA_CANDIDATOS", "40"))
+RRF_K               = int(_os.getenv("RRF_K", "60"))
+
+
+# Columna generada (solo PostgreSQL, fuera del modelo ORM) y su consulta.
+_BUSQUEDA = literal_column("supermercados.busqueda")
+
+
+def _tsquery(q: str):
+    """`websearch_to_tsquery` con la configuración `sina_es` (acepta "comillas", -excluir, or)."""
+    return func.websearch_to_tsquery(literal_column("'sina_es'::regconfig"), q)
+
+
+def _ajustar_ann(session, limit: int, ef_search: int | None, probes: int | None) -> None:
+    """
+    Parámetros de búsqueda del índice ANN para ESTA transacción (`set_config`
+    local = `SET LOCAL`). Más `ef_search`/`probes` = más recall, más latencia;
+    `ef_search` nunca menor que `limit` (HNSW no devuelve más de ef candidatos).
+    """
+    if EMBEDDING_INDICE == "hnsw":
+        valor, parametro = max(ef_search or HNSW_EF_SEARCH, limit), "hnsw.ef_search"
+    else:
+        valor, parametro = probes or IVFFLAT_PROBES, "ivfflat.probes"
+    session.execute(text("SELECT set_config(:p, :v, true)"), {"p": parametro, "v": str(valor)})
+
+
+def _existe_indice(conn, nombre: str) -> bool:
+    if conn.dialect.name == "postgresql":
+        sql = "SELECT 1 FROM pg_indexes WHERE indexname = :n"
+    else:
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :n"
+    return conn.execute(text(sql), {"n": nombre}).first() is not None
+
+
+# Gas LP: el UNIQUE original incluía `capacidad_recipiente`, NULL en autotanques,
+# y los NULL nunca chocan → cada refresco insertaba autotanques duplicados. En DBs
+# existentes se depuran (se conserva la fila más reciente) y se crea el índice
+# único sobre COALESCE(capacidad, 0) que usan los upserts. Ambos dialectos: sin
+# este índice el ON CONFLICT no tiene contra qué resolver. Migración de una sola
+# vez: en PostgreSQL se serializa entre workers con un advisory lock de la misma
+# transacción y se vuelve a comprobar el índice ya con el candado, así que solo
+# el primer worker depura y los demás, al obtenerlo, encuentran el índice hecho.
+def _migrar_clave_gas_lp(conn) -> int | None:
+    """Depura duplicados y crea `uq_gas_lp_clave`; None si el índice ya existía."""
+    if not _existe_indice(conn, "uq_gas_lp_clave") and conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtextextended('migracion:uq_gas_lp_clave', 0))"))
+    if _existe_indice(conn, "uq_gas_lp_clave"):
+        return None
+    clave = (
+        "entidad_id, municipio_id, localidad_id, numero_permiso, tipo, "
+        "COALESCE(capacidad_recipiente, 0)"
+    )
+    borradas = conn.execute(text(
+        "DELETE FROM gas_lp_precios WHERE id NOT IN ("
+        f"SELECT max(id) FROM gas_lp_precios GROUP BY {clave})"
+    )).rowcount
+    conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_gas_lp_clave ON gas_lp_precios ({clave})"))
+    log.info("gas_lp_precios: índice uq_gas_lp_clave creado (%d duplicados depurados)", borradas)
+    return borradas
+
+
+with _engine.begin() as conn:
+    _migrar_clave_gas_lp(conn)
+
 _SessionFactory = sessionmaker(bind=_engine, expire_on_commit=False)
 
+CONTEO_VACIO = {"insertados": 0, "actualizados": 0, "sin_cambios": 0}
+
+
+def _cambio_en(model, excluded, columnas: list[str]):
+    """
+    Predicado para `ON CONFLICT ... DO UPDATE ... WHERE`: solo reescribe la fila
+    si alguna de `columnas` cambió (IS DISTINCT FROM, NULL-safe; en SQLite se
+    compila como IS NOT). Las filas iguales no generan escritura (ni WAL, ni
+    tupla muerta que aspirar, ni lag de réplica).
+    """
+    return or_(*(getattr(model, c).is_distinct_from(getattr(excluded, c)) for c in columnas))
+
+
+def _mas_reciente(*fechas: datetime | None) -> datetime | None:
+    """La fecha más reciente entre varias (naive = UTC), ignorando None."""
+    validas = [to_mexico_tz(f) for f in fechas if f is not None]
+    return max(validas) if validas else None
+
 
 def _dialect_insert(model):
     """
@@ -117,6 +369,126 @@ def _dialect_insert(model):
     return sqlite_insert(model)
 
 
+# ── Escritura masiva ──────────────────────────────────────────
+# Filas por INSERT multi-VALUES y umbral a partir del cual PostgreSQL usa COPY.
+LOTE_UPSERT   = int(_os.getenv("DB_LOTE_UPSERT", "500"))
+COPY_MIN_FILAS = int(_os.getenv("DB_COPY_MIN_FILAS", "2000"))
+# Parámetros ligados por sentencia (SQLITE_MAX_VARIABLE_NUMBER / protocolo PG).
+_MAX_PARAMETROS = {"sqlite": 32766, "postgresql": 65535}
+
+
+def _trozos(filas: list[dict], lote: int, max_parametros: int = 65535):
+    """Parte `filas` en lotes de `lote`, sin rebasar `max_parametros` por sentencia."""
+    columnas = max(1, len(filas[0]))
+    tam = max(1, min(lote, max_parametros // columnas))
+    for i in range(0, len(filas), tam):
+        yield filas[i:i + tam]
+
+
+def _valor_copy(v) -> str:
+    """Un valor en formato texto de COPY (NULL = \\N; vectores como '[a,b,...]')."""
+    if v is None:
+        return "\\N"
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, (list, tuple)) or hasattr(v, "tolist"):
+        v = "[" + ",".join(repr(float(x)) for x in (v.tolist() if hasattr(v, "tolist") else v)) + "]"
+    return (str(v).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def _copiar_a_temporal(conn, model, filas: list[dict]) -> tuple[str, list[str]]:
+    """
+    COPY de `filas` a una tabla temporal con los mismos tipos que `model` (sin
+    restricciones, se borra al commit). Devuelve (nombre, columnas).
+    """
+    columnas = list(filas[0])
+    tabla = model.__table__.name
+    temporal = f"_copia_{tabla}"
+    lista = ", ".join(columnas)
+    conn.exec_driver_sql(
+        f"CREATE TEMP TABLE {temporal} ON COMMIT DROP AS "
+        f"SELECT {lista} FROM {tabla} WITH NO DATA"
+    )
+    buffer = io.StringIO()
+    for f in filas:
+        buffer.write("\t".join(_valor_copy(f.get(c)) for c in columnas))
+        buffer.write("\n")
+    buffer.seek(0)
+    with conn.connection.cursor() as cur:   # cursor psycopg2 de la MISMA transacción
+        cur.copy_expert(f"COPY {temporal} ({lista}) FROM STDIN", buffer)
+    return temporal, columnas
+
+
+def _upsert_por_copy(conn, model, filas: list[dict], conflicto, *retorno) -> list:
+    """
+    COPY de `filas` a una tabla temporal y un solo INSERT ... SELECT ... ON
+    CONFLICT para fusionarla. Devuelve las filas de RETURNING (`retorno`).
+    """
+    temporal, columnas = _copiar_a_temporal(conn, model, filas)
+    origen = table(temporal, *(column(c) for c in columnas))
+    stmt = conflicto(_dialect_insert(model).from_select(columnas, select(origen)))
+    return conn.execute(stmt.returning(*retorno)).all()
+
+
+def _actualizar_por_copy(
+    conn, model, filas: list[dict], clave: str = "id", sin_cambio: tuple[str, ...] = ()
+) -> list:
+    """
+    Actualiza filas existentes por `clave` con COPY + un solo UPDATE ... FROM
+    (en vez de un UPDATE por fila). Las columnas de `sin_cambio` no se
+    asignan: son condición (la fila solo se actualiza si siguen valiendo lo
+    mismo que en `filas`). Solo PostgreSQL. Devuelve las claves actualizadas.
+    """
+    temporal, columnas = _copiar_a_temporal(conn, model, filas)
+    asignaciones = ", ".join(f"{c} = t.{c}" for c in columnas if c != clave and c not in sin_cambio)
+    condiciones = "".join(f" AND s.{c} IS NOT DISTINCT FROM t.{c}" for c in sin_cambio)
+    return [fila[0] for fila in conn.exec_driver_sql(
+        f"UPDATE {model.__table__.name} AS s SET {asignaciones} "
+        f"FROM {temporal} AS t WHERE s.{clave} = t.{clave}{condiciones} "
+        f"RETURNING s.{clave}"
+    )]
+
+
+@contextmanager
+def candado_consultivo(clave: str, timeout_s: float):
+    """
+    Exclusión mutua ENTRE procesos/instancias por `clave` con un advisory lock
+    de PostgreSQL a nivel transacción (`pg_advisory_xact_lock`): se libera solo
+    al cerrar la transacción, aunque el worker muera. Mientras se sostiene
+    ocupa una conexión del pool, así que úsese solo para tramos cortos y raros
+    (p. ej. la primera carga de una ubicación).
+
+    Produce True si se obtuvo el candado. Si no llega en `timeout_s`
+    (`lock_timeout`) produce False y el llamador sigue sin coordinación,
+    degradado en vez de fallar. En SQLite (un solo proceso en dev) es un no-op.
+    """
+    if _engine.dialect.name != "postgresql":
+        yield True
+        return
+    with _engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            # SET LOCAL no acepta parámetros: el valor es un entero ya validado.
+            conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{max(1, int(timeout_s * 1000))}ms'")
+            conn.execute(
+                text("SELECT pg_advisory_xact_lock(hashtextextended(:clave, 0))"),
+                {"clave": clave},
+            )
+            obtenido = True
+        except OperationalError:
+            log.warning("Sin advisory lock para %s tras %.0fs; se sigue sin coordinar", clave, timeout_s)
+            trans.rollback()
+            obtenido = False
+        try:
+            yield obtenido
+        finally:
+            if trans.is_active:
+                trans.rollback()   # solo libera el candado; no se escribió nada aquí
+
+
 class BaseRepository(Generic[T]):
     """Repositorio genérico — todos comparten el mismo engine."""
     model: type[T]
@@ -140,6 +512,62 @@ class BaseRepository(Generic[T]):
         with self.engine.begin() as conn:
             conn.execute(delete(self.model))
 
+    def _upsert_masivo(self, filas: list[dict], conflicto, *,
+                       estrategia: str | None = None, lote: int | None = None) -> dict:
+        """Upsert masivo que solo cuenta; ver `_upsert_masivo_con_retorno`."""
+        return self._upsert_masivo_con_retorno(filas, conflicto, estrategia=estrategia, lote=lote)[0]
+
+    def _upsert_masivo_con_retorno(self, filas: list[dict], conflicto, retorno=None, *,
+                                   estrategia: str | None = None,
+                                   lote: int | None = None) -> tuple[dict, list]:
+        """
+        Upsert de `filas` en una transacción, sin armar un solo INSERT gigante.
+        `conflicto(ins)` recibe el INSERT (con VALUES o SELECT) y le agrega su
+        `on_conflict_do_update(...)`. Estrategias (`None` = automática):
+
+          - "lotes": INSERT multi-VALUES de `lote` filas (acotado al límite de
+            parámetros del motor: SQLite admite 32766 por sentencia).
+          - "copy" (solo PostgreSQL): COPY a una tabla temporal y UN
+            `INSERT ... SELECT ... ON CONFLICT` para fusionar. Se elige sola a
+            partir de `DB_COPY_MIN_FILAS` filas.
+
+        Cuenta insertados / actualizados / sin cambios (las filas saltadas por
+        el `WHERE` de cambio no vuelven en RETURNING). Con `retorno` (una
+        expresión SQL) también devuelve su valor para cada fila escrita.
+        """
+        if not filas:
+            return dict(CONTEO_VACIO), []
+        with self.engine.begin() as conn:
+            es_pg = conn.dialect.name == "postgresql"
+            if estrategia is None:
+                estrategia = "copy" if es_pg and len(filas) >= COPY_MIN_FILAS else "lotes"
+            if estrategia == "copy" and not es_pg:
+                raise ValueError("La estrategia 'copy' requiere PostgreSQL")
+            # PG: xmax = 0 ⇔ la tupla la creó ESTE insert (no hubo conflicto).
+            # SQLite no distingue insert de update en RETURNING, pero toda fila
+            # nueva recibe un rowid mayor que el máximo previo (un solo salto
+            # por el B-tree, sin recorrer la tabla): insertada ⇔ rowid > tope.
+            marca = literal_column("xmax = 0") if es_pg else literal_column("rowid")
+            tope = None if es_pg else conn.execute(
+                text(f"SELECT coalesce(max(rowid), 0) FROM {self.model.__tablename__}")
+            ).scalar_one()
+
+            columnas = (marca,) if retorno is None else (marca, retorno)
+            if estrategia == "copy":
+                escritas = _upsert_por_copy(conn, self.model, filas, conflicto, *columnas)
+            else:
+                escritas = []
+                for trozo in _trozos(filas, lote or LOTE_UPSERT, _MAX_PARAMETROS[conn.dialect.name]):
+                    stmt = conflicto(_dialect_insert(self.model).values(trozo))
+                    escritas += conn.execute(stmt.returning(*columnas)).all()
+
+            insertados = sum(1 for f in escritas if (f[0] if es_pg else f[0] > tope))
+        return {
+            "insertados":   insertados,
+            "actualizados": len(escritas) - insertados,
+            "sin_cambios":  len(filas) - len(escritas),
+        }, [f[1] for f in escritas] if retorno is not None else []
+
     def _estado_cache(self, campo_fecha: str, evaluar_vigencia: bool = True) -> dict:
         """
         Última actualización y vigencia (para el health check), parametrizado
@@ -168,28 +596,83 @@ class BaseRepository(Generic[T]):
 class GasolinaRepository(BaseRepository[PrecioGasolina]):
     model = PrecioGasolina
 
+    def _select_municipio(self, estado: str, municipio: str):
+        """SELECT de columnas (sin hidratar ORM) de las gasolineras de un municipio."""
+        m = self.model
+        return select(
+            m.numero, m.nombre, m.direccion,
+            m.magna, m.premium, m.diesel,
+            m.latitud, m.longitud,
+            m.fecha_registro.label("fecha_extraccion"),
+        ).where(
+            m.estado    == estado.lower(),
+            m.municipio == municipio.lower(),
+        )
+
     def obtener_por_municipio(self, estado: str, municipio: str) -> list[dict]:
         """Consulta gasolineras por estado y municipio."""
-        with self.Session() as session:
-            stmt = select(self.model).where(
-                self.model.estado    == estado.lower(),
-                self.model.municipio == municipio.lower()
-            )
-            rows = session.execute(stmt).scalars().all()
-            return [
-                {
-                    "numero"   : r.numero,
-                    "nombre"   : r.nombre,
-                    "direccion": r.direccion,
-                    "magna"    : r.magna,
-                    "premium"  : r.premium,
-                    "diesel"   : r.diesel,
-                    "latitud"  : r.latitud,
-                    "longitud" : r.longitud,
-                    "fecha_extraccion": r.fecha_registro,
-                }
-                for r in rows
-            ]
+        with self.engine.connect() as conn:
+            rows = conn.execute(self._select_municipio(estado, municipio)).mappings().all()
+        return [dict(r) for r in rows]
+
+    def obtener_con_vigencia(
+        self, estado: str, municipio: str
+    ) -> tuple[list[dict], bool, datetime | None]:
+        """
+        Filas del municipio + veredicto de vigencia + fecha de los datos en UNA
+        sola query: la fecha más reciente sale de un `max() OVER ()` sobre las
+        mismas filas y de la última verificación en `verificaciones_fuente`
+        (que avanza aunque los precios no cambien), en vez de
+        `necesita_actualizacion()` + `obtener_por_municipio()` por separado.
+        Esa fecha es la `fecha_datos` de la respuesta: el `fecha_extraccion`
+        de cada fila es su último CAMBIO de precio. Sin filas → ([], False, None).
+        """
+        stmt = self._select_municipio(estado, municipio).add_columns(
+            func.max(self.model.fecha_registro).over().label("_ultima_fecha"),
+            _verificado_en("gasolina", f"{estado.lower()}/{municipio.lower()}").label("_verificado_en"),
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt).mappings().all()
+        if not rows:
+            return [], False, None
+        ultima = _mas_reciente(rows[0]["_ultima_fecha"], rows[0]["_verificado_en"])
+        registros = [
+            {k: v for k, v in r.items() if not k.startswith("_")}
+            for r in rows
+        ]
+        return registros, gasolina_vigente(ultima), ultima
+
+    def mejores_estaciones(self, estado: str, municipio: str, columna: str, limit: int = 5) -> dict:
+        """
+        Las `limit` gasolineras más baratas del municipio con precio de `columna`
+        (magna/premium/diesel), con filtro, orden y límite en SQL: solo viajan
+        las filas que se usan. La cercanía a un punto la resuelve el índice
+        espacial en memoria (`indice_gasolineras`), no esta consulta.
+
+        Returns:
+            dict: {filas, total (antes del límite), fecha_datos}.
+        """
+        m = self.model
+        precio = getattr(m, columna)
+        stmt = select(
+            m.nombre, m.direccion, precio.label("precio"), m.latitud, m.longitud,
+            func.count().over().label("_total"),
+            func.max(m.fecha_registro).over().label("_fecha"),
+            _verificado_en("gasolina", f"{estado.lower()}/{municipio.lower()}").label("_verificado_en"),
+        ).where(
+            m.estado    == estado.lower(),
+            m.municipio == municipio.lower(),
+            precio.is_not(None),
+        ).order_by(precio, m.numero)
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt.limit(limit)).mappings().all()
+        return {
+            "filas": [{k: v for k, v in r.items() if not k.startswith("_")} for r in rows],
+            "total": rows[0]["_total"] if rows else 0,
+            # Último cambio o última verificación: la verificación avanza aunque no cambie nada.
+            "fecha_datos": _mas_reciente(rows[0]["_fecha"], rows[0]["_verificado_en"]) if rows else None,
+        }
 
     def upsert_ubicaciones(self, registros: list[dict]):
         if not registros:
@@ -204,20 +687,26 @@ class GasolinaRepository(BaseRepository[PrecioGasolina]):
             }
             for r in registros
         ]
-        base = _dialect_insert(self.model)
-        stmt = base.values(rows).on_conflict_do_update(
+        excluded = _dialect_insert(self.model).excluded
+        self._upsert_masivo(rows, lambda ins: ins.on_conflict_do_update(
             index_elements=["numero"],
             set_={
-                "latitud":  base.excluded.latitud,
-                "longitud": base.excluded.longitud,
+                "latitud":  excluded.latitud,
+                "longitud": excluded.longitud,
             },
-        )
-        with self.engine.begin() as conn:
-            conn.execute(stmt)
+        ))
+        invalidar_indice_gasolineras()
+        invalidar_respuestas("gasolina", {f"{r['estado']}/{r['municipio']}" for r in rows})
 
-    def upsert_precios(self, registros: list[dict]):
+    def upsert_precios(self, registros: list[dict]) -> dict:
+        """
+        Upsert de precios CRE que solo reescribe gasolineras cuyo precio/nombre
+        cambió. La frescura ya no depende de reescribir `fecha_registro` (que
+        queda como "último cambio"): la marca `verificaciones_fuente`.
+        Devuelve {insertados, actualizados, sin_cambios}.
+        """
         if not registros:
-            return
+            return dict(CONTEO_VACIO)
         rows = [
             {
                 "numero":         r["numero"],
@@ -233,7 +722,7 @@ class GasolinaRepository(BaseRepository[PrecioGasolina]):
             for r in registros
         ]
         base = _dialect_insert(self.model)
-        stmt = base.values(rows).on_conflict_do_update(
+        conteo = self._upsert_masivo(rows, lambda ins: ins.on_conflict_do_update(
             index_elements=["numero"],
             set_={
                 "nombre":         base.excluded.nombre,
@@ -243,9 +732,23 @@ class GasolinaRepository(BaseRepository[PrecioGasolina]):
                 "diesel":         base.excluded.diesel,
                 "fecha_registro": base.excluded.fecha_registro,
             },
-        )
-        with self.engine.begin() as conn:
-            conn.execute(stmt)
+            where=_cambio_en(self.model, base.excluded,
+                             ["nombre", "direccion", "magna", "premium", "diesel"]),
+        ))
+        if conteo["insertados"] or conteo["actualizados"]:
+            invalidar_indice_gasolineras()
+        invalidar_respuestas("gasolina", {f"{r['estado']}/{r['municipio']}" for r in rows})
+        return conteo
+
+    def filas_indice(self) -> list[tuple]:
+        """Gasolineras con coordenadas, en el orden de `EstacionRef` (índice espacial)."""
+        m = self.model
+        stmt = select(
+            m.numero, m.estado, m.municipio, m.nombre, m.direccion,
+            m.latitud, m.longitud, m.magna, m.premium, m.diesel, m.fecha_registro,
+        ).where(m.latitud.is_not(None), m.longitud.is_not(None))
+        with self.engine.connect() as conn:
+            return [tuple(r) for r in conn.execute(stmt)]
 
     def municipios_con_coordenadas(self) -> set[tuple[str, str]]:
         """
@@ -264,19 +767,29 @@ class GasolinaRepository(BaseRepository[PrecioGasolina]):
         """
         True = no hay datos O tienen más de 24 horas.
         """
-        with self.Session() as session:
-            ultimo = (
-                session.query(self.model)
-                .filter_by(
-                    estado=estado.lower(),
-                    municipio=municipio.lower()
-                )
-                .order_by(self.model.fecha_registro.desc())
-                .first()
-            )
-            if ultimo is None:
-                return True
-            return not ultimo.esta_vigente()
+        return self.version_municipio(estado, municipio)[2] is None
+
+    def version_municipio(self, estado: str, municipio: str) -> tuple[datetime | None, int, datetime | None]:
+        """
+        (fecha de los datos, gasolineras con coordenadas, vigente hasta) en una
+        query sobre el índice (estado, municipio), sin cargar filas: la versión
+        de los datos para ETag/304 y el vencimiento de la caché de respuestas
+        (None = ya no está vigente). La fecha es la misma `fecha_datos` de
+        `obtener_con_vigencia` (último cambio o última verificación). Las
+        coordenadas cuentan porque `upsert_ubicaciones` no toca `fecha_registro`.
+        """
+        stmt = select(
+            func.max(self.model.fecha_registro),
+            func.count(self.model.latitud),
+            _verificado_en("gasolina", f"{estado.lower()}/{municipio.lower()}"),
+        ).where(
+            self.model.estado    == estado.lower(),
+            self.model.municipio == municipio.lower(),
+        )
+        with self.engine.connect() as conn:
+            ultima, ubicadas, verificado = conn.execute(stmt).one()
+        referencia = _mas_reciente(ultima, verificado)
+        return referencia, ubicadas, gasolina_vigente_hasta(referencia) if gasolina_vigente(referencia) else None
 
     def ubicaciones_con_precios(self) -> list[tuple[str, str]]:
         """
@@ -293,7 +806,7 @@ class GasolinaRepository(BaseRepository[PrecioGasolina]):
 
     def estado_cache(self) -> dict:
         """Última actualización y vigencia (para el health check)."""
-        return self._estado_cache("fecha_registro")
+        return _con_verificacion(self._estado_cache("fecha_registro"), "gasolina", gasolina_vigente)
 
 class EntidadFederativaRepository(BaseRepository[EntidadFederativa]):
     model = EntidadFederativa
@@ -317,6 +830,20 @@ class MunicipioRepository(BaseRepository[Municipio]):
             catalogo.setdefault(entidad_nombre.lower(), []).append(municipio_nombre.lower())
         return {estado: sorted(municipios) for estado, municipios in catalogo.items()}
 
+    def filas_catalogo(self) -> list[tuple[int, str, str, str]]:
+        """
+        (entidad_id, entidad_nombre, municipio_id, municipio_nombre) de todo el
+        catálogo en UNA query. Alimenta el índice en memoria de ubicaciones.
+        """
+        with self.Session() as session:
+            rows = session.execute(
+                select(
+                    EntidadFederativa.id, EntidadFederativa.nombre,
+                    Municipio.municipio_id, Municipio.nombre,
+                ).join(Municipio, Municipio.entidad_id == EntidadFederativa.id)
+            ).all()
+        return [(e_id, e_nom, m_id, m_nom) for e_id, e_nom, m_id, m_nom in rows]
+
     def obtener_ids(self, estado: str, municipio: str) -> tuple[int, str] | None:
         """
         Dado estado y municipio como strings normalizados,
@@ -364,111 +891,260 @@ class MunicipioRepository(BaseRepository[Municipio]):
 class LocalidadRepository(BaseRepository[Localidad]):
     model = Localidad
 
+    def filas_catalogo(self) -> list[tuple[int, str, int, str]]:
+        """(entidad_id, municipio_id, localidad_id, nombre) de todas las localidades."""
+        with self.Session() as session:
+            rows = session.execute(
+                select(
+                    self.model.entidad_id, self.model.municipio_id,
+                    self.model.localidad_id, self.model.nombre,
+                ).order_by(self.model.id)
+            ).all()
+        return [(e_id, m_id, l_id, nombre) for e_id, m_id, l_id, nombre in rows]
+
 class GasLPRepository(BaseRepository[GasLPPrecio]):
     model = GasLPPrecio
 
+    def _select_localidad(self, entidad_id: int, municipio_id: str, localidad_id: int):
+        """SELECT de columnas (sin hidratar ORM), ordenado por precio (barato → caro)."""
+        m = self.model
+        return select(
+            m.numero_permiso, m.marca_comercial, m.tipo,
+            m.capacidad_recipiente, m.precio,
+            m.entidad_nombre, m.municipio_nombre, m.localidad_nombre,
+            m.fecha_extraccion,
+        ).where(
+            m.entidad_id   == entidad_id,
+            m.municipio_id == municipio_id,
+            m.localidad_id == localidad_id,
+        ).order_by(m.precio.asc())
+
     def obtener_por_localidad(self, entidad_id: int, municipio_id: str, localidad_id: int) -> list[dict]:
         """Obtiene todos los precios de Gas LP para una localidad específica."""
-        with self.Session() as session:
-            stmt = select(self.model).where(
-                self.model.entidad_id   == entidad_id,
-                self.model.municipio_id == municipio_id,
-                self.model.localidad_id == localidad_id,
-            ).order_by(self.model.precio.asc())  # ← ordenado por precio (barato → caro)
-            
-            rows = session.execute(stmt).scalars().all()
-            return [
-                {
-                    "numero_permiso":       r.numero_permiso,
-                    "marca_comercial":      r.marca_comercial,
-                    "tipo":                 r.tipo,
-                    "capacidad_recipiente": r.capacidad_recipiente,
-                    "precio":               r.precio,
-                    "entidad_nombre":       r.entidad_nombre,
-                    "municipio_nombre":     r.municipio_nombre,
-                    "localidad_nombre":     r.localidad_nombre,
-                    "fecha_extraccion":     r.fecha_extraccion,
-                    "vigente":              r.esta_vigente(),
-                }
-                for r in rows
-            ]
+        return self.obtener_con_vigencia(entidad_id, municipio_id, localidad_id)[0]
 
-    def upsert_precios_gas_lp(self, registros: list[dict]):
+    def obtener_con_vigencia(
+        self, entidad_id: int, municipio_id: str, localidad_id: int
+    ) -> tuple[list[dict], bool, datetime | None]:
+        """
+        Precios de la localidad + veredicto de vigencia + fecha de los datos
+        (el registro más reciente, `max() OVER ()`, o la última verificación
+        de la localidad, la que sea posterior) en UNA sola query.
+        Sin filas → ([], False, None).
+        """
+        stmt = self._select_localidad(entidad_id, municipio_id, localidad_id).add_columns(
+            func.max(self.model.fecha_extraccion).over().label("_ultima_fecha"),
+            _verificado_en("gas_lp", f"{entidad_id}/{municipio_id}/{localidad_id}").label("_verificado_en"),
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt).mappings().all()
+        if not rows:
+            return [], False, None
+        verificado = rows[0]["_verificado_en"]
+        registros = []
+        for r in rows:
+            registro = {k: v for k, v in r.items() if not k.startswith("_")}
+            # Un precio sin cambios sigue vigente si la localidad se verificó después.
+            registro["vigente"] = gas_lp_vigente(_mas_reciente(r["fecha_extraccion"], verificado))
+            registros.append(registro)
+        ultima = _mas_reciente(rows[0]["_ultima_fecha"], verificado)
+        return registros, gas_lp_vigente(ultima), ultima
+
+    def version_localidad(
+        self, entidad_id: int, municipio_id: str, localidad_id: int
+    ) -> tuple[datetime | None, int, datetime | None, datetime | None]:
+        """
+        (fecha de los datos, filas, última verificación, vigente hasta) de la
+        localidad en una query sobre `uq_gas_lp_clave`, sin cargar filas
+        (versión para ETag/304 y vencimiento de la caché de respuestas; None =
+        ya no está vigente). La fecha es la `fecha_datos` de
+        `obtener_con_vigencia`; la verificación cuenta aparte porque de ella
+        depende el `vigente` por fila.
+        """
+        m = self.model
+        stmt = select(
+            func.max(m.fecha_extraccion),
+            func.count(),
+            _verificado_en("gas_lp", f"{entidad_id}/{municipio_id}/{localidad_id}"),
+        ).where(
+            m.entidad_id   == entidad_id,
+            m.municipio_id == municipio_id,
+            m.localidad_id == localidad_id,
+        )
+        with self.engine.connect() as conn:
+            ultima, filas, verificado = conn.execute(stmt).one()
+        referencia = _mas_reciente(ultima, verificado)
+        vigente = bool(filas) and gas_lp_vigente(referencia)
+        return referencia, filas, verificado, gas_lp_vigente_hasta(referencia) if vigente else None
+
+    def upsert_precios_gas_lp(self, registros: list[dict]) -> dict:
+        """
+        Upsert que solo reescribe permisionarios cuyo precio/marca cambió (la
+        frescura la marca `verificaciones_fuente`). Conflicto sobre el índice
+        `uq_gas_lp_clave` (capacidad NULL → 0). Devuelve {insertados, actualizados, sin_cambios}.
+        """
         if not registros:
-            return
-        base = _dialect_insert(self.model)
-        stmt = base.values(registros).on_conflict_do_update(
+            return dict(CONTEO_VACIO)
+        m = self.model
+        base = _dialect_insert(m)
+        conteo = self._upsert_masivo(registros, lambda ins: ins.on_conflict_do_update(
             index_elements=[
-                "entidad_id", "municipio_id", "localidad_id",
-                "numero_permiso", "tipo", "capacidad_recipiente",
+                m.entidad_id, m.municipio_id, m.localidad_id,
+                m.numero_permiso, m.tipo,
+                # Literal (no parámetro): debe coincidir con la expresión del índice.
+                func.coalesce(m.capacidad_recipiente, literal_column("0")),
             ],
             set_={
                 "precio":           base.excluded.precio,
                 "marca_comercial":  base.excluded.marca_comercial,
                 "fecha_extraccion": base.excluded.fecha_extraccion,
             },
-        )
-        with self.engine.begin() as conn:
-            conn.execute(stmt)
+            where=_cambio_en(m, base.excluded, ["precio", "marca_comercial"]),
+        ))
+        invalidar_respuestas("gas_lp", {
+            f"{r['entidad_id']}/{r['municipio_id']}/{r['localidad_id']}" for r in registros
+        })
+        return conteo
 
     def necesita_actualizacion(self, entidad_id: int, municipio_id: str, localidad_id: int, dias: int = 7) -> bool:
         """
         Verifica si los precios de esta localidad necesitan actualizarse.
-        True = no hay datos O son más viejos que `dias` días.
+        True = no hay datos O el registro más reciente es anterior al último sábado.
+        (`dias` se conserva por compatibilidad; la regla real es `gas_lp_vigente`.)
         """
-        with self.Session() as session:
-            # Buscar el registro más reciente para esta localidad
-            stmt = (
-                select(self.model)
-                .where(
-                    self.model.entidad_id   == entidad_id,
-                    self.model.municipio_id == municipio_id,
-                    self.model.localidad_id == localidad_id,
-                )
-                .order_by(self.model.fecha_extraccion.desc())
-                .limit(1)
-            )
-            
-            ultimo = session.execute(stmt).scalars().first()
-
-            if ultimo is None:
-                return True  # No hay datos
-
-            return not ultimo.esta_vigente()  # True si expiró
+        stmt = select(
+            func.max(self.model.fecha_extraccion),
+            _verificado_en("gas_lp", f"{entidad_id}/{municipio_id}/{localidad_id}"),
+        ).where(
+            self.model.entidad_id   == entidad_id,
+            self.model.municipio_id == municipio_id,
+            self.model.localidad_id == localidad_id,
+        )
+        with self.engine.connect() as conn:
+            ultima, verificado = conn.execute(stmt).one()
+        return not gas_lp_vigente(_mas_reciente(ultima, verificado))
 
-    def combinaciones_con_datos(self) -> list[dict]:
+    def localidades_con_datos(self) -> list[tuple[int, str, int]]:
         """
-        Combinaciones (entidad/municipio/localidad) distintas con datos en DB,
-        incluyendo nombres. Lo usa el scheduler para saber qué refrescar.
+        (entidad_id, municipio_id, localidad_id) distintos con precios en DB.
+        Solo IDs: el refresco semanal llama a la CNE por ID, sin resolver nombres.
         """
-        with self.Session() as session:
-            rows = session.execute(
-                select(
-                    self.model.entidad_id,
-                    self.model.municipio_id,
-                    self.model.localidad_id,
-                    self.model.entidad_nombre,
-                    self.model.municipio_nombre,
-                    self.model.localidad_nombre,
-                ).distinct()
+        m = self.model
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(m.entidad_id, m.municipio_id, m.localidad_id).distinct()
             ).all()
-        return [
-            {
-                "entidad_id": r.entidad_id,
-                "municipio_id": r.municipio_id,
-                "localidad_id": r.localidad_id,
-                "entidad_nombre": r.entidad_nombre,
-                "municipio_nombre": r.municipio_nombre,
-                "localidad_nombre": r.localidad_nombre,
-            }
-            for r in rows
-        ]
+        return [(e, mu, l) for e, mu, l in rows]
 
     def estado_cache(self) -> dict:
         """Última actualización y vigencia (para el health check)."""
-        return self._estado_cache("fecha_extraccion")
+        return _con_verificacion(self._estado_cache("fecha_extraccion"), "gas_lp", gas_lp_vigente)
+
+class VerificacionFuenteRepository(BaseRepository[VerificacionFuente]):
+    model = VerificacionFuente
+
+    def registrar(self, fuente: str, clave: str, filas: int) -> None:
+        """Anota que `fuente` respondió para `clave` con `filas` registros (0 = sin datos)."""
+        self.registrar_muchos(fuente, [(clave, filas)])
+
+    def registrar_muchos(self, fuente: str, verificaciones: list[tuple[str, int]]) -> None:
+        """Igual que `registrar`, para un lote de (clave, filas) en un solo upsert."""
+        if not verificaciones:
+            return
+        ahora = datetime.now(timezone.utc)
+        # Un INSERT ... ON CONFLICT no admite la misma clave dos veces: gana la última.
+        filas_por_clave = dict(verificaciones)
+        excluded = _dialect_insert(self.model).excluded
+        self._upsert_masivo([
+            {"fuente": fuente, "clave": clave, "filas": filas, "verificado_en": ahora}
+            for clave, filas in filas_por_clave.items()
+        ], lambda ins: ins.on_conflict_do_update(
+            index_elements=["fuente", "clave"],
+            set_={
+                "filas":         excluded.filas,
+                "verificado_en": excluded.verificado_en,
+            },
+        ))
+        invalidar_respuestas(fuente, filas_por_clave)
+
+    def ultima_con_datos(self, fuente: str) -> datetime | None:
+        """Verificación más reciente de `fuente` que sí trajo filas (health check)."""
+        stmt = select(func.max(self.model.verificado_en)).where(
+            self.model.fuente == fuente,
+            self.model.filas > 0,
+        )
+        with self.engine.connect() as conn:
+            return conn.execute(stmt).scalar()
+
+    def sin_datos_reciente(self, fuente: str, clave: str, ttl_h: float) -> bool:
+        """True si la última verificación trajo 0 filas y tiene menos de `ttl_h` horas."""
+        stmt = select(self.model.verificado_en, self.model.filas).where(
+            self.model.fuente == fuente,
+            self.model.clave  == clave,
+        )
+        with self.engine.connect() as conn:
+            fila = conn.execute(stmt).first()
+        if fila is None or fila.filas:
+            return False
+        edad = get_mexico_now() - to_mexico_tz(fila.verificado_en)
+        return edad.total_seconds() < ttl_h * 3600
+
+
+def _verificado_en(fuente: str, clave: str):
+    """Subconsulta escalar: última verificación CON datos de (fuente, clave)."""
+    v = VerificacionFuente
+    return (
+        select(v.verificado_en)
+        .where(v.fuente == fuente, v.clave == clave, v.filas > 0)
+        .scalar_subquery()
+    )
+
+
+def _con_verificacion(estado: dict, fuente: str, regla_vigencia) -> dict:
+    """
+    Completa `_estado_cache` con la última verificación de la fuente: con los
+    upserts que saltan filas sin cambios, la fecha de las filas ya no basta.
+    `regla_vigencia=None` deja `vigente` como venía.
+    """
+    verificado = VerificacionFuenteRepository().ultima_con_datos(fuente)
+    if verificado is None:
+        return estado
+    ultima = _mas_reciente(estado["ultima_actualizacion"], verificado)
+    return {
+        "ultima_actualizacion": ultima,
+        "vigente": regla_vigencia(ultima) if regla_vigencia else estado["vigente"],
+    }
+
 
 # ── Repositorio para Catálogo de Rutas Soriana ─────────────────
+def _correlado(stmt, correlar):
+    """`stmt.correlate(correlar)` si hay tabla externa (subconsultas dentro de un LATERAL)."""
+    return stmt if correlar is None else stmt.correlate(correlar)
+
+
+def _patron_ilike(q):
+    """'%q%' para ILIKE, con `q` texto o expresión SQL."""
+    return f"%{q}%" if isinstance(q, str) else literal("%").concat(q).concat("%")
+
+
+def _producto_a_dict(r: Supermercado) -> dict:
+    return {
+        "pid":                 r.pid,
+        "producto":            r.producto,
+        "precio":              r.precio,
+        "tienda":              r.tienda,
+        "fuente":              r.fuente,
+        "departamento":        r.departamento,
+        "categoria":           r.categoria,
+        "subcategoria":        r.subcategoria,
+        "marca":               r.marca,
+        "unidad":              r.unidad,
+        "vigencia_inicio":     r.vigencia_inicio,
+        "vigencia_fin":        r.vigencia_fin,
+        "fecha_actualizacion": r.fecha_actualizacion,
+    }
+
+
 class SupermercadoRepository(BaseRepository[Supermercado]):
     model = Supermercado
 
@@ -506,20 +1182,22 @@ class SupermercadoRepository(BaseRepository[Supermercado]):
             "fecha_actualizacion": ahora,
         }
 
-    def upsert_productos(self, productos: list[dict]) -> int:
+    def upsert_productos(self, productos: list[dict]) -> dict:
         """
         Inserta o actualiza productos en la tabla `supermercados`.
 
         Acepta los dicts tal como los producen los spiders (clave `pid_origen`),
         los normaliza a las columnas del modelo, deduplica por `pid` dentro del
-        lote y, si `ENABLE_EMBEDDINGS` está activo (solo PostgreSQL), genera y
-        guarda el embedding de cada producto.
+        lote y, si `ENABLE_EMBEDDINGS` está activo (solo PostgreSQL), reutiliza
+        los embeddings ya calculados y encola el resto (ver `_asignar_embeddings`).
+        Solo reescribe filas cuyo contenido o `embedding_hash` cambió; la
+        frescura por tienda queda en `verificaciones_fuente`.
 
         Returns:
-            int: número de productos guardados/actualizados.
+            dict: {insertados, actualizados, sin_cambios}.
         """
         if not productos:
-            return 0
+            return dict(CONTEO_VACIO)
 
         # Normalizar + dedup por pid (último gana) para no chocar en ON CONFLICT.
         ahora = get_mexico_now()
@@ -530,21 +1208,10 @@ class SupermercadoRepository(BaseRepository[Supermercado]):
                 filas_por_pid[fila["pid"]] = fila
         filas = list(filas_por_pid.values())
         if not filas:
-            return 0
+            return dict(CONTEO_VACIO)
 
         # Embeddings opcionales (gated por ENABLE_EMBEDDINGS; requiere pgvector).
-        incluir_embedding = False
-        if DB_URL.startswith("postgresql"):
-            from sina.embedder.embeddings import get_embedding_service
-            service = get_embedding_service()
-            if service is not None:
-                try:
-                    vectores = service.vectorizar_productos(filas)
-                    for fila, vec in zip(filas, vectores):
-                        fila["embedding"] = vec
-                    incluir_embedding = True
-                except Exception as e:
-                    log.error("Error generando embeddings de productos: %s", e)
+        incluir_embedding = self._asignar_embeddings(filas)
 
         base = _dialect_insert(self.model)
         set_ = {
@@ -555,16 +1222,21 @@ class SupermercadoRepository(BaseRepository[Supermercado]):
             "subcategoria":        base.excluded.subcategoria,
             "fecha_actualizacion": base.excluded.fecha_actualizacion,
         }
+        cambio = _cambio_en(self.model, base.excluded,
+                            ["producto", "precio", "departamento", "categoria", "subcategoria"])
         if incluir_embedding:
             set_["embedding"] = base.excluded.embedding
+            set_["embedding_hash"] = base.excluded.embedding_hash
+            cambio = cambio | self.model.embedding_hash.is_distinct_from(base.excluded.embedding_hash)
 
-        stmt = base.values(filas).on_conflict_do_update(
+        conteo, sin_vector = self._upsert_masivo_con_retorno(filas, lambda ins: ins.on_conflict_do_update(
             index_elements=["pid"],
             set_=set_,
-        )
-        with self.engine.begin() as conn:
-            conn.execute(stmt)
-        return len(filas)
+            where=cambio,
+        ), self._id_sin_vector() if incluir_embedding else None)
+        self._encolar_ids(sin_vector)
+        self._registrar_verificacion(filas)
+        return conteo
 
     @staticmethod
     def _normalizar_flyer_producto(
@@ -619,17 +1291,22 @@ class SupermercadoRepository(BaseRepository[Supermercado]):
         fuente: str = "flyer",
         vigencia_inicio=None,
         vigencia_fin=None,
-    ) -> int:
+    ) -> dict:
         """
         Inserta/actualiza productos provenientes de un volante (VLM).
 
         A diferencia de `upsert_productos` (scraping, conflicto por `pid`), aquí
         no hay `pid`: el dedup es por la clave compuesta
         (tienda, producto, fuente, vigencia_inicio). La vigencia es a nivel flyer
-        y se aplica a todos los productos. Genera embeddings igual que el scraping.
+        y se aplica a todos los productos. Los embeddings siguen el mismo camino
+        que el scraping (reutilizar o encolar) y, como él, solo reescribe filas
+        que cambiaron.
+
+        Returns:
+            dict: {insertados, actualizados, sin_cambios}.
         """
         if not productos:
-            return 0
+            return dict(CONTEO_VACIO)
 
         ahora = get_mexico_now()
         filas_por_clave: dict[tuple, dict] = {}
@@ -642,20 +1319,9 @@ class SupermercadoRepository(BaseRepository[Supermercado]):
                 filas_por_clave[clave] = fila
         filas = list(filas_por_clave.values())
         if not filas:
-            return 0
+            return dict(CONTEO_VACIO)
 
-        incluir_embedding = False
-        if DB_URL.startswith("postgresql"):
-            from sina.embedder.embeddings import get_embedding_service
-            service = get_embedding_service()
-            if service is not None:
-                try:
-                    vectores = service.vectorizar_productos(filas)
-                    for fila, vec in zip(filas, vectores):
-                        fila["embedding"] = vec
-                    incluir_embedding = True
-                except Exception as e:
-                    log.error("Error generando embeddings de flyer: %s", e)
+        incluir_embedding = self._asignar_embeddings(filas)
 
         base = _dialect_insert(self.model)
         set_ = {
@@ -668,18 +1334,354 @@ class SupermercadoRepository(BaseRepository[Supermercado]):
             "vigencia_fin":        base.excluded.vigencia_fin,
             "fecha_actualizacion": base.excluded.fecha_actualizacion,
         }
+        cambio = _cambio_en(self.model, base.excluded, [
+            "precio", "departamento", "categoria", "subcategoria",
+            "marca", "unidad", "vigencia_fin",
+        ])
         if incluir_embedding:
             set_["embedding"] = base.excluded.embedding
+            set_["embedding_hash"] = base.excluded.embedding_hash
+            cambio = cambio | self.model.embedding_hash.is_distinct_from(base.excluded.embedding_hash)
 
-        stmt = base.values(filas).on_conflict_do_update(
+        conteo, sin_vector = self._upsert_masivo_con_retorno(filas, lambda ins: ins.on_conflict_do_update(
             index_elements=["tienda", "producto", "fuente", "vigencia_inicio"],
             set_=set_,
+            where=cambio,
+        ), self._id_sin_vector() if incluir_embedding else None)
+        self._encolar_ids(sin_vector)
+        self._registrar_verificacion(filas)
+        return conteo
+
+    def _asignar_embeddings(self, filas: list[dict]) -> bool:
+        """
+        Pone `embedding` + `embedding_hash` a cada fila. Los textos cuyo hash
+        (modelo|dim|texto sin precio) ya existe en la tabla copian el vector
+        guardado — de la misma fila o de otra con el mismo texto (p. ej. el
+        mismo producto en el volante de la semana siguiente). Los nuevos, con
+        EMBEDDINGS_ASINCRONOS, quedan en NULL (embedding y hash) para que el
+        upsert los encole; sin él se vectorizan aquí en un solo batch.
+
+        False si los embeddings no aplican (SQLite, ENABLE_EMBEDDINGS apagado) o
+        fallaron: entonces las filas no llevan columnas de embedding y el
+        upsert deja intactos los vectores existentes.
+        """
+        if not DB_URL.startswith("postgresql"):
+            return False
+        from sina.embedder.embeddings import get_embedding_service
+        service = get_embedding_service()
+        if service is None:
+            return False
+        try:
+            for f in filas:
+                f["embedding_hash"] = service.hash_producto(f)
+            guardados = self._vectores_por_hash({f["embedding_hash"] for f in filas})
+            # Un texto nuevo repetido en el lote se vectoriza una sola vez.
+            nuevos = {f["embedding_hash"]: f for f in filas if f["embedding_hash"] not in guardados}
+            if nuevos and not EMBEDDINGS_ASINCRONOS:
+                vectores = service.vectorizar_productos(list(nuevos.values()))
+                guardados.update(zip(nuevos.keys(), vectores))
+            for f in filas:
+                f["embedding"] = guardados.get(f["embedding_hash"])
+                if f["embedding"] is None:
+                    f["embedding_hash"] = None
+            log.info("Embeddings: %d textos nuevos %s, %d productos reutilizan vector (de %d)",
+                     len(nuevos), "a la cola" if EMBEDDINGS_ASINCRONOS else "vectorizados",
+                     sum(f["embedding"] is not None for f in filas), len(filas))
+            return True
+        except Exception as e:
+            log.error("Error generando embeddings de productos: %s", e)
+            for f in filas:
+                f.pop("embedding", None)
+                f.pop("embedding_hash", None)
+            return False
+
+    def _vectores_por_hash(self, hashes: set[str]) -> dict:
+        """{embedding_hash: vector} de los hashes que ya tienen vector guardado (solo PostgreSQL)."""
+        m = self.model
+        encontrados: dict = {}
+        lista = list(hashes)
+        with self.engine.connect() as conn:
+            for i in range(0, len(lista), 1000):
+                stmt = (
+                    select(m.embedding_hash, m.embedding)
+                    .where(m.embedding_hash.in_(lista[i:i + 1000]), m.embedding.is_not(None))
+                    .distinct(m.embedding_hash)
+                )
+                encontrados.update(conn.execute(stmt).tuples().all())
+        return encontrados
+
+    def _id_sin_vector(self):
+        """RETURNING del upsert: el `id` de las filas que quedaron sin vector (None las demás)."""
+        return case((self.model.embedding.is_(None), self.model.id))
+
+    def _encolar_ids(self, ids: list[int | None], lote: int = 50_000) -> int:
+        """
+        Encola los productos recién escritos sin vector (los `id` que devolvió
+        el upsert; los None se ignoran). Es lo que usa el scraping: no recorre
+        `supermercados`. Idempotente. Devuelve cuántos entraron.
+        """
+        ids = [i for i in ids if i is not None]
+        encolados = 0
+        for inicio in range(0, len(ids), lote):
+            with self.engine.begin() as conn:
+                encolados += conn.execute(
+                    pg_insert(ColaEmbedding)
+                    .values([{"supermercado_id": i} for i in ids[inicio:inicio + lote]])
+                    .on_conflict_do_nothing(index_elements=["supermercado_id"])
+                ).rowcount
+        return encolados
+
+    def encolar_embeddings(self, todos: bool = False, lote: int = 50_000) -> int:
+        """
+        Encola los productos sin vector o sin hash — o TODOS con `todos=True`
+        (tras cambiar de modelo; el worker salta los que ya están al día).
+        Recorre la tabla entera: es para `backfill`; el scraping encola solo
+        los `id` que devuelve su upsert (`_encolar_ids`).
+        Recorre `supermercados` por rangos de `id` (keyset, una transacción
+        corta por rango), no con un INSERT gigante. Idempotente: lo que ya está
+        en la cola no se duplica. Devuelve cuántos entraron. Solo PostgreSQL.
+        """
+        m = self.model
+        filtros = [] if todos else [m.embedding.is_(None) | m.embedding_hash.is_(None)]
+        encolados, ultimo = 0, 0
+        while True:
+            with self.engine.begin() as conn:
+                rango = select(m.id).where(m.id > ultimo, *filtros).order_by(m.id).limit(lote).subquery()
+                hasta = conn.execute(select(func.max(rango.c.id))).scalar()
+                if hasta is None:
+                    return encolados
+                stmt = (
+                    pg_insert(ColaEmbedding)
+                    .from_select(["supermercado_id"], select(m.id).where(m.id > ultimo, m.id <= hasta, *filtros))
+                    .on_conflict_do_nothing(index_elements=["supermercado_id"])
+                )
+                encolados += conn.execute(stmt).rowcount
+            ultimo = hasta
+
+    def pendientes_embeddings(self) -> int:
+        """Productos en la cola que el worker todavía reintentará."""
+        with self.Session() as session:
+            return session.scalar(
+                select(func.count()).select_from(ColaEmbedding)
+                .where(ColaEmbedding.intentos < EMBEDDINGS_COLA_MAX_INTENTOS)
+            ) or 0
+
+    def procesar_cola_embeddings(self, service, lote: int = EMBEDDINGS_COLA_LOTE) -> dict:
+        """
+        Toma hasta `lote` productos de la cola con `FOR UPDATE SKIP LOCKED`
+        (otro worker toma los siguientes), los vectoriza en un solo batch —
+        reutilizando vectores por `embedding_hash` — y los saca de la cola en la
+        misma transacción. Si el modelo falla, el lote se queda en la cola con
+        `intentos + 1`; tras EMBEDDINGS_COLA_MAX_INTENTOS ya no se reintenta.
+
+        Solo se bloquean las filas de la COLA (`of=ColaEmbedding`): los upserts
+        del scraping sobre esos productos no esperan a que termine el modelo.
+        Por eso la escritura del vector es condicional a que el texto del
+        producto no haya cambiado mientras tanto; los que sí cambiaron se
+        quedan en la cola para el siguiente lote, con su texto nuevo.
+
+        Returns:
+            dict: {procesados, vectorizados, reutilizados, fallidos}; todo en 0
+            si la cola está vacía.
+        """
+        m, c = self.model, ColaEmbedding
+        resumen = {"procesados": 0, "vectorizados": 0, "reutilizados": 0, "fallidos": 0}
+        with self.Session() as session:
+            filas = session.execute(
+                select(m.id, m.producto, m.tienda, m.marca, m.categoria, m.embedding_hash,
+                       m.embedding.is_not(None).label("con_vector"))
+                .join(c, c.supermercado_id == m.id)
+                .where(c.intentos < EMBEDDINGS_COLA_MAX_INTENTOS)
+                .order_by(c.encolado_en, c.supermercado_id)
+                .limit(lote)
+                .with_for_update(skip_locked=True, of=c)
+            ).all()
+            if not filas:
+                return resumen
+            ids = [f.id for f in filas]
+            datos = {f.id: f._asdict() for f in filas}
+            # Los que ya tienen el vector del texto y modelo actuales solo salen de la cola.
+            pendientes = {}
+            for f in filas:
+                h = service.hash_producto(datos[f.id])
+                if not (f.con_vector and f.embedding_hash == h):
+                    pendientes[f.id] = h
+            try:
+                guardados = self._vectores_por_hash(set(pendientes.values()))
+                nuevos = {h: datos[i] for i, h in pendientes.items() if h not in guardados}
+                if nuevos:
+                    guardados.update(zip(nuevos.keys(), service.vectorizar_productos(list(nuevos.values()))))
+            except Exception as e:
+                log.error("Cola de embeddings: falló un lote de %d productos: %s", len(ids), e)
+                session.rollback()
+                session.execute(
+                    update(c).where(c.supermercado_id.in_(ids))
+                    .values(intentos=c.intentos + 1, ultimo_error=str(e)[:500])
+                )
+                session.commit()
+                resumen["fallidos"] = len(ids)
+                return resumen
+
+            escritos: set[int] = set()
+            if pendientes:
+                escritos = set(_actualizar_por_copy(session.connection(), m, [
+                    {"id": i, "embedding": guardados[h], "embedding_hash": h,
+                     **{k: datos[i][k] for k in ("producto", "tienda", "marca", "categoria")}}
+                    for i, h in pendientes.items()
+                ], sin_cambio=("producto", "tienda", "marca", "categoria")))
+            listos = [i for i in ids if i not in pendientes or i in escritos]
+            session.execute(delete(c).where(c.supermercado_id.in_(listos)))
+            session.commit()
+
+        if len(listos) < len(ids):
+            log.info("Cola de embeddings: %d productos cambiaron durante el lote; se reintentan",
+                     len(ids) - len(listos))
+        resumen["procesados"] = len(listos)
+        resumen["vectorizados"] = len(nuevos)
+        resumen["reutilizados"] = sum(h not in nuevos for h in pendientes.values())
+        return resumen
+
+    @staticmethod
+    def _registrar_verificacion(filas: list[dict]) -> None:
+        """Frescura por tienda (barata) aunque ninguna fila haya cambiado."""
+        por_tienda: dict[str, int] = {}
+        for f in filas:
+            por_tienda[f["tienda"]] = por_tienda.get(f["tienda"], 0) + 1
+        VerificacionFuenteRepository().registrar_muchos("supermercados", list(por_tienda.items()))
+
+    def _filtros_busqueda(self, tienda, departamento, categoria, fuente, solo_vigentes) -> list:
+        """Filtros duros de `buscar`, compartidos por todas las ramas de la búsqueda."""
+        m = self.model
+        filtros = []
+        if tienda:
+            filtros.append(m.tienda.ilike(tienda))
+        if departamento:
+            filtros.append(m.departamento.ilike(departamento))
+        if categoria:
+            filtros.append(m.categoria.ilike(categoria))
+        if fuente:
+            filtros.append(m.fuente.ilike(fuente))
+        if solo_vigentes:
+            hoy = get_mexico_now().date()
+            filtros.append(m.vigencia_inicio.is_(None) | (m.vigencia_inicio <= hoy))
+            filtros.append(m.vigencia_fin.is_(None) | (m.vigencia_fin >= hoy))
+        return filtros
+
+    def _candidatos_lexicos(self, q, filtros: list, n: int, correlar=None):
+        """
+        Rama léxica (PostgreSQL): hasta `n` productos que coinciden con `q` por
+        texto completo (`busqueda @@ tsquery`, stemming y sin acentos), por
+        subcadena o por trigramas (`q <% producto`, índice GIN trgm). Rango por
+        `ts_rank_cd` y, a igualdad, `word_similarity` (1 = mejor). Devuelve un
+        SELECT (id, rango).
+
+        `q` es el texto o, en `buscar_muchos`, la columna de consultas de
+        `correlar` (la subconsulta se correlaciona con ella dentro del LATERAL).
+        """
+        m = self.model
+        consulta = _tsquery(q)
+        relevancia = func.ts_rank_cd(_BUSQUEDA, consulta)
+        parecido = func.word_similarity(q, m.producto)
+        texto = literal(q) if isinstance(q, str) else q
+        top = _correlado(
+            select(m.id, relevancia.label("relevancia"), parecido.label("parecido"))
+            .where(*filtros, or_(
+                _BUSQUEDA.op("@@")(consulta),
+                m.producto.ilike(_patron_ilike(q)),
+                texto.op("<%")(m.producto),
+            ))
+            .order_by(relevancia.desc(), parecido.desc(), m.precio.asc())
+            .limit(n),
+            correlar,
+        ).subquery()
+        return _correlado(select(
+            top.c.id,
+            func.row_number().over(
+                order_by=(top.c.relevancia.desc(), top.c.parecido.desc())
+            ).label("rango"),
+        ), correlar)
+
+    def _consulta_fts(self, q: str, filtros: list, limit: int):
+        """
+        Modo "fts": coincidencias de texto completo ordenadas por relevancia
+        (PostgreSQL: `ts_rank_cd` sobre el índice GIN; SQLite: `bm25` de FTS5
+        con los mismos pesos producto > marca > categoría). None si `q` no
+        tiene términos buscables.
+        """
+        m = self.model
+        if self.engine.dialect.name == "postgresql":
+            consulta = _tsquery(q)
+            return (
+                select(m)
+                .where(*filtros, _BUSQUEDA.op("@@")(consulta))
+                .order_by(func.ts_rank_cd(_BUSQUEDA, consulta).desc(), m.precio.asc())
+                .limit(limit)
+            )
+        expresion = consulta_fts5(q)
+        if expresion is None:
+            return None
+        coincidencias = (
+            text(
+                "SELECT rowid AS id, bm25(supermercados_fts, 10.0, 5.0, 2.0) AS rango "
+                "FROM supermercados_fts WHERE supermercados_fts MATCH :consulta"
+            )
+            .bindparams(consulta=expresion)
+            .columns(column("id", Integer), column("rango", Float))
+            .subquery("fts")
+        )
+        return (
+            select(m)
+            .join(coincidencias, m.id == coincidencias.c.id)
+            .where(*filtros)
+            .order_by(coincidencias.c.rango, m.precio.asc())   # bm25: menor = mejor
+            .limit(limit)
+        )
+
+    def _candidatos_semanticos(self, vector, filtros: list, n: int, correlar=None):
+        """
+        Rama semántica: los `n` vecinos más cercanos por coseno (índice ANN),
+        con su rango (1 = más cercano). Devuelve un SELECT (id, rango). El
+        ORDER BY ... LIMIT va en la subconsulta para que use el índice.
+        `vector` es la lista o, con `correlar`, la columna de vectores.
+        """
+        m = self.model
+        distancia = m.embedding.cosine_distance(vector)
+        top = _correlado(
+            select(m.id, distancia.label("distancia"))
+            .where(*filtros, m.embedding.is_not(None))
+            .order_by(distancia)
+            .limit(n),
+            correlar,
+        ).subquery()
+        return _correlado(select(
+            top.c.id,
+            func.row_number().over(order_by=top.c.distancia).label("rango"),
+        ), correlar)
+
+    @staticmethod
+    def _fusion_rrf(lexico, semantico, correlar=None):
+        """
+        Reciprocal Rank Fusion: puntaje = Σ 1 / (RRF_K + rango) sobre las
+        ramas donde aparece el producto. No mezcla escalas (similitud de
+        trigramas vs. distancia coseno), solo posiciones; un producto que sale
+        arriba en ambas ramas gana a uno que solo sale en una. Devuelve un
+        SELECT (id, puntaje) sin ordenar.
+        """
+        puntaje = (
+            func.coalesce(literal(1.0) / (RRF_K + lexico.c.rango), 0)
+            + func.coalesce(literal(1.0) / (RRF_K + semantico.c.rango), 0)
+        )
+        return _correlado(
+            select(func.coalesce(lexico.c.id, semantico.c.id).label("id"), puntaje.label("puntaje"))
+            .select_from(lexico.join(semantico, lexico.c.id == semantico.c.id, full=True)),
+            correlar,
         )
-        with self.engine.begin() as conn:
-            conn.execute(stmt)
-        return len(filas)
 
-    def buscar(
+    def buscar(self, q: str | None = None, **kwargs) -> list[dict]:
+        """Productos que casan con `q` y los filtros; ver `buscar_con_respaldo`."""
+        return self.buscar_con_respaldo(q, **kwargs)[0]
+
+    def buscar_con_respaldo(
         self,
         q: str | None = None,
         tienda: str | None = None,
@@ -688,84 +1690,290 @@ class SupermercadoRepository(BaseRepository[Supermercado]):
         fuente: str | None = None,
         solo_vigentes: bool = False,
         limit: int = 30,
-    ) -> list[dict]:
+        ef_search: int | None = None,
+        probes: int | None = None,
+        modo: str | None = None,
+    ) -> tuple[list[dict], bool]:
         """
         Busca productos con filtros duros (tienda/departamento/categoría/fuente).
 
-        Si `q` viene y hay embeddings disponibles (PostgreSQL + ENABLE_EMBEDDINGS),
-        ordena por similitud coseno sobre pgvector. Si no, cae a búsqueda de texto
-        (ILIKE sobre el nombre) ordenada por precio ascendente.
+        Con `q`, según `modo` (default `BUSQUEDA_MODO`):
+          - "hibrido": rama léxica (nombre/trigramas) + rama semántica (ANN
+            sobre pgvector), cada una limitada a `BUSQUEDA_CANDIDATOS`, fusionadas
+            por RRF. Las consultas de marca exacta ("Coca Cola 600ml") quedan
+            arriba por la rama léxica; las difusas ganan por la semántica.
+          - "semantico": solo similitud coseno.
+          - "fts": texto completo en español (stemming, sin acentos) sobre
+            producto/marca/categoría, ordenado por relevancia. No requiere
+            embeddings (en SQLite usa FTS5).
+          - "texto": ILIKE sobre el nombre, ordenado por precio ascendente.
+          - "auto": "hibrido" si hay embeddings (PostgreSQL + ENABLE_EMBEDDINGS),
+            si no "texto".
+        Si los embeddings fallan, cualquier modo cae a "texto" y el segundo
+        elemento de la tupla es True (resultado de respaldo, no el del modo pedido).
 
         `solo_vigentes=True` descarta promos de flyer ya vencidas o no iniciadas;
         las filas sin vigencia (scraping, precio permanente) siempre cuentan.
+
+        `ef_search` (HNSW) / `probes` (IVFFlat) ajustan recall vs. latencia del
+        índice ANN solo para esta consulta (default: HNSW_EF_SEARCH / IVFFLAT_PROBES).
         """
         limit = max(1, min(int(limit), 100))
+        modo = (modo or BUSQUEDA_MODO).strip().lower()
+        if modo not in MODOS_BUSQUEDA:
+            raise ValueError(f"modo de búsqueda desconocido: '{modo}' (usa {', '.join(MODOS_BUSQUEDA)})")
+        filtros = self._filtros_busqueda(tienda, departamento, categoria, fuente, solo_vigentes)
 
         with self.Session() as session:
-            stmt = select(self.model)
-            if tienda:
-                stmt = stmt.where(self.model.tienda.ilike(tienda))
-            if departamento:
-                stmt = stmt.where(self.model.departamento.ilike(departamento))
-            if categoria:
-                stmt = stmt.where(self.model.categoria.ilike(categoria))
-            if fuente:
-                stmt = stmt.where(self.model.fuente.ilike(fuente))
-            if solo_vigentes:
-                hoy = get_mexico_now().date()
-                stmt = stmt.where(
-                    self.model.vigencia_inicio.is_(None) | (self.model.vigencia_inicio <= hoy),
-                    self.model.vigencia_fin.is_(None) | (self.model.vigencia_fin >= hoy),
-                )
-
-            usar_vector = False
-            if q:
-                if DB_URL.startswith("postgresql"):
-                    from sina.embedder.embeddings import get_embedding_service
-                    service = get_embedding_service()
-                    if service is not None:
-                        try:
-                            vector = service.vectorizar_consulta(q)
+            stmt, respaldo = None, False
+            if q and modo == "fts":
+                stmt = self._consulta_fts(q, filtros, limit)
+            elif q and modo != "texto" and DB_URL.startswith("postgresql"):
+                from sina.embedder.embeddings import get_embedding_service
+                service = get_embedding_service()
+                if service is not None:
+                    try:
+                        vector = service.vectorizar_consulta(q)
+                        n = max(limit, BUSQUEDA_CANDIDATOS)
+                        if modo == "semantico":
+                            _ajustar_ann(session, limit, ef_search, probes)
                             stmt = (
-                                stmt.where(self.model.embedding.is_not(None))
+                                select(self.model)
+                                .where(*filtros, self.model.embedding.is_not(None))
                                 .order_by(self.model.embedding.cosine_distance(vector))
+                                .limit(limit)
                             )
-                            usar_vector = True
-                        except Exception as e:
-                            log.error("Error en búsqueda vectorial, usando texto: %s", e)
-                if not usar_vector:
-                    stmt = stmt.where(self.model.producto.ilike(f"%{q}%")).order_by(
-                        self.model.precio.asc()
-                    )
-            else:
-                stmt = stmt.order_by(self.model.precio.asc())
+                        else:
+                            _ajustar_ann(session, n, ef_search, probes)
+                            fusion = self._fusion_rrf(
+                                self._candidatos_lexicos(q, filtros, n).cte("lexico"),
+                                self._candidatos_semanticos(vector, filtros, n).cte("semantico"),
+                            ).subquery()
+                            stmt = (
+                                select(self.model)
+                                .join(fusion, self.model.id == fusion.c.id)
+                                .order_by(fusion.c.puntaje.desc(), self.model.precio.asc())
+                                .limit(limit)
+                            )
+                    except Exception as e:
+                        log.error("Error en búsqueda vectorial, usando texto: %s", e)
+                        stmt, respaldo = None, True
+            if stmt is None:
+                stmt = select(self.model).where(*filtros)
+                if q:
+                    stmt = stmt.where(self.model.producto.ilike(f"%{q}%"))
+                stmt = stmt.order_by(self.model.precio.asc()).limit(limit)
 
-            rows = session.execute(stmt.limit(limit)).scalars().all()
-            return [
-                {
-                    "pid":                 r.pid,
-                    "producto":            r.producto,
-                    "precio":              r.precio,
-                    "tienda":              r.tienda,
-                    "fuente":              r.fuente,
-                    "departamento":        r.departamento,
-                    "categoria":           r.categoria,
-                    "subcategoria":        r.subcategoria,
-                    "marca":               r.marca,
-                    "unidad":              r.unidad,
-                    "vigencia_inicio":     r.vigencia_inicio,
-                    "vigencia_fin":        r.vigencia_fin,
-                    "fecha_actualizacion": r.fecha_actualizacion,
-                }
-                for r in rows
-            ]
+            rows = session.execute(stmt).scalars().all()
+            return [_producto_a_dict(r) for r in rows], respaldo
+
+    def buscar_muchos(
+        self,
+        consultas: list[str],
+        tienda: str | None = None,
+        departamento: str | None = None,
+        categoria: str | None = None,
+        fuente: str | None = None,
+        solo_vigentes: bool = False,
+        limit: int = 5,
+        modo: str | None = None,
+    ) -> list[list[dict]]:
+        """
+        `buscar` para varias consultas a la vez (lista del súper, canasta
+        básica): devuelve el top-`limit` de cada consulta, en el mismo orden.
+
+        En PostgreSQL son dos viajes en total, sin importar cuántas consultas:
+        un batch de embeddings (`vectorizar_consultas`, con caché) y UNA
+        sentencia SQL — `VALUES (i, q, vector)` con un `JOIN LATERAL` que corre
+        la misma búsqueda que `buscar` (híbrida/semántica/fts/texto) por fila.
+        En SQLite (sin LATERAL ni embeddings) se llama a `buscar` por consulta.
+        """
+        if not consultas:
+            return []
+        limit = max(1, min(int(limit), 100))
+        modo = (modo or BUSQUEDA_MODO).strip().lower()
+        if modo not in MODOS_BUSQUEDA:
+            raise ValueError(f"modo de búsqueda desconocido: '{modo}' (usa {', '.join(MODOS_BUSQUEDA)})")
+        unicas = list(dict.fromkeys(str(c).strip() for c in consultas))
+
+        if self.engine.dialect.name != "postgresql":
+            por_consulta = {
+                q: self.buscar(q=q, tienda=tienda, departamento=departamento, categoria=categoria,
+                               fuente=fuente, solo_vigentes=solo_vigentes, limit=limit, modo=modo)
+                for q in unicas
+            }
+            return [por_consulta[str(c).strip()] for c in consultas]
+
+        vectores = None
+        if modo in ("auto", "hibrido", "semantico"):
+            from sina.embedder.embeddings import get_embedding_service
+            service = get_embedding_service()
+            if service is not None:
+                try:
+                    vectores = service.vectorizar_consultas(unicas)
+                except Exception as e:
+                    log.error("Error vectorizando consultas, usando texto: %s", e)
+            if vectores is None:
+                modo = "texto"
+        filtros = self._filtros_busqueda(tienda, departamento, categoria, fuente, solo_vigentes)
+
+        m = self.model
+        tabla = values(
+            column("i", Integer), column("q", String), column("v", Vector(EMBEDDING_DIM)),
+            name="consultas",
+        ).data([(i, q, vectores[i] if vectores else None) for i, q in enumerate(unicas)])
+        q_col, v_col = tabla.c.q, cast(tabla.c.v, Vector(EMBEDDING_DIM))   # VALUES llega como texto
+        n = max(limit, BUSQUEDA_CANDIDATOS)
+
+        # Por consulta: (id, orden) de sus mejores `limit` productos.
+        if modo == "semantico":
+            distancia = m.embedding.cosine_distance(v_col)
+            por_consulta = (
+                select(m.id, func.row_number().over(order_by=distancia).label("orden"))
+                .where(*filtros, m.embedding.is_not(None))
+                .order_by(distancia)
+                .limit(limit)
+            )
+        elif modo in ("auto", "hibrido"):
+            fusion = self._fusion_rrf(
+                self._candidatos_lexicos(q_col, filtros, n, tabla).subquery("lexico"),
+                self._candidatos_semanticos(v_col, filtros, n, tabla).subquery("semantico"),
+                tabla,
+            ).subquery("fusion")
+            orden = (fusion.c.puntaje.desc(), m.precio.asc())
+            por_consulta = (
+                select(fusion.c.id, func.row_number().over(order_by=orden).label("orden"))
+                .join(m, m.id == fusion.c.id)
+                .order_by(*orden)
+                .limit(limit)
+            )
+        elif modo == "fts":
+            consulta = _tsquery(q_col)
+            orden = (func.ts_rank_cd(_BUSQUEDA, consulta).desc(), m.precio.asc())
+            por_consulta = (
+                select(m.id, func.row_number().over(order_by=orden).label("orden"))
+                .where(*filtros, _BUSQUEDA.op("@@")(consulta))
+                .order_by(*orden)
+                .limit(limit)
+            )
+        else:
+            por_consulta = (
+                select(m.id, func.row_number().over(order_by=m.precio.asc()).label("orden"))
+                .where(*filtros, m.producto.ilike(_patron_ilike(q_col)))
+                .order_by(m.precio.asc())
+                .limit(limit)
+            )
+        lateral = por_consulta.correlate(tabla).lateral("por_consulta")
+        stmt = (
+            select(tabla.c.i, m)
+            .select_from(tabla.join(lateral, true()).join(m, m.id == lateral.c.id))
+            .order_by(tabla.c.i, lateral.c.orden)
+        )
+
+        resultados: dict[str, list[dict]] = {q: [] for q in unicas}
+        with self.Session() as session:
+            if vectores is not None:
+                _ajustar_ann(session, n, None, None)
+            for i, r in session.execute(stmt).all():
+                resultados[unicas[i]].append(_producto_a_dict(r))
+        return [resultados[str(c).strip()] for c in consultas]
 
     def estado_cache(self) -> dict:
         """
         Última actualización (para el health check). No hay regla de vigencia
         definida para supermercados todavía, así que `vigente` queda en None.
         """
-        return self._estado_cache("fecha_actualizacion", evaluar_vigencia=False)
+        return _con_verificacion(
+            self._estado_cache("fecha_actualizacion", evaluar_vigencia=False), "supermercados", None
+        )
+
+    def version_catalogo(self) -> tuple[datetime | None, int | None, int]:
+        """
+        (último cambio, id más alto, productos esperando embedding): versión del
+        catálogo para ETag/304 de las búsquedas, sin cargar filas. `max()` sale
+        de los índices; la cola entra porque cada vector que llega puede cambiar
+        el orden de una búsqueda semántica sin tocar `fecha_actualizacion`.
+        """
+        m = self.model
+        stmt = select(
+            select(func.max(m.fecha_actualizacion)).scalar_subquery(),
+            select(func.max(m.id)).scalar_subquery(),
+            select(func.count()).select_from(ColaEmbedding).scalar_subquery(),
+        )
+        with self.engine.connect() as conn:
+            ultima, max_id, pendientes = conn.execute(stmt).one()
+        return ultima, max_id, pendientes
+
+
+class CanastaMejorRepository(BaseRepository[CanastaMejor]):
+    model = CanastaMejor
+
+    def refrescar(self, tiendas: list[str] | None = None) -> int:
+        """
+        Recalcula el mejor producto por rubro de `tiendas` (default: todas las
+        que tienen productos): una `buscar_muchos` por tienda con el primer
+        término de cada rubro (igual que `armar_canasta`), solo promos vigentes,
+        y el más barato de sus mejores coincidencias. Reemplaza las filas de
+        esas tiendas en una transacción. Devuelve cuántas filas quedaron.
+        """
+        from sina.config.canasta import CANASTA_BASICA
+
+        productos = SupermercadoRepository()
+        if tiendas is None:
+            with self.Session() as session:
+                tiendas = session.scalars(select(Supermercado.tienda).distinct()).all()
+        tiendas = [t for t in tiendas if t]
+        if not tiendas:
+            return 0
+
+        terminos = [t[0] for t in CANASTA_BASICA.values()]
+        ahora = datetime.now(timezone.utc)
+        filas = []
+        for tienda in tiendas:
+            resultados = productos.buscar_muchos(terminos, tienda=tienda, solo_vigentes=True, limit=5)
+            for item, candidatos in zip(CANASTA_BASICA, resultados):
+                if not candidatos:
+                    continue
+                mejor = min(candidatos, key=lambda f: f["precio"])
+                filas.append({
+                    "item": item, "tienda": tienda,
+                    "producto": mejor["producto"], "precio": mejor["precio"],
+                    "pid": mejor["pid"], "marca": mejor["marca"], "unidad": mejor["unidad"],
+                    "fuente": mejor["fuente"], "vigencia_fin": mejor["vigencia_fin"],
+                    "actualizado_en": ahora,
+                })
+
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.model).where(self.model.tienda.in_(tiendas)))
+            if filas:
+                conn.execute(insert(self.model), filas)
+        log.info("Canasta: %d rubros precalculados en %d tiendas", len(filas), len(tiendas))
+        return len(filas)
+
+    def mejores(self, tienda: str | None = None) -> dict[str, list[dict]]:
+        """
+        {rubro: [mejor producto de cada tienda, del más barato al más caro]}.
+        Descarta promos ya vencidas. Vacío si la tabla nunca se ha refrescado.
+        """
+        m = self.model
+        hoy = get_mexico_now().date()
+        stmt = select(m).where(m.vigencia_fin.is_(None) | (m.vigencia_fin >= hoy))
+        if tienda:
+            stmt = stmt.where(m.tienda.ilike(tienda))
+        por_item: dict[str, list[dict]] = {}
+        with self.Session() as session:
+            for r in session.scalars(stmt.order_by(m.item, m.precio.asc())):
+                por_item.setdefault(r.item, []).append({
+                    "tienda":         r.tienda,
+                    "producto":       r.producto,
+                    "precio":         r.precio,
+                    "marca":          r.marca,
+                    "unidad":         r.unidad,
+                    "fuente":         r.fuente,
+                    "vigencia_fin":   r.vigencia_fin,
+                    "actualizado_en": r.actualizado_en,
+                })
+        return por_item
 
 
 class CatalogoRepository(BaseRepository[CatalogoConfig]):
@@ -9,6 +9,7 @@ from sina.db.models import (
     EntidadFederativa, Municipio,
     CatalogoConfig,
 )
+from sina.db.indice_ubicaciones import difundir_cambio_ubicaciones, recargar_indice_ubicaciones
 from sina.config.paths import (
     CATALOGO_MUNICIPIOS_PATH, CLASES_JSON_PATH,
     SORIANA_CONFIG_PATH, DELSOL_CONFIG_PATH, BENAVIDES_CONFIG_PATH,
@@ -83,6 +84,11 @@ def seed_catalogo_municipios(session: Session) -> dict:
 
     session.commit()
 
+    # El índice en memoria de ubicaciones sale de estas tablas: re-sembrar lo invalida.
+    if entidades_insertadas or municipios_insertados:
+        recargar_indice_ubicaciones()
+        difundir_cambio_ubicaciones()
+
     logger.info(
         f"Seeder completado — "
         f"Entidades: {entidades_insertadas} | "
@@ -1,6 +1,23 @@
+import math
+import os
 from abc import ABC, abstractmethod
 from typing import List
 
+# Dimensión FIJA de los vectores guardados (columna `vector(EMBEDDING_DIM)`).
+# Qwen3-Embedding entrega 4096 dims, más de lo que indexa HNSW (2000), pero está
+# entrenado con MRL (Matryoshka): los primeros N componentes, renormalizados,
+# son un embedding válido de N dims. 1024 conserva casi toda la calidad.
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "1024"))
+
+
+def recortar_mrl(vector: List[float], dim: int = EMBEDDING_DIM) -> List[float]:
+    """Trunca a `dim` componentes (MRL) y renormaliza a norma 1 (distancia coseno)."""
+    if len(vector) < dim:
+        raise ValueError(f"El modelo devolvió {len(vector)} dims; EMBEDDING_DIM={dim} es mayor")
+    recorte = vector[:dim]
+    norma = math.sqrt(sum(x * x for x in recorte))
+    return [x / norma for x in recorte] if norma else list(recorte)
+
 
 # --- 1. INTERFAZ ESTRATÉGICA ---
 class EmbeddingProvider(ABC):
@@ -15,4 +32,4 @@ class EmbeddingProvider(ABC):
         `generate_embedding`. Los proveedores que soporten batch real
         (p. ej. SentenceTransformer) deberían sobreescribirla.
         """
-        return [self.generate_embedding(t) for t in texts]
\ No newline at end of file
+        return [self.generate_embedding(t) for t in texts]
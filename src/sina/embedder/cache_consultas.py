@@ -0,0 +1,161 @@
+"""
+Caché LRU y coalescedor de vectores de CONSULTA (búsqueda de productos).
+
+Las consultas se repiten muchísimo ("leche", "huevo", "frijol": la canasta
+básica y los mismos básicos de siempre), y cada una costaba una llamada al
+modelo. Aquí:
+
+  - `CacheConsultas`: LRU acotada por número de entradas, con la clave
+    normalizada (`normalizar_consulta`: minúsculas + espacios colapsados) y
+    métricas de aciertos para el health check. Opcionalmente se guarda en disco
+    (JSON) y se recarga al arrancar, solo si el modelo y la dimensión coinciden.
+  - `CoalescedorConsultas`: los fallos de caché que llegan a la vez (hilos del
+    threadpool de FastAPI, herramientas del agente) se juntan durante una
+    ventana corta y salen en UNA sola llamada batch al provider; textos
+    repetidos dentro de la ventana se vectorizan una vez.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, List
+
+log = logging.getLogger(__name__)
+
+
+def normalizar_consulta(texto: str) -> str:
+    """Clave de caché (y texto que se vectoriza): minúsculas y espacios colapsados."""
+    return " ".join(texto.casefold().split())
+
+
+class CacheConsultas:
+    """LRU thread-safe {consulta normalizada: vector} con contadores de aciertos."""
+
+    def __init__(self, capacidad: int = 2048, archivo: str | None = None, identidad: str = "") -> None:
+        self.capacidad = max(1, capacidad)
+        self.archivo = archivo or None
+        # modelo|dim: un archivo escrito con otro modelo no se carga.
+        self.identidad = identidad
+        self._lock = threading.Lock()
+        self._datos: OrderedDict[str, List[float]] = OrderedDict()
+        self._aciertos = 0
+        self._fallos = 0
+
+    def obtener(self, clave: str) -> List[float] | None:
+        with self._lock:
+            vector = self._datos.get(clave)
+            if vector is None:
+                self._fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self._aciertos += 1
+            return vector
+
+    def guardar(self, clave: str, vector: List[float]) -> None:
+        with self._lock:
+            self._datos[clave] = vector
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._datos)
+
+    def resumen(self) -> dict:
+        with self._lock:
+            total = self._aciertos + self._fallos
+            return {
+                "entradas":   len(self._datos),
+                "capacidad":  self.capacidad,
+                "aciertos":   self._aciertos,
+                "fallos":     self._fallos,
+                "tasa_acierto": round(self._aciertos / total, 3) if total else None,
+            }
+
+    def cargar(self) -> int:
+        """Carga el archivo (si existe y es del mismo modelo/dim). Devuelve las entradas cargadas."""
+        if not self.archivo or not os.path.exists(self.archivo):
+            return 0
+        try:
+            with open(self.archivo, encoding="utf-8") as f:
+                contenido = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Caché de consultas ilegible (%s): %s", self.archivo, e)
+            return 0
+        if contenido.get("identidad") != self.identidad:
+            log.info("Caché de consultas de otro modelo/dimensión; se ignora %s", self.archivo)
+            return 0
+        # Del menos al más reciente: el orden LRU se conserva entre reinicios.
+        for clave, vector in contenido.get("entradas", [])[-self.capacidad:]:
+            self.guardar(clave, vector)
+        return len(self)
+
+    def persistir(self) -> None:
+        """Escribe la caché a disco (archivo temporal + rename: nunca queda a medias)."""
+        if not self.archivo:
+            return
+        with self._lock:
+            entradas = list(self._datos.items())
+        temporal = f"{self.archivo}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.archivo) or ".", exist_ok=True)
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump({"identidad": self.identidad, "entradas": entradas}, f)
+            os.replace(temporal, self.archivo)
+        except OSError as e:
+            log.warning("No se pudo guardar la caché de consultas (%s): %s", self.archivo, e)
+
+
+class CoalescedorConsultas:
+    """
+    Junta las vectorizaciones concurrentes en un solo batch. El primer hilo que
+    llega es el "líder": espera `ventana_s`, toma todo lo pendiente y hace una
+    llamada a `vectorizar_lote`; los demás solo esperan su resultado. Con un
+    solo hilo la latencia extra es la ventana (milisegundos).
+    """
+
+    def __init__(self, vectorizar_lote: Callable[[List[str]], List[List[float]]],
+                 ventana_s: float = 0.005, dormir: Callable[[float], None] = time.sleep) -> None:
+        self._vectorizar_lote = vectorizar_lote
+        self.ventana_s = ventana_s
+        self._dormir = dormir
+        self._lock = threading.Lock()
+        self._pendientes: dict[str, Future] = {}
+        self._hay_lider = False
+        self.llamadas = 0
+
+    def vectorizar(self, texto: str) -> List[float]:
+        with self._lock:
+            futuro = self._pendientes.get(texto)
+            if futuro is None:
+                futuro = self._pendientes[texto] = Future()
+            lider = not self._hay_lider
+            self._hay_lider = True
+        if lider:
+            self._despachar()
+        return futuro.result()
+
+    def _despachar(self) -> None:
+        if self.ventana_s > 0:
+            self._dormir(self.ventana_s)
+        with self._lock:
+            lote, self._pendientes = self._pendientes, {}
+            self._hay_lider = False
+        self.llamadas += 1
+        try:
+            vectores = self._vectorizar_lote(list(lote))
+            if len(vectores) != len(lote):
+                # Emparejar por posición sería incorrecto; nadie se queda esperando.
+                raise ValueError(f"el provider devolvió {len(vectores)} vectores para {len(lote)} textos")
+        except Exception as e:
+            for futuro in lote.values():
+                futuro.set_exception(e)
+            return
+        for futuro, vector in zip(lote.values(), vectores):
+            futuro.set_result(vector)
@@ -0,0 +1,74 @@
+"""
+Worker de la cola de embeddings (`cola_embeddings`).
+
+Los upserts de productos no esperan al modelo: guardan la fila sin vector y la
+encolan. Este worker drena la cola en lotes grandes (EMBEDDINGS_COLA_LOTE, una
+sola llamada batch al provider por lote) con `FOR UPDATE SKIP LOCKED`, así que
+puede correr en varias instancias a la vez. El scheduler lo ejecuta cada
+EMBEDDINGS_COLA_INTERVALO_S; también se puede correr a mano:
+
+    ENABLE_EMBEDDINGS=1 uv run python -m sina.embedder.cola
+
+El backfill (`sina.embedder.backfill`) es el mismo worker tras encolar los faltantes.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Callable
+
+from sina.config.credentials import DB_URL
+
+log = logging.getLogger(__name__)
+
+
+def drenar_cola(
+    max_lotes: int | None = None,
+    lote: int | None = None,
+    al_procesar: Callable[[dict], None] | None = None,
+) -> dict:
+    """
+    Procesa lotes de `lote` productos (default EMBEDDINGS_COLA_LOTE) hasta
+    vaciar la cola (o `max_lotes`); `al_procesar` recibe el resumen de cada
+    lote (progreso del backfill). Se detiene en el primer lote fallido: con el
+    provider caído no tiene caso seguir; el siguiente tick lo reintenta. Sin
+    servicio de embeddings (o en SQLite) no hace nada.
+
+    Returns:
+        dict: {procesados, vectorizados, reutilizados, fallidos, lotes}.
+    """
+    total = {"procesados": 0, "vectorizados": 0, "reutilizados": 0, "fallidos": 0, "lotes": 0}
+    if not DB_URL.startswith("postgresql"):
+        return total
+
+    from sina.embedder.embeddings import get_embedding_service
+
+    service = get_embedding_service()
+    if service is None:
+        return total
+
+    from sina.db.repository import EMBEDDINGS_COLA_LOTE, SupermercadoRepository
+
+    repo = SupermercadoRepository(db_url=DB_URL)
+    while max_lotes is None or total["lotes"] < max_lotes:
+        resumen = repo.procesar_cola_embeddings(service, lote or EMBEDDINGS_COLA_LOTE)
+        if not any(resumen.values()):
+            break
+        if al_procesar is not None:
+            al_procesar(resumen)
+        for clave, valor in resumen.items():
+            total[clave] += valor
+        total["lotes"] += 1
+        if resumen["fallidos"]:
+            break
+
+    if total["lotes"]:
+        log.info(
+            "[embeddings] Cola: %d productos (%d vectorizados, %d reutilizados), %d fallidos en %d lotes",
+            total["procesados"], total["vectorizados"], total["reutilizados"],
+            total["fallidos"], total["lotes"],
+        )
+    return total
+
+
+if __name__ == "__main__":
+    print(drenar_cola())
@@ -1,7 +1,10 @@
 import os
+import atexit
+import hashlib
 import logging
 from typing import List, Dict, Any, Optional
-from sina.embedder.base import EmbeddingProvider
+from sina.embedder.base import EMBEDDING_DIM, EmbeddingProvider, recortar_mrl
+from sina.embedder.cache_consultas import CacheConsultas, CoalescedorConsultas, normalizar_consulta
 
 logger = logging.getLogger(__name__)
 
@@ -14,38 +17,108 @@ DEFAULT_MODELS = {
     "huggingface": "Qwen/Qwen3-Embedding-8B",
 }
 
+# Caché de vectores de consulta (entradas; 0 = sin caché), archivo opcional para
+# conservarla entre reinicios y ventana del coalescedor de fallos concurrentes.
+EMBEDDINGS_CACHE_CONSULTAS = int(os.getenv("EMBEDDINGS_CACHE_CONSULTAS", "2048"))
+EMBEDDINGS_CACHE_ARCHIVO   = os.getenv("EMBEDDINGS_CACHE_ARCHIVO", "")
+EMBEDDINGS_COALESCER_MS    = float(os.getenv("EMBEDDINGS_COALESCER_MS", "5"))
+
 
 # --- 3. SERVICIO PRINCIPAL (El que usarás en tu código) ---
 class EmbeddingService:
-    def __init__(self, provider: EmbeddingProvider):
+    def __init__(
+        self,
+        provider: EmbeddingProvider,
+        dim: int = EMBEDDING_DIM,
+        cache: Optional[CacheConsultas] = None,
+        coalescer_ms: float = 0.0,
+    ):
         self.provider = provider
-
-    def _texto_producto(self, producto: str, tienda: str, precio: float) -> str:
+        # Todos los vectores (índice y consultas) salen recortados a `dim` (MRL).
+        self.dim = dim
+        # Solo para consultas: los productos ya se reutilizan por `embedding_hash`.
+        self.cache = cache
+        self._coalescedor = CoalescedorConsultas(self._vectorizar_textos, coalescer_ms / 1000)
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.provider, "model_name", type(self.provider).__name__)
+
+    @staticmethod
+    def _texto_producto(p: Dict[str, Any]) -> str:
         """
         Formato semántico del producto. Es CRUCIAL que el texto usado al indexar
         sea el mismo estilo que el de las consultas para que RAG funcione bien.
+        NO incluye el precio: cambia cada semana y obligaría a re-vectorizar
+        productos idénticos (el precio se filtra/ordena en SQL, no por similitud).
+        """
+        partes = [f"Producto: {p.get('producto', '')}."]
+        if p.get("marca"):
+            partes.append(f"Marca: {p['marca']}.")
+        if p.get("categoria"):
+            partes.append(f"Categoría: {p['categoria']}.")
+        partes.append(f"Se vende en el supermercado {p.get('tienda', '')}.")
+        return " ".join(partes)
+
+    def hash_producto(self, p: Dict[str, Any]) -> str:
+        """
+        Huella del vector de un producto: modelo + dimensión + texto. Si no
+        cambia, el embedding guardado sigue sirviendo (`embedding_hash`).
         """
-        return (
-            f"Producto: {producto}. Se vende en el supermercado {tienda} "
-            f"a un precio de ${precio:.2f} pesos."
+        return hashlib.sha256(
+            f"{self.model_name}|{self.dim}|{self._texto_producto(p)}".encode("utf-8")
+        ).hexdigest()
+
+    def vectorizar_supermercado(self, producto: str, tienda: str) -> List[float]:
+        return recortar_mrl(
+            self.provider.generate_embedding(
+                self._texto_producto({"producto": producto, "tienda": tienda})
+            ),
+            self.dim,
         )
 
-    def vectorizar_supermercado(self, producto: str, tienda: str, precio: float) -> List[float]:
-        return self.provider.generate_embedding(self._texto_producto(producto, tienda, precio))
-
     def vectorizar_productos(self, productos: List[Dict[str, Any]]) -> List[List[float]]:
-        """Vectoriza una lista de productos (dicts con producto/tienda/precio) en batch."""
-        textos = [
-            self._texto_producto(
-                p.get("producto", ""), p.get("tienda", ""), float(p.get("precio", 0.0))
-            )
-            for p in productos
-        ]
-        return self.provider.generate_embeddings(textos)
+        """Vectoriza una lista de productos (dicts con producto/tienda[/marca/categoria]) en batch."""
+        textos = [self._texto_producto(p) for p in productos]
+        return [recortar_mrl(v, self.dim) for v in self.provider.generate_embeddings(textos)]
+
+    def _vectorizar_textos(self, textos: List[str]) -> List[List[float]]:
+        return [recortar_mrl(v, self.dim) for v in self.provider.generate_embeddings(textos)]
 
     def vectorizar_consulta(self, texto: str) -> List[float]:
-        """Vectoriza el texto de una consulta de usuario (para búsqueda semántica)."""
-        return self.provider.generate_embedding(texto)
+        """
+        Vectoriza el texto de una consulta de usuario (para búsqueda semántica).
+        Pasa por la caché LRU; los fallos concurrentes se juntan en un batch.
+        """
+        clave = normalizar_consulta(texto)
+        if self.cache is not None:
+            vector = self.cache.obtener(clave)
+            if vector is not None:
+                return vector
+        vector = self._coalescedor.vectorizar(clave)
+        if self.cache is not None:
+            self.cache.guardar(clave, vector)
+        return vector
+
+    def vectorizar_consultas(self, textos: List[str]) -> List[List[float]]:
+        """
+        Varias consultas a la vez (lista del súper, canasta): las que están en
+        caché salen de ahí y el resto va en UNA sola llamada batch al provider.
+        """
+        claves = [normalizar_consulta(t) for t in textos]
+        vectores: Dict[str, List[float]] = {}
+        if self.cache is not None:
+            for clave in claves:
+                vector = self.cache.obtener(clave)
+                if vector is not None:
+                    vectores[clave] = vector
+        faltantes = list(dict.fromkeys(c for c in claves if c not in vectores))
+        if faltantes:
+            for clave, vector in zip(faltantes, self._vectorizar_textos(faltantes)):
+                vectores[clave] = vector
+                if self.cache is not None:
+                    self.cache.guardar(clave, vector)
+        return [vectores[c] for c in claves]
 
 
 # --- FACTORY (singleton perezoso, controlado por ENABLE_EMBEDDINGS) ---
@@ -77,13 +150,39 @@ def get_embedding_service() -> Optional[EmbeddingService]:
         proveedor = os.getenv("EMBEDDING_PROVIDER", DEFAULT_EMBEDDING_PROVIDER).strip().lower()
         model_name = os.getenv("EMBEDDING_MODEL", DEFAULT_MODELS.get(proveedor, ""))
         logger.info("Inicializando embeddings: provider '%s', modelo '%s'...", proveedor, model_name)
-        _service = EmbeddingService(_construir_provider(proveedor, model_name))
+        _service = EmbeddingService(
+            _construir_provider(proveedor, model_name),
+            cache=_construir_cache(model_name),
+            coalescer_ms=EMBEDDINGS_COALESCER_MS,
+        )
     except Exception as e:
         logger.error("No se pudo inicializar el servicio de embeddings: %s", e)
         _service = None
     return _service
 
 
+def _construir_cache(model_name: str) -> Optional[CacheConsultas]:
+    """Caché de consultas; con archivo, se recarga aquí y se guarda al salir del proceso."""
+    if EMBEDDINGS_CACHE_CONSULTAS <= 0:
+        return None
+    cache = CacheConsultas(
+        EMBEDDINGS_CACHE_CONSULTAS,
+        archivo=EMBEDDINGS_CACHE_ARCHIVO,
+        identidad=f"{model_name}|{EMBEDDING_DIM}",
+    )
+    if cache.archivo:
+        logger.info("Caché de consultas: %d entradas cargadas de %s", cache.cargar(), cache.archivo)
+        atexit.register(cache.persistir)
+    return cache
+
+
+def estado_cache_consultas() -> Optional[dict]:
+    """Métricas de la caché de consultas (health check); None si no hay servicio o caché."""
+    if _service is None or _service.cache is None:
+        return None
+    return _service.cache.resumen()
+
+
 def _construir_provider(proveedor: str, model_name: str) -> EmbeddingProvider:
     """Imports perezosos: cada provider carga sus dependencias solo si se elige."""
     if proveedor == "ollama":
@@ -107,7 +206,6 @@ if __name__ == "__main__":
         vector = motor.vectorizar_supermercado(
             producto="Arroz Blanco Precocido Diamante 150 g",
             tienda="Soriana",
-            precio=24.90,
         )
         print(f"Dimensiones del vector devuelto: {len(vector)}")
         print(f"Muestra (primeros 5 valores): {vector[:5]}")
\ No newline at end of file
@@ -13,6 +13,7 @@ class QwenHuggingFaceProvider(EmbeddingProvider):
         model_name: str = "Qwen/Qwen3-Embedding-8B",
     ):
         logger.info(f"Cargando modelo {model_name}...")
+        self.model_name = model_name
 
         try:
             from sentence_transformers import SentenceTransformer
@@ -2,16 +2,15 @@
 from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from typing import cast
-from sqlalchemy import select
+from typing import Callable, cast
 from slowapi.errors import RateLimitExceeded
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.middleware import SlowAPIMiddleware
 import logging
-import time
 import json
 from datetime import datetime
 
@@ -34,7 +33,13 @@ from sina.scraping.gobierno.cre_gasolina import (
     transform_gas_prices,
     get_precios_gasolina
 )
-from sina.scraping.gobierno.cne_gas_lp import get_precios_gas_lp, get_localidades_by_municipio
+from sina.scraping.gobierno.cne_gas_lp import (
+    get_precios_gas_lp,
+    get_precios_gas_lp_por_localidad,
+    get_localidades_by_municipio,
+)
+from sina.scraping.gobierno.cliente_http import estado_clientes
+from sina.embedder.embeddings import estado_cache_consultas
 from sina.config.credentials import DB_URL, casa_ley_url, abarrey_url
 from sina.config.settings import _get_classes_config, _get_flyer_ciudades, build_filesystem_tree
 from sina.config.paths import (
@@ -46,16 +51,26 @@ from sina.config.paths import (
     FLYERS_DATA,
     BASE_DIR,
 )
+from sina.api.condicional import cabeceras_cache, etag_fuerte, no_modificado
+from sina.config.timezone import get_mexico_now
 from sina.config.canasta import (
-    estructurar_canasta
+    estructurar_canasta,
+    resumir_canasta,
 )
 from sina.db.repository import (
+    CanastaMejorRepository,
     GasolinaRepository,
     GasLPRepository,
     SupermercadoRepository,
-    MunicipioRepository,
+    VerificacionFuenteRepository,
+    MODOS_BUSQUEDA,
+)
+from sina.db.indice_ubicaciones import get_indice_ubicaciones, recargar_indice_ubicaciones
+from sina.db.cache_compartida import detener_difusion, iniciar_difusion, obtener_o_calcular
+from sina.db.cache_respuestas import clave_respuesta, get_cache_respuestas
+from sina.db.indice_gasolineras import (
+    COLUMNA_POR_TIPO, geocodificar_inverso, get_indice_gasolineras, recargar_indice_gasolineras,
 )
-from sina.db.models import EntidadFederativa, Municipio, Localidad
 from sina.db.stores import FlyerCiudadesStore, RegistroJobsStore, ciudades_flyers
 from sina.config.logging_config import configurar_logging
 from sina.scheduler import iniciar_scheduler, detener_scheduler
@@ -82,20 +97,20 @@ except Exception:  # noqa: BLE001
 # ============================================================
 #  APP & MOUNTS
 # ============================================================
-_municipios_validos: set[str] = set()
-_catalogo_js: dict            = {}
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Arranque: logging, catálogo de municipios (una vez) y scheduler."""
+    """
+    Arranque: logging, índices en memoria (ubicaciones, gasolineras), receptor de
+    invalidaciones de otros workers y scheduler.
+    """
     configurar_logging()
-    global _municipios_validos, _catalogo_js
-    repo = MunicipioRepository(db_url=DB_URL)
-    _municipios_validos = repo.obtener_nombres_validos()
-    _catalogo_js        = repo.obtener_catalogo()
+    recargar_indice_ubicaciones()
+    recargar_indice_gasolineras()
+    iniciar_difusion()
     iniciar_scheduler()
     yield
     detener_scheduler()
+    detener_difusion()
 
 app = FastAPI(
     title       = "SINA API",
@@ -138,41 +153,127 @@ templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 # ============================================================
 #  HELPERS
 # ============================================================
-def _validar_ubicacion(estado: str, municipio: str) -> tuple[str, str, int, str]:
-    e = estado.strip().lower()
-    m = municipio.strip().lower()
-    if e not in _municipios_validos or m not in _municipios_validos:
+def _validar_ubicacion(
+    estado: str | None, municipio: str | None, status_combinacion: int = 400,
+    lat: float | None = None, lng: float | None = None,
+) -> tuple[str, str, int, str]:
+    """
+    Resuelve (estado, municipio) → (estado, municipio, entidad_id, municipio_id)
+    contra el índice en memoria: sin queries, insensible a acentos/mayúsculas.
+    Los nombres devueltos son los canónicos del catálogo (en minúsculas).
+    Sin nombres pero con (lat, lng), el municipio sale del geocodificador inverso.
+    """
+    if not (estado and municipio) and lat is not None and lng is not None:
+        return _ubicacion_por_coordenadas(lat, lng)
+    if not (estado and municipio):
+        raise HTTPException(status_code=400, detail="Indica estado y municipio, o lat y lng.")
+    indice = get_indice_ubicaciones()
+    if not indice.es_nombre_valido(estado) or not indice.es_nombre_valido(municipio):
         raise HTTPException(status_code=400, detail="Estado o municipio no válido.")
 
-    repo = MunicipioRepository(db_url=DB_URL)
-    ids  = repo.obtener_ids(e, m)
-    if not ids:
-        raise HTTPException(status_code=400, detail="Combinación estado/municipio no encontrada.")
+    ubicacion = indice.resolver_municipio(estado, municipio)
+    if ubicacion is None:
+        raise HTTPException(
+            status_code=status_combinacion,
+            detail="Combinación estado/municipio no encontrada.",
+        )
+    return ubicacion
+
+
+def _ubicacion_por_coordenadas(lat: float, lng: float) -> tuple[str, str, int, str]:
+    """(lat, lng) → (estado, municipio, entidad_id, municipio_id) o 400/404."""
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise HTTPException(status_code=400, detail="Coordenadas inválidas.")
+    ubicacion = geocodificar_inverso(lat, lng)
+    if ubicacion is None:
+        raise HTTPException(status_code=404, detail="No hay un municipio conocido cerca de esas coordenadas.")
+    return ubicacion
+
 
-    entidad_id, municipio_id = ids
-    return e, m, entidad_id, municipio_id
+@app.get("/api/v1/ubicacion/inversa")
+def get_ubicacion_inversa(lat: float, lng: float):
+    """
+    Geocodificación inversa offline: el municipio de (lat, lng) según las
+    gasolineras conocidas más cercanas (índice en memoria, sin servicios
+    externos). Para que la UI/el chat llenen estado y municipio desde la
+    geolocalización del navegador.
+    """
+    estado, municipio, entidad_id, municipio_id = _ubicacion_por_coordenadas(lat, lng)
+    indice = get_indice_ubicaciones()
+    return {
+        "status":       "ok",
+        "estado":       estado,
+        "municipio":    municipio,
+        "entidad_id":   entidad_id,
+        "municipio_id": municipio_id,
+        "nombre_estado":    indice.nombre_entidad(entidad_id),
+        "nombre_municipio": indice.nombre_municipio(entidad_id, municipio_id),
+    }
+
+
+def _respuesta_por_ubicacion(
+    request: Request,
+    clave: str,
+    version: Callable[[], tuple[str, datetime | None, datetime | None]],
+    cargar: Callable[[], dict],
+):
+    """
+    Respuesta de precios de una ubicación, en este orden:
+      1. caché de respuestas (bytes ya serializados): ni DB ni JSON; 304 si aplica;
+      2. `version()` → (etag, última fecha, vigente_hasta), una query sin filas:
+         con datos vigentes, 304 si el cliente ya tiene esa versión;
+      3. `cargar()` (lanza HTTPException en error). Si la respuesta salió de caché
+         vigente se serializa una vez y se guarda hasta `vigente_hasta`, salvo
+         que la ubicación se haya invalidado desde antes de `version()`.
+    Con datos vencidos no hay validadores ni caché: la carga dispara el refresco.
+    """
+    cache = get_cache_respuestas()
+    entrada = cache.obtener(clave)
+    if entrada is not None:
+        if no_modificado(request.headers, entrada.cabeceras["ETag"], entrada.ultima):
+            return Response(status_code=304, headers=entrada.cabeceras)
+        return Response(entrada.cuerpo, media_type="application/json", headers=entrada.cabeceras)
+
+    # Antes de leer la DB: un upsert que invalide mientras tanto impide guardar.
+    generacion = cache.generacion(clave)
+    etag, ultima, vigente_hasta = version()
+    cabeceras = None
+    if vigente_hasta is not None:
+        cabeceras = cabeceras_cache(etag, ultima)
+        if no_modificado(request.headers, etag, ultima):
+            return Response(status_code=304, headers=cabeceras)
+
+    resultado = cargar()
+    if cabeceras is None or resultado.get("fuente") != "cache":
+        return resultado
+    respuesta = JSONResponse(jsonable_encoder(resultado), headers=cabeceras)
+    cache.guardar(clave, respuesta.body, cabeceras, vigente_hasta, ultima, generacion)
+    return respuesta
 
 
 # ============================================================
 #  API · SALUD
 # ============================================================
 _HEALTH_TTL = 60  # segundos; los health-checks frecuentes no deben pegar a la DB
-_health_cache: tuple[float, dict] | None = None
 
 @app.get("/api/v1/health")
 def health(response: Response):
     """Vigencia de los datos por categoría (última actualización + vigente)."""
-    global _health_cache
-    ahora = time.monotonic()
-    if _health_cache is None or ahora - _health_cache[0] > _HEALTH_TTL:
-        _health_cache = (ahora, {
-            "status"       : "ok",
-            "gasolina"     : GasolinaRepository(db_url=DB_URL).estado_cache(),
-            "gas_lp"       : GasLPRepository(db_url=DB_URL).estado_cache(),
-            "supermercados": SupermercadoRepository(db_url=DB_URL).estado_cache(),
-        })
+    # Memoria del worker → caché compartida: un solo worker por minuto va a la DB.
+    vigencia = obtener_o_calcular("health", _HEALTH_TTL, lambda: {
+        "status"       : "ok",
+        "gasolina"     : GasolinaRepository(db_url=DB_URL).estado_cache(),
+        "gas_lp"       : GasLPRepository(db_url=DB_URL).estado_cache(),
+        "supermercados": SupermercadoRepository(db_url=DB_URL).estado_cache(),
+    })
     response.headers["Cache-Control"] = "public, max-age=60"
-    return _health_cache[1]
+    # Circuitos y latencias de CRE/CNE y caché de consultas: en memoria, en vivo (sin DB).
+    return {
+        **vigencia,
+        "fuentes_gobierno": estado_clientes(),
+        "embeddings_consultas": estado_cache_consultas(),
+        "respuestas"   : get_cache_respuestas().resumen(),
+    }
 
 
 # ============================================================
@@ -182,13 +283,11 @@ def health(response: Response):
 def get_catalogo(response: Response):
     """
     Catálogo { estado: [municipios] } que la SPA usa para los selectores.
-    Reemplaza la inyección del catálogo en el HTML de Jinja. Se sirve desde
-    el cache calentado en el lifespan; cae al repositorio si aún no está listo.
+    Reemplaza la inyección del catálogo en el HTML de Jinja. Sale del índice de
+    ubicaciones (cargado en el lifespan), así que sigue sus recargas en todos los workers.
     """
     response.headers["Cache-Control"] = "public, max-age=3600"
-    if _catalogo_js:
-        return {"estados": _catalogo_js}
-    return {"estados": MunicipioRepository(db_url=DB_URL).obtener_catalogo()}
+    return {"estados": get_indice_ubicaciones().catalogo()}
 
 
 # ============================================================
@@ -221,7 +320,7 @@ async def view_gasolina(request: Request):
     """UI de precios de gasolina."""
     return templates.TemplateResponse("gasolina.html", {
         "request" : request,
-        "catalogo": json.dumps(_catalogo_js, ensure_ascii=False),
+        "catalogo": json.dumps(get_indice_ubicaciones().catalogo(), ensure_ascii=False),
     })
 
 @app.get("/sina/gas-lp", response_class=HTMLResponse)
@@ -229,7 +328,7 @@ async def view_gas_lp(request: Request):
     """UI de precios de Gas LP."""
     return templates.TemplateResponse("gas_lp.html", {
         "request" : request,
-        "catalogo": json.dumps(_catalogo_js, ensure_ascii=False),
+        "catalogo": json.dumps(get_indice_ubicaciones().catalogo(), ensure_ascii=False),
     })
 
 # Endpoint UI QQP removido (deprecado)
@@ -238,10 +337,24 @@ async def view_gas_lp(request: Request):
 #  API · GASOLINA
 # ============================================================
 @app.get("/api/v1/gasolina")
-def get_gasolina(estado: str, municipio: str):
-    estado, municipio, entidad_id, municipio_id = _validar_ubicacion(estado, municipio)
+def get_gasolina(
+    request: Request,
+    estado: str | None = None,
+    municipio: str | None = None,
+    lat: float | None = None,
+    lng: float | None = None,
+):
+    """
+    Precios por municipio; sin estado/municipio se usa el de (lat, lng).
+    Con caché vigente: respuesta en memoria, ETag/Last-Modified y 304.
+    """
+    estado, municipio, entidad_id, municipio_id = _validar_ubicacion(estado, municipio, lat=lat, lng=lng)
 
-    try:
+    def version():
+        ultima, ubicadas, vigente_hasta = GasolinaRepository(db_url=DB_URL).version_municipio(estado, municipio)
+        return etag_fuerte("gasolina", estado, municipio, ultima, ubicadas), ultima, vigente_hasta
+
+    def cargar():
         resultado = get_precios_gasolina(estado, municipio, entidad_id, municipio_id)
 
         if resultado.get("status") == "error":
@@ -255,12 +368,58 @@ def get_gasolina(estado: str, municipio: str):
 
         return resultado
 
+    try:
+        return _respuesta_por_ubicacion(
+            request, clave_respuesta("gasolina", f"{estado}/{municipio}"), version, cargar
+        )
+
     except HTTPException:
         raise
     except Exception:
         log.exception("Error obteniendo precios de gasolina")
         raise HTTPException(status_code=500, detail="Error interno del servidor.")
 
+
+@app.get("/api/v1/gasolina/cercanas")
+def get_gasolina_cercanas(
+    lat: float,
+    lng: float,
+    radio: float = 5.0,
+    tipo: str | None = None,
+    orden: str = "distancia",
+    limit: int = 10,
+):
+    """
+    Gasolineras alrededor de (lat, lng) en todo el país (cruza límites
+    municipales), desde el índice espacial en memoria. `radio` en km (máx. 50);
+    `tipo` = regular | premium | diesel (solo las que lo venden, con su
+    `precio`); `orden` = distancia | precio (la más barata dentro del radio).
+    """
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise HTTPException(status_code=400, detail="Coordenadas inválidas.")
+    if not 0 < radio <= 50:
+        raise HTTPException(status_code=400, detail="radio debe estar entre 0 y 50 km.")
+    if orden not in ("distancia", "precio"):
+        raise HTTPException(status_code=400, detail="orden debe ser distancia o precio.")
+    columna = None
+    if tipo is not None:
+        columna = COLUMNA_POR_TIPO.get(tipo.strip().lower())
+        if columna is None:
+            raise HTTPException(status_code=400, detail="tipo debe ser regular, premium o diesel.")
+    if orden == "precio" and columna is None:
+        raise HTTPException(status_code=400, detail="orden=precio requiere tipo.")
+    limit = max(1, min(limit, 50))
+
+    try:
+        datos = get_indice_gasolineras().cercanas(
+            lat, lng, k=limit, radio_km=radio, columna=columna, ordenar_por=orden,
+        )
+        return {"status": "ok", "total": len(datos), "datos": datos}
+    except Exception:
+        log.exception("Error buscando gasolineras cercanas")
+        raise HTTPException(status_code=500, detail="Error interno del servidor.")
+
+
 @app.post("/api/v1/update/gasolina")
 def update_gasolina(estado: str, municipio: str, _admin: None = Depends(require_admin)):
     """
@@ -272,13 +431,16 @@ def update_gasolina(estado: str, municipio: str, _admin: None = Depends(require_
 
     try:
         repo      = GasolinaRepository(db_url=DB_URL)
-        repo.upsert_precios(registros)
+        conteo    = repo.upsert_precios(registros)
+        VerificacionFuenteRepository(db_url=DB_URL).registrar(
+            "gasolina", f"{estado}/{municipio}", len(registros)
+        )
 
         return {
             "status"   : "ok",
             "estado"   : estado,
             "municipio": municipio,
-            "actualizados": len(registros),
+            **conteo,
             "total_en_db" : repo.contar(),
         }
 
@@ -312,13 +474,37 @@ def update_ubicaciones_gasolineras(
 # ============================================================
 #  API · GAS LP
 # ============================================================
+def _respuesta_gas_lp(request: Request, loc, obtener: Callable[[], dict]):
+    """Precios de la localidad vía la caché de respuestas (ver `_respuesta_por_ubicacion`)."""
+    clave = f"{loc.entidad_id}/{loc.municipio_id}/{loc.localidad_id}"
+
+    def version():
+        ultima, filas, verificado, vigente_hasta = GasLPRepository(db_url=DB_URL).version_localidad(
+            loc.entidad_id, loc.municipio_id, loc.localidad_id
+        )
+        # `vigente_hasta` entra al ETag: el `vigente` de cada fila cambia en esa frontera.
+        return etag_fuerte("gas_lp", clave, ultima, filas, verificado, vigente_hasta), ultima, vigente_hasta
+
+    def cargar():
+        resultado = obtener()
+        if "error" in resultado:
+            status = 404 if "no encontrada" in resultado["error"].lower() else 503
+            raise HTTPException(status_code=status, detail=resultado["error"])
+        return resultado
+
+    return _respuesta_por_ubicacion(request, clave_respuesta("gas_lp", clave), version, cargar)
+
 @app.get("/api/v1/gas-lp")
-def get_gas_lp(estado: str, municipio: str, localidad: str):
+def get_gas_lp(request: Request, estado: str, municipio: str, localidad: str):
     """
     Precios de Gas LP por localidad.
     Caché semanal on-demand — llama a CNE solo si los datos vencieron.
     """
     try:
+        loc = get_indice_ubicaciones().resolver_localidad(estado, municipio, localidad)
+        if loc is not None:
+            return _respuesta_gas_lp(request, loc, lambda: get_precios_gas_lp_por_localidad(loc))
+
         resultado = get_precios_gas_lp(estado, municipio, localidad)
 
         if "error" in resultado:
@@ -338,18 +524,9 @@ def get_localidades(estado: str, municipio: str):
     """
     Devuelve localidades disponibles para un estado/municipio.
     """
-    estado = estado.strip().lower()
-    municipio = municipio.strip().lower()
-
-    if estado not in _municipios_validos or municipio not in _municipios_validos:
-        raise HTTPException(status_code=400, detail="Estado o municipio no válido.")
-
-    repo = MunicipioRepository(db_url=DB_URL)
-    ids = repo.obtener_ids(estado, municipio)
-    if not ids:
-        raise HTTPException(status_code=404, detail="Combinación estado/municipio no encontrada.")
-
-    entidad_id, municipio_id = ids
+    estado, municipio, entidad_id, municipio_id = _validar_ubicacion(
+        estado, municipio, status_combinacion=404
+    )
     localidades = get_localidades_by_municipio(entidad_id, municipio_id)
 
     return {
@@ -361,48 +538,23 @@ def get_localidades(estado: str, municipio: str):
     }
 
 @app.get("/api/v1/gas-lp/by-ids")
-def get_gas_lp_by_ids(entidad_id: int, municipio_id: str, localidad_id: int):
+def get_gas_lp_by_ids(request: Request, entidad_id: int, municipio_id: str, localidad_id: int):
     """
     Precios de Gas LP usando IDs directamente (más eficiente para UI).
     Caché semanal on-demand — llama a CNE solo si los datos vencieron.
     """
-    # Resolver nombres desde DB
-    repo = MunicipioRepository(db_url=DB_URL)
-
-    with repo.Session() as session:
-        entidad = session.get(EntidadFederativa, entidad_id)
-        if not entidad:
-            raise HTTPException(status_code=404, detail="Entidad no encontrada.")
-
-        mun_row = session.execute(
-            select(Municipio).where(
-                Municipio.entidad_id == entidad_id,
-                Municipio.municipio_id == municipio_id,
-            )
-        ).scalars().first()
-        if not mun_row:
-            raise HTTPException(status_code=404, detail="Municipio no encontrado.")
-
-        loc_row = session.execute(
-            select(Localidad).where(
-                Localidad.localidad_id == localidad_id,
-            )
-        ).scalars().first()
-        if not loc_row:
-            raise HTTPException(status_code=404, detail="Localidad no encontrada.")
-
-    estado = entidad.nombre.lower()
-    municipio = mun_row.nombre.lower()
-    localidad = str(loc_row.nombre)
+    # Resolver la localidad en el índice en memoria (sin queries)
+    indice = get_indice_ubicaciones()
+    if indice.nombre_entidad(entidad_id) is None:
+        raise HTTPException(status_code=404, detail="Entidad no encontrada.")
+    if indice.nombre_municipio(entidad_id, municipio_id) is None:
+        raise HTTPException(status_code=404, detail="Municipio no encontrado.")
+    loc = indice.localidad_por_ids(entidad_id, municipio_id, localidad_id)
+    if loc is None:
+        raise HTTPException(status_code=404, detail="Localidad no encontrada.")
 
     try:
-        resultado = get_precios_gas_lp(estado, municipio, localidad)
-
-        if "error" in resultado:
-            status = 404 if "no encontrada" in resultado["error"].lower() else 503
-            raise HTTPException(status_code=status, detail=resultado["error"])
-
-        return resultado
+        return _respuesta_gas_lp(request, loc, lambda: get_precios_gas_lp_por_localidad(loc))
 
     except HTTPException:
         raise
@@ -415,23 +567,50 @@ def get_gas_lp_by_ids(entidad_id: int, municipio_id: str, localidad_id: int):
 # ============================================================
 @app.get("/api/v1/supermercados")
 def get_supermercados(
+    request: Request,
+    response: Response,
     q: str | None = None,
     tienda: str | None = None,
     departamento: str | None = None,
     categoria: str | None = None,
     limit: int = 30,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    modo: str | None = None,
 ):
     """
     Productos de supermercado con filtros (tienda/departamento/categoría).
-    Si `q` viene y hay embeddings disponibles, usa búsqueda semántica
-    (pgvector); si no, búsqueda de texto por nombre ordenada por precio.
+    Si `q` viene y hay embeddings disponibles, combina búsqueda por nombre y
+    semántica (pgvector) con rank fusion; si no, búsqueda de texto por nombre
+    ordenada por precio. `modo` = auto | hibrido | semantico | fts | texto
+    (fts = texto completo en español, sin acentos y con stemming).
+    `ef_search`/`probes` afinan el índice ANN (recall vs. latencia) por consulta.
+    ETag = versión del catálogo + parámetros: 304 sin volver a buscar. Si los
+    embeddings fallan y la búsqueda cae a texto, la respuesta sale sin
+    validadores (`no-store`): ese resultado no es el que nombra el ETag.
     """
+    if modo is not None and modo.strip().lower() not in MODOS_BUSQUEDA:
+        raise HTTPException(status_code=400, detail=f"modo debe ser uno de: {', '.join(MODOS_BUSQUEDA)}.")
+    if ef_search is not None and not 1 <= ef_search <= 1000:
+        raise HTTPException(status_code=400, detail="ef_search debe estar entre 1 y 1000.")
+    if probes is not None and not 1 <= probes <= 1000:
+        raise HTTPException(status_code=400, detail="probes debe estar entre 1 y 1000.")
     try:
         repo = SupermercadoRepository(db_url=DB_URL)
-        datos = repo.buscar(
+        ultima, max_id, pendientes = repo.version_catalogo()
+        # El día entra al ETag: las promos de flyer vencen sin cambios en la DB.
+        cabeceras = cabeceras_cache(etag_fuerte(
+            "supermercados", q, tienda, departamento, categoria, limit, ef_search, probes, modo,
+            ultima, max_id, pendientes, get_mexico_now().date(),
+        ), ultima)
+        if no_modificado(request.headers, cabeceras["ETag"], ultima):
+            return Response(status_code=304, headers=cabeceras)
+        datos, respaldo = repo.buscar_con_respaldo(
             q=q, tienda=tienda, departamento=departamento,
             categoria=categoria, limit=limit,
+            ef_search=ef_search, probes=probes, modo=modo,
         )
+        response.headers.update({"Cache-Control": "no-store"} if respaldo else cabeceras)
         return {
             "status": "ok",
             "q":      q,
@@ -443,6 +622,21 @@ def get_supermercados(
         raise HTTPException(status_code=500, detail="Error interno del servidor.")
 
 
+@app.get("/api/v1/canasta")
+def get_canasta(tienda: str | None = None):
+    """
+    Canasta básica precalculada: el producto vigente más barato de cada rubro en
+    cada tienda (tabla `canasta_mejores`, refrescada tras cada scraping/flyer),
+    con el costo de la canasta completa por tienda. Es una lectura, no una búsqueda.
+    """
+    try:
+        mejores = CanastaMejorRepository(db_url=DB_URL).mejores(tienda=tienda)
+        return {"status": "ok", **resumir_canasta(mejores)}
+    except Exception:
+        log.exception("Error leyendo la canasta precalculada")
+        raise HTTPException(status_code=500, detail="Error interno del servidor.")
+
+
 # ============================================================
 #  API · QQP (DEPRECATED)
 # ============================================================
@@ -583,7 +777,7 @@ def persistir_flyer(payload: PersistirPayload, _admin: None = Depends(require_ad
     vf = _parse_fecha(payload.vigencia_fin)
 
     try:
-        n = SupermercadoRepository(db_url=DB_URL).upsert_flyer_productos(
+        conteo = SupermercadoRepository(db_url=DB_URL).upsert_flyer_productos(
             productos=productos,
             tienda=(payload.tienda or "").strip() or "Desconocida",
             fuente=(payload.fuente or "flyer").strip(),
@@ -594,6 +788,11 @@ def persistir_flyer(payload: PersistirPayload, _admin: None = Depends(require_ad
         log.exception("Error insertando productos de flyer")
         raise HTTPException(status_code=500, detail="Error interno del servidor.")
 
+    try:
+        CanastaMejorRepository(db_url=DB_URL).refrescar([(payload.tienda or "").strip() or "Desconocida"])
+    except Exception:
+        log.exception("No se pudo refrescar la canasta precalculada (el upsert sí se aplicó)")
+
     # Artefacto de ciclo de vida: marca "persistido" y guarda la vigencia confirmada
     # por el humano (la fuente de verdad para el monitor de vencimiento).
     try:
@@ -601,7 +800,7 @@ def persistir_flyer(payload: PersistirPayload, _admin: None = Depends(require_ad
         with open(base_dir / "persistido.json", "w", encoding="utf-8") as f:
             json.dump(
                 {
-                    "insertados": n,
+                    **conteo,
                     "tienda": payload.tienda,
                     "vigencia_inicio": vi.isoformat() if vi else None,
                     "vigencia_fin": vf.isoformat() if vf else None,
@@ -611,7 +810,7 @@ def persistir_flyer(payload: PersistirPayload, _admin: None = Depends(require_ad
             )
     except Exception:
         log.exception("No se pudo escribir persistido.json (el upsert sí se aplicó)")
-    return {"status": "ok", "insertados": n}
+    return {"status": "ok", **conteo}
 
 
 @app.get("/api/v1/annotator/status")
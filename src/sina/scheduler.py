@@ -4,12 +4,13 @@ Scheduler de actualización automática de pipelines (Fase 1).
 Usa APScheduler en background con horario de México (America/Mexico_City):
   - Gasolina: diario 06:00
   - Gas LP:   sábados 08:00
+  - Cola de embeddings: cada EMBEDDINGS_COLA_INTERVALO_S (con ENABLE_EMBEDDINGS)
 
 Refresca solo las ubicaciones/localidades que YA tienen datos en la DB
-(las que los usuarios han consultado), reutilizando la lógica de caché
-on-demand de `get_precios_gasolina()` y `get_precios_gas_lp()`. A las horas
-programadas los datos ya están vencidos, así que esas funciones vuelven a
-llamar a la API de gobierno y refrescan la DB.
+(las que los usuarios han consultado), con el motor masivo
+(`refresco_masivo`: pool de hilos, token bucket y upserts por lote dentro de
+una ventana de tiempo). Las ubicaciones se resuelven a IDs con el índice en
+memoria: ninguna consulta de catálogo por ítem.
 
 Se controla con la variable de entorno `ENABLE_SCHEDULER` (default: activado).
 """
@@ -24,52 +25,116 @@ from apscheduler.triggers.interval import IntervalTrigger
 
 from sina.config.timezone import MEXICO_TZ
 from sina.config.credentials import DB_URL
-from sina.db.repository import GasolinaRepository, GasLPRepository, MunicipioRepository
+from sina.db.repository import (
+    CanastaMejorRepository, GasolinaRepository, GasLPRepository, VerificacionFuenteRepository,
+)
+from sina.db.indice_ubicaciones import LocalidadRef, get_indice_ubicaciones
 
 log = logging.getLogger(__name__)
 
 _scheduler: BackgroundScheduler | None = None
 
 
-def refrescar_gasolina() -> None:
-    """Re-scrapea precios de gasolina para los municipios ya presentes en DB."""
-    from sina.scraping.gobierno.cre_gasolina import get_precios_gasolina
+def refrescar_gasolina() -> dict:
+    """
+    Re-descarga precios de gasolina para los municipios ya presentes en DB, en
+    paralelo con ritmo acotado (`RefrescoMasivo`) y upserts por lote. Devuelve
+    los detalles por municipio para la auditoría.
+    """
+    from sina.scraping.gobierno.cre_gasolina import transform_gas_prices
+    from sina.scraping.gobierno.refresco_masivo import RefrescoMasivo
 
     repo = GasolinaRepository(db_url=DB_URL)
-    mun_repo = MunicipioRepository(db_url=DB_URL)
+    verificaciones = VerificacionFuenteRepository(db_url=DB_URL)
+    indice = get_indice_ubicaciones()
     ubicaciones = repo.ubicaciones_con_precios()
     log.info("[scheduler] Gasolina: refrescando %d municipios", len(ubicaciones))
 
+    items, sin_ids = [], []
     for estado, municipio in ubicaciones:
-        ids = mun_repo.obtener_ids(estado, municipio)
+        ids = indice.resolver_municipio(estado, municipio)
         if not ids:
             log.warning("[scheduler] Sin IDs para %s/%s, omitido", estado, municipio)
+            sin_ids.append(f"{estado}/{municipio}")
             continue
-        entidad_id, municipio_id = ids
-        try:
-            get_precios_gasolina(estado, municipio, entidad_id, municipio_id)
-        except Exception as e:
-            log.error("[scheduler] Error refrescando gasolina %s/%s: %s", estado, municipio, e)
+        items.append((estado, municipio, ids[2], ids[3]))
+
+    def _guardar(lote: list[tuple[tuple, list[dict]]]) -> dict:
+        # Un permiso solo puede aparecer una vez por INSERT ... ON CONFLICT.
+        filas = {r["numero"]: r for _, registros in lote for r in registros}
+        conteo = repo.upsert_precios(list(filas.values()))
+        verificaciones.registrar_muchos(
+            "gasolina", [(f"{e}/{m}", len(registros)) for (e, m, _, _), registros in lote]
+        )
+        return conteo
 
+    motor = RefrescoMasivo(
+        lambda item: transform_gas_prices(*item),
+        _guardar,
+        etiqueta=lambda item: f"{item[0]}/{item[1]}",
+    )
+    detalles = motor.ejecutar(items)
+    detalles["sin_ids"] = sin_ids
+    log.info(
+        "[scheduler] Gasolina: %d ok, %d sin datos, %d fallidos, %d pendientes en %.1fs",
+        detalles["ok"], detalles["sin_datos"], detalles["fallidos"],
+        detalles["pendientes"], detalles["duracion_s"],
+    )
+    return detalles
 
-def refrescar_gas_lp() -> None:
-    """Re-scrapea precios de gas LP para las localidades ya presentes en DB."""
-    from sina.scraping.gobierno.cne_gas_lp import get_precios_gas_lp
 
-    repo = GasLPRepository(db_url=DB_URL)
-    combinaciones = repo.combinaciones_con_datos()
-    log.info("[scheduler] Gas LP: refrescando %d localidades", len(combinaciones))
+def refrescar_gas_lp() -> dict:
+    """
+    Re-descarga precios de gas LP para las localidades ya presentes en DB,
+    directo por (entidad_id, municipio_id, localidad_id): sin resolver nombres,
+    llamadas a la CNE en paralelo con ritmo acotado y un upsert multi-fila por
+    lote. Devuelve los detalles por localidad para la auditoría.
+    """
+    from sina.scraping.gobierno.cne_gas_lp import registros_gas_lp
+    from sina.scraping.gobierno.refresco_masivo import RefrescoMasivo
 
-    for c in combinaciones:
-        try:
-            get_precios_gas_lp(
-                c["entidad_nombre"], c["municipio_nombre"], c["localidad_nombre"]
-            )
-        except Exception as e:
-            log.error(
-                "[scheduler] Error refrescando gas LP %s/%s/%s: %s",
-                c["entidad_nombre"], c["municipio_nombre"], c["localidad_nombre"], e,
-            )
+    repo = GasLPRepository(db_url=DB_URL)
+    verificaciones = VerificacionFuenteRepository(db_url=DB_URL)
+    indice = get_indice_ubicaciones()
+    localidades = repo.localidades_con_datos()
+    log.info("[scheduler] Gas LP: refrescando %d localidades", len(localidades))
+
+    items, sin_catalogo = [], []
+    for ids in localidades:
+        loc = indice.localidad_por_ids(*ids)
+        if loc is None:
+            log.warning("[scheduler] Localidad %s/%s/%s fuera del catálogo, omitida", *ids)
+            sin_catalogo.append("/".join(map(str, ids)))
+            continue
+        items.append(loc)
+
+    def _guardar(lote: list[tuple[LocalidadRef, list[dict]]]) -> dict:
+        # Misma clave única dos veces en un INSERT ... ON CONFLICT falla en PG: gana la última.
+        filas = {
+            (r["entidad_id"], r["municipio_id"], r["localidad_id"],
+             r["numero_permiso"], r["tipo"], r["capacidad_recipiente"]): r
+            for _, registros in lote for r in registros
+        }
+        conteo = repo.upsert_precios_gas_lp(list(filas.values()))
+        verificaciones.registrar_muchos("gas_lp", [
+            (f"{loc.entidad_id}/{loc.municipio_id}/{loc.localidad_id}", len(registros))
+            for loc, registros in lote
+        ])
+        return conteo
+
+    motor = RefrescoMasivo(
+        registros_gas_lp,
+        _guardar,
+        etiqueta=lambda loc: f"{loc.entidad_id}/{loc.municipio_id}/{loc.localidad_id}",
+    )
+    detalles = motor.ejecutar(items)
+    detalles["sin_catalogo"] = sin_catalogo
+    log.info(
+        "[scheduler] Gas LP: %d ok, %d sin datos, %d fallidos, %d pendientes en %.1fs",
+        detalles["ok"], detalles["sin_datos"], detalles["fallidos"],
+        detalles["pendientes"], detalles["duracion_s"],
+    )
+    return detalles
 
 
 def refrescar_supermercados() -> None:
@@ -80,6 +145,7 @@ def refrescar_supermercados() -> None:
 
     Ojo: Soriana y Del Sol usan navegador (Playwright), es un job pesado; por eso
     va aparte de gasolina/gas LP y semanal en horario de baja demanda.
+    Al final recalcula la canasta precalculada (`canasta_mejores`) de todas las tiendas.
     """
     tiendas = [
         ("Soriana",               "sina.scraping.supermercados.soriana_spider",     "scrape_soriana"),
@@ -96,6 +162,12 @@ def refrescar_supermercados() -> None:
         except Exception as e:
             log.error("[scheduler] Error scrapeando %s: %s", nombre, e)
 
+    try:
+        filas = CanastaMejorRepository(db_url=DB_URL).refrescar()
+        log.info("[scheduler] Canasta precalculada: %d (rubro, tienda)", filas)
+    except Exception as e:
+        log.error("[scheduler] Error recalculando la canasta: %s", e)
+
 
 def _hash_imagenes(carpeta) -> frozenset:
     """Huella del contenido de un flyer: hashes de sus imágenes (orden-agnóstico)."""
@@ -246,6 +318,23 @@ def _flyers_intervalo_min() -> int:
         return 20
 
 
+def _cola_embeddings_habilitada() -> bool:
+    # Sin embeddings, en SQLite o en modo síncrono nadie encola: no hay qué drenar.
+    from sina.db.repository import EMBEDDINGS_ASINCRONOS
+    return (
+        os.getenv("ENABLE_EMBEDDINGS", "0").strip().lower() in ("1", "true", "yes", "on")
+        and DB_URL.startswith("postgresql")
+        and EMBEDDINGS_ASINCRONOS
+    )
+
+
+def _cola_embeddings_intervalo_s() -> int:
+    try:
+        return max(5, int(os.getenv("EMBEDDINGS_COLA_INTERVALO_S", "30")))
+    except ValueError:
+        return 30
+
+
 def iniciar_scheduler() -> BackgroundScheduler | None:
     """Arranca el scheduler en background. No hace nada si está deshabilitado."""
     global _scheduler
@@ -296,6 +385,22 @@ def iniciar_scheduler() -> BackgroundScheduler | None:
         )
         log.info("[scheduler] Monitor de flyers habilitado (cada %d min).", minutos)
 
+    # Worker de la cola de embeddings: los upserts solo encolan; aquí se
+    # vectoriza en lotes. Los ticks con la cola vacía no se auditan.
+    if _cola_embeddings_habilitada():
+        from sina.embedder.cola import drenar_cola
+
+        segundos = _cola_embeddings_intervalo_s()
+        _scheduler.add_job(
+            _con_registro("embeddings", drenar_cola, solo_con_actividad=True),
+            IntervalTrigger(seconds=segundos, timezone=MEXICO_TZ),
+            id="embeddings_cola",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+        log.info("[scheduler] Worker de la cola de embeddings habilitado (cada %d s).", segundos)
+
     _scheduler.start()
     log.info("[scheduler] Iniciado (gasolina 06:00 diario, gas LP sáb 08:00, hora MX).")
     return _scheduler
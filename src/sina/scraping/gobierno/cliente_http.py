@@ -0,0 +1,265 @@
+"""
+Cliente HTTP compartido para las fuentes de gobierno (CRE, CNE, gasolinamexico).
+
+Antes cada llamada era un `requests.get(..., timeout=15)` suelto: sin keep-alive,
+sin reintentos y sin defensa cuando la fuente está caída (cada request en frío
+ocupaba un worker del threadpool 15 s). Aquí, POR HOST:
+
+  - `requests.Session` con pool de conexiones (keep-alive reutilizado).
+  - Concurrencia acotada (semáforo): el scheduler o un pico de tráfico no abren
+    más de N conexiones simultáneas contra la misma fuente.
+  - Reintentos con backoff exponencial + jitter para errores de red, 429 y 5xx
+    (solo GET: idempotente).
+  - Circuit breaker: tras N fallos seguidos se abre y las llamadas fallan al
+    instante (`CircuitoAbierto`, subclase de `requests.RequestException`, así
+    que los `except` existentes la atrapan y se sirve el dato viejo). Tras el
+    enfriamiento deja pasar UNA sonda (semiabierto) para decidir si cierra.
+  - Latencias y estado del circuito para el health check (`estado_clientes()`).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger(__name__)
+
+TIMEOUT_S          = float(os.getenv("GOB_HTTP_TIMEOUT_S", "15"))
+MAX_CONCURRENCIA   = int(os.getenv("GOB_HTTP_MAX_CONCURRENCIA", "8"))
+REINTENTOS         = int(os.getenv("GOB_HTTP_REINTENTOS", "2"))
+CIRCUITO_FALLOS    = int(os.getenv("GOB_CIRCUITO_FALLOS", "5"))
+CIRCUITO_ENFRIA_S  = float(os.getenv("GOB_CIRCUITO_ENFRIAMIENTO_S", "60"))
+
+_BACKOFF_BASE_S = 0.5
+_BACKOFF_MAX_S  = 8.0
+_MUESTRAS_LATENCIA = 200
+
+
+class CircuitoAbierto(requests.RequestException):
+    """La fuente acumuló fallos: se rechaza sin llamar hasta que pase el enfriamiento."""
+
+
+class Circuito:
+    """
+    Circuit breaker de tres estados: "cerrado" (normal), "abierto" (falla rápido)
+    y "semiabierto" (una sola sonda en vuelo decide si vuelve a cerrar).
+    """
+
+    def __init__(self, umbral: int = CIRCUITO_FALLOS, enfriamiento_s: float = CIRCUITO_ENFRIA_S,
+                 reloj: Callable[[], float] = time.monotonic) -> None:
+        self.umbral = umbral
+        self.enfriamiento_s = enfriamiento_s
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self._fallos = 0
+        self._abierto_desde: float | None = None
+        self._sonda_en_vuelo = False
+        self._sonda_hilo: int | None = None
+
+    @property
+    def estado(self) -> str:
+        with self._lock:
+            return self._estado()
+
+    def _estado(self) -> str:
+        if self._abierto_desde is None:
+            return "cerrado"
+        if self._reloj() - self._abierto_desde >= self.enfriamiento_s:
+            return "semiabierto"
+        return "abierto"
+
+    def permitir(self) -> bool:
+        """True si la llamada puede salir (en semiabierto, solo la primera)."""
+        with self._lock:
+            estado = self._estado()
+            if estado == "cerrado":
+                return True
+            if estado == "semiabierto" and not self._sonda_en_vuelo:
+                self._sonda_en_vuelo = True
+                self._sonda_hilo = threading.get_ident()
+                return True
+            return False
+
+    def liberar_sonda(self) -> None:
+        """
+        La sonda de ESTE hilo terminó sin veredicto (sin turno, o una excepción
+        que no es de red): no cuenta ni como éxito ni como fallo y otra puede
+        salir. No-op si este hilo no tiene la sonda (o ya se resolvió).
+        """
+        with self._lock:
+            if self._sonda_en_vuelo and self._sonda_hilo == threading.get_ident():
+                self._sonda_en_vuelo = False
+                self._sonda_hilo = None
+
+    def exito(self) -> None:
+        with self._lock:
+            self._fallos = 0
+            self._abierto_desde = None
+            self._sonda_en_vuelo = False
+            self._sonda_hilo = None
+
+    def fallo(self) -> None:
+        with self._lock:
+            self._fallos += 1
+            if self._sonda_en_vuelo or self._fallos >= self.umbral:
+                if self._abierto_desde is None or self._sonda_en_vuelo:
+                    log.warning("Circuito abierto tras %d fallos seguidos", self._fallos)
+                self._abierto_desde = self._reloj()
+                self._sonda_en_vuelo = False
+                self._sonda_hilo = None
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {"estado": self._estado(), "fallos_seguidos": self._fallos}
+
+
+def _reintentable(resp: requests.Response) -> bool:
+    return resp.status_code == 429 or resp.status_code >= 500
+
+
+class ClienteHTTP:
+    """Sesión + semáforo + reintentos + circuito + métricas para UN host."""
+
+    def __init__(
+        self,
+        host: str,
+        *,
+        sesion: requests.Session | None = None,
+        max_concurrencia: int = MAX_CONCURRENCIA,
+        reintentos: int = REINTENTOS,
+        timeout_s: float = TIMEOUT_S,
+        circuito: Circuito | None = None,
+        dormir: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.host = host
+        self.reintentos = reintentos
+        self.timeout_s = timeout_s
+        self.circuito = circuito or Circuito()
+        self._dormir = dormir
+        self._semaforo = threading.BoundedSemaphore(max_concurrencia)
+        if sesion is None:
+            sesion = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrencia)
+            sesion.mount("https://", adaptador)
+            sesion.mount("http://", adaptador)
+        self._sesion = sesion
+
+        self._lock = threading.Lock()
+        self._latencias: deque[float] = deque(maxlen=_MUESTRAS_LATENCIA)
+        self._llamadas = 0
+        self._errores = 0
+        self._rechazadas = 0
+        self._ultimo_error: str | None = None
+
+    # ── Llamada ────────────────────────────────────────────────
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        """
+        GET con reintentos. Devuelve la última respuesta (el llamador decide con
+        `raise_for_status()`); lanza `requests.RequestException` si no hubo
+        respuesta, o `CircuitoAbierto` si la fuente está marcada como caída.
+        """
+        if not self.circuito.permitir():
+            with self._lock:
+                self._rechazadas += 1
+            raise CircuitoAbierto(f"Circuito abierto para {self.host}")
+
+        kwargs.setdefault("timeout", self.timeout_s)
+        if not self._semaforo.acquire(timeout=self.timeout_s):
+            # Sin turno: no es fallo de la fuente; si era la sonda, otra podrá salir.
+            self.circuito.liberar_sonda()
+            raise requests.Timeout(f"Sin turno para {self.host} (concurrencia agotada)")
+        try:
+            return self._get_con_reintentos(url, **kwargs)
+        finally:
+            self._semaforo.release()
+            # Si salió sin `exito()` ni `fallo()` (excepción ajena a la red), la
+            # sonda no puede quedar tomada: el circuito se quedaría semiabierto
+            # rechazando todo para siempre.
+            self.circuito.liberar_sonda()
+
+    def _get_con_reintentos(self, url: str, **kwargs: Any) -> requests.Response:
+        intento = 0
+        while True:
+            inicio = time.perf_counter()
+            try:
+                resp = self._sesion.get(url, **kwargs)
+            except requests.RequestException as e:
+                self._anotar(time.perf_counter() - inicio, error=repr(e))
+                if intento >= self.reintentos:
+                    self.circuito.fallo()
+                    raise
+            else:
+                fallo = _reintentable(resp)
+                self._anotar(time.perf_counter() - inicio,
+                             error=f"HTTP {resp.status_code}" if fallo else None)
+                if not fallo:
+                    self.circuito.exito()
+                    return resp
+                if intento >= self.reintentos:
+                    self.circuito.fallo()
+                    return resp
+            intento += 1
+            # Full jitter: aleatorio en [0, base·2^n] para no sincronizar reintentos.
+            self._dormir(random.uniform(0, min(_BACKOFF_MAX_S, _BACKOFF_BASE_S * 2 ** intento)))
+
+    # ── Métricas ───────────────────────────────────────────────
+    def _anotar(self, segundos: float, error: str | None) -> None:
+        with self._lock:
+            self._llamadas += 1
+            self._latencias.append(segundos)
+            if error is not None:
+                self._errores += 1
+                self._ultimo_error = error
+
+    def resumen(self) -> dict:
+        with self._lock:
+            muestras = sorted(self._latencias)
+            datos = {
+                "llamadas": self._llamadas,
+                "errores": self._errores,
+                "rechazadas": self._rechazadas,
+                "ultimo_error": self._ultimo_error,
+            }
+
+        def _pct(p: float) -> float | None:
+            if not muestras:
+                return None
+            return round(muestras[min(len(muestras) - 1, int(p * len(muestras)))] * 1000, 1)
+
+        datos["latencia_ms"] = {"p50": _pct(0.50), "p95": _pct(0.95)}
+        return {"circuito": self.circuito.resumen(), **datos}
+
+
+# ── Registro por host ─────────────────────────────────────────
+_clientes: dict[str, ClienteHTTP] = {}
+_clientes_lock = threading.Lock()
+
+
+def cliente_para(url: str) -> ClienteHTTP:
+    """Cliente compartido del host de `url` (se crea la primera vez)."""
+    host = urlparse(url).netloc or url
+    cliente = _clientes.get(host)
+    if cliente is None:
+        with _clientes_lock:
+            cliente = _clientes.setdefault(host, ClienteHTTP(host))
+    return cliente
+
+
+def http_get(url: str, **kwargs: Any) -> requests.Response:
+    """Reemplazo de `requests.get` para las fuentes de gobierno."""
+    return cliente_para(url).get(url, **kwargs)
+
+
+def estado_clientes() -> dict[str, dict]:
+    """{host: circuito + latencias} de los hosts usados en este proceso (health check)."""
+    with _clientes_lock:
+        clientes = list(_clientes.values())
+    return {c.host: c.resumen() for c in clientes}
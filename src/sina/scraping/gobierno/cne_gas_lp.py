@@ -1,14 +1,31 @@
 import logging
 import requests
 import json
-from typing import cast, Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional
 from datetime import datetime
 from sina.config.credentials import DB_URL
-from sina.db.repository import get_session, GasLPRepository
-from sina.db.models import Localidad, EntidadFederativa, Municipio
+from sina.db.repository import (
+    GasLPRepository,
+    VerificacionFuenteRepository,
+    candado_consultivo,
+    get_session,
+)
+from sina.db.models import Localidad, gas_lp_vigente
+from sina.db.indice_ubicaciones import (
+    LocalidadRef,
+    difundir_cambio_ubicaciones,
+    get_indice_ubicaciones,
+    recargar_indice_ubicaciones,
+)
 from sina.config.credentials import cne_localidades_url, cne_precios_gas_lp_url
 from sina.config.timezone import get_mexico_now
-from sina.scraping.gobierno.refresco import refrescar_en_background
+from sina.scraping.gobierno.cliente_http import http_get
+from sina.scraping.gobierno.refresco import (
+    CACHE_NEGATIVA_TTL_H,
+    PRIMERA_CARGA_TIMEOUT_S,
+    ejecutar_una_vez,
+    refrescar_en_background,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -58,7 +75,7 @@ def fetch_localidades(entidad_id: int, municipio_id_str: str) -> List[Dict[str,
     }
 
     try:
-        resp = requests.get(url, params=params, timeout=15)
+        resp = http_get(url, params=params)
         resp.raise_for_status()
     except requests.RequestException as e:
         logger.error(
@@ -106,6 +123,10 @@ def save_localidades_to_db(entidad_id: int, municipio_id_str: str) -> Dict[str,
 
         session.commit()
 
+    if nuevas:
+        recargar_indice_ubicaciones()
+        difundir_cambio_ubicaciones()
+
     resultado = {
         "insertadas": len(nuevas),
         "skipped":    skipped,
@@ -121,17 +142,11 @@ def save_localidades_to_db(entidad_id: int, municipio_id_str: str) -> Dict[str,
     return resultado
 
 def get_localidades_by_municipio(entidad_id: int, municipio_id: str) -> List[Dict[str, Any]]:
-    with get_session() as session:
-        rows = (
-            session.query(Localidad.localidad_id, Localidad.nombre)
-            .filter_by(
-                entidad_id=entidad_id,
-                municipio_id=municipio_id,
-            )
-            .order_by(Localidad.nombre.asc())
-            .all()
-        )
-        return [{"id": r.localidad_id, "nombre": r.nombre} for r in rows]
+    """Localidades del municipio desde el índice en memoria (sin query)."""
+    return [
+        {"id": l.localidad_id, "nombre": l.nombre}
+        for l in get_indice_ubicaciones().localidades_de(entidad_id, municipio_id)
+    ]
 
 
 def get_precios_gas_lp(
@@ -152,106 +167,134 @@ def get_precios_gas_lp(
             "localidad": localidad,
         }
 
-    entidad_id:   int = cast(int, loc.entidad_id)
-    municipio_id: str = cast(str, loc.municipio_id)
-    localidad_id: int = cast(int, loc.localidad_id)
+    return get_precios_gas_lp_por_localidad(loc)
+
+
+def get_precios_gas_lp_por_localidad(loc: LocalidadRef) -> Dict[str, Any]:
+    """Mismo caché semanal on-demand que `get_precios_gas_lp`, con la localidad ya resuelta."""
+    entidad_id   = loc.entidad_id
+    municipio_id = loc.municipio_id
+    localidad_id = loc.localidad_id
 
     logger.info(
         f"Localidad encontrada: {loc.nombre} "
         f"(entidad={entidad_id}, mun={municipio_id}, loc={localidad_id})"
     )
 
-    repo = GasLPRepository(db_url=DB_URL)
+    repo  = GasLPRepository(db_url=DB_URL)
+    clave = f"gas_lp:{entidad_id}/{municipio_id}/{localidad_id}"
+
+    # Precios + vigencia + fecha de los datos en una sola ida a la DB.
+    precios, vigente, fecha_datos = repo.obtener_con_vigencia(entidad_id, municipio_id, localidad_id)
 
-    if not repo.necesita_actualizacion(entidad_id, municipio_id, localidad_id):
+    if vigente:
         logger.info("Cache hit — devolviendo datos de DB")
-        precios = repo.obtener_por_localidad(entidad_id, municipio_id, localidad_id)
-        return _formatear_respuesta(precios, loc, fuente="cache")
+        return _formatear_respuesta(precios, loc, fuente="cache", fecha_datos=fecha_datos)
 
     # ── Vencido pero con datos → servir stale + refrescar en background ──
-    precios_viejos = repo.obtener_por_localidad(entidad_id, municipio_id, localidad_id)
-    if precios_viejos:
+    if precios:
         refrescar_en_background(
-            f"gas_lp:{entidad_id}/{municipio_id}/{localidad_id}",
+            clave,
             lambda: _refrescar_gas_lp(loc, entidad_id, municipio_id, localidad_id),
         )
-        return _formatear_respuesta(precios_viejos, loc, fuente="cache_vencido")
+        return _formatear_respuesta(precios, loc, fuente="cache_vencido", fecha_datos=fecha_datos)
 
-    # ── Sin datos → llamar a CNE en línea (primera vez) ──────
-    logger.info("Cache miss — llamando a API CNE...")
-    datos_api = _fetch_precios_api(localidad_id, entidad_id, municipio_id)
+    # ── Sin datos y la CNE ya dijo hace poco que no hay → no volver a preguntar ──
+    if VerificacionFuenteRepository(db_url=DB_URL).sin_datos_reciente(
+        "gas_lp", f"{entidad_id}/{municipio_id}/{localidad_id}", CACHE_NEGATIVA_TTL_H
+    ):
+        logger.info("Caché negativa: localidad %s sin precios en la CNE", localidad_id)
+        return _formatear_respuesta([], loc, fuente="cache_negativa")
 
-    if datos_api is None:
+    # ── Sin datos → llamar a CNE en línea (primera vez, single-flight) ──
+    try:
+        precios, fuente, fecha_datos = ejecutar_una_vez(clave, lambda: _primera_carga_gas_lp(clave, loc))
+    except TimeoutError as e:
+        logger.warning(str(e))
+        precios, fuente, fecha_datos = None, "api", None
+
+    if precios is None:
         return {
             "error": "No se pudieron obtener precios (API no disponible)",
-            "estado": estado,
-            "municipio": municipio,
-            "localidad": localidad,
+            "estado": _get_entidad_nombre(entidad_id),
+            "municipio": _get_municipio_nombre(entidad_id, municipio_id),
+            "localidad": loc.nombre,
         }
 
-    entidad_nombre   = _get_entidad_nombre(entidad_id)
-    municipio_nombre = _get_municipio_nombre(entidad_id, municipio_id)
-    registros = _transformar_para_db(datos_api, loc, entidad_nombre, municipio_nombre)
-    repo.upsert_precios_gas_lp(registros)
-    logger.info(f"DB actualizada con {len(registros)} registros")
+    return _formatear_respuesta(precios, loc, fuente=fuente, fecha_datos=fecha_datos)
 
-    precios_nuevos = repo.obtener_por_localidad(entidad_id, municipio_id, localidad_id)
-    return _formatear_respuesta(precios_nuevos, loc, fuente="api")
 
-
-def _refrescar_gas_lp(loc, entidad_id: int, municipio_id: str, localidad_id: int) -> None:
-    """Refresco contra la CNE + upsert (corre en background vía `refrescar_en_background`)."""
+def _primera_carga_gas_lp(
+    clave: str, loc: LocalidadRef
+) -> tuple[Optional[List[Dict[str, Any]]], str, Optional[datetime]]:
+    """
+    Carga inicial de una localidad, una sola vez entre todos los workers: tras
+    obtener el advisory lock se relee la DB por si otro worker ya la hizo.
+    Devuelve (precios, fuente, fecha de los datos); (None, "api", None) si la
+    API CNE no respondió.
+    """
+    repo = GasLPRepository(db_url=DB_URL)
+    with candado_consultivo(clave, PRIMERA_CARGA_TIMEOUT_S):
+        precios, _, fecha_datos = repo.obtener_con_vigencia(loc.entidad_id, loc.municipio_id, loc.localidad_id)
+        if precios:
+            return precios, "cache", fecha_datos
+
+        logger.info("Cache miss — llamando a API CNE...")
+        registros = _refrescar_gas_lp(loc, loc.entidad_id, loc.municipio_id, loc.localidad_id)
+        if registros is None:
+            return None, "api", None
+
+    # Lo recién guardado ya está en memoria: no hace falta releerlo de la DB.
+    # Todo viene de la misma extracción, así que su fecha es la de los datos.
+    precios = _precios_desde_registros(registros)
+    return precios, "api", max((p["fecha_extraccion"] for p in precios), default=None)
+
+
+def _refrescar_gas_lp(
+    loc: LocalidadRef, entidad_id: int, municipio_id: str, localidad_id: int
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Refresco contra la CNE + upsert (también corre en background vía
+    `refrescar_en_background`). Devuelve los registros guardados, o None si
+    la API no respondió (eso NO entra a la caché negativa).
+    """
     datos_api = _fetch_precios_api(localidad_id, entidad_id, municipio_id)
     if datos_api is None:
         logger.warning(
             "Refresco de gas LP falló (API CNE no disponible) para localidad %s", localidad_id
         )
-        return
+        return None
     entidad_nombre   = _get_entidad_nombre(entidad_id)
     municipio_nombre = _get_municipio_nombre(entidad_id, municipio_id)
     registros = _transformar_para_db(datos_api, loc, entidad_nombre, municipio_nombre)
     GasLPRepository(db_url=DB_URL).upsert_precios_gas_lp(registros)
+    VerificacionFuenteRepository(db_url=DB_URL).registrar(
+        "gas_lp", f"{entidad_id}/{municipio_id}/{localidad_id}", len(registros)
+    )
     logger.info("DB de gas LP actualizada con %d registros", len(registros))
+    return registros
 
-def _buscar_localidad(estado: str, municipio: str, localidad: str) -> Optional[Localidad]:
-    with get_session() as session:
-        entidad = (
-            session.query(EntidadFederativa)
-            .filter(EntidadFederativa.nombre.ilike(estado.strip()))
-            .first()
-        )
-        if entidad is None:
-            logger.warning(f"Estado no encontrado: '{estado}'")
-            return None
-
-        mun = (
-            session.query(Municipio)
-            .filter(
-                Municipio.entidad_id == entidad.id,
-                Municipio.nombre.ilike(municipio.strip()),
-            )
-            .first()
-        )
-        if mun is None:
-            logger.warning(f"Municipio no encontrado: '{municipio}' en '{estado}'")
-            return None
-
-        loc = (
-            session.query(Localidad)
-            .filter(
-                Localidad.entidad_id   == entidad.id,
-                Localidad.municipio_id == mun.municipio_id,
-                Localidad.nombre.ilike(localidad.strip()),
-            )
-            .first()
-        )
+def registros_gas_lp(loc: LocalidadRef) -> List[Dict[str, Any]]:
+    """
+    Precios de la CNE para una localidad, listos para `upsert_precios_gas_lp`,
+    SIN escribir (el refresco masivo guarda por lotes). Lanza si la API no respondió.
+    """
+    datos_api = _fetch_precios_api(loc.localidad_id, loc.entidad_id, loc.municipio_id)
+    if datos_api is None:
+        raise RuntimeError(f"API CNE no disponible (localidad {loc.localidad_id})")
+    return _transformar_para_db(
+        datos_api, loc,
+        _get_entidad_nombre(loc.entidad_id),
+        _get_municipio_nombre(loc.entidad_id, loc.municipio_id),
+    )
 
-        if loc is None:
-            logger.warning(f"Localidad no encontrada: '{localidad}' en '{municipio}'")
-            return None
 
-        session.expunge(loc)
-        return loc
+def _buscar_localidad(estado: str, municipio: str, localidad: str) -> Optional[LocalidadRef]:
+    """Resuelve nombres → IDs en el índice en memoria (sin acentos ni mayúsculas)."""
+    loc = get_indice_ubicaciones().resolver_localidad(estado, municipio, localidad)
+    if loc is None:
+        logger.warning(f"Localidad no encontrada: '{localidad}' en '{municipio}', '{estado}'")
+    return loc
 
 
 def _fetch_precios_api(
@@ -266,7 +309,7 @@ def _fetch_precios_api(
     }
 
     try:
-        resp = requests.get(cne_precios_gas_lp_url, params=params, timeout=15)
+        resp = http_get(cne_precios_gas_lp_url, params=params)
         resp.raise_for_status()
         data = resp.json()
     except requests.RequestException as e:
@@ -277,13 +320,16 @@ def _fetch_precios_api(
         return None
 
     if not data.get("Success"):
+        # Error reportado por la CNE: como una caída (se sirve el dato viejo y
+        # se reintenta), NUNCA caché negativa. Solo `Success` con `Value` vacío
+        # significa "esta localidad no tiene precios".
         logger.warning(f"API reportó error: {data.get('Errors')}")
         return None
 
-    return data.get("Value", {})
+    return data.get("Value") or {}
 
 
-def _transformar_para_db(datos_api: Dict[str, Any], loc: Localidad,
+def _transformar_para_db(datos_api: Dict[str, Any], loc: LocalidadRef,
                          entidad_nombre: str, municipio_nombre: str) -> List[Dict[str, Any]]:
     ahora    = get_mexico_now()
     registros: List[Dict[str, Any]] = []
@@ -332,7 +378,41 @@ def _transformar_para_db(datos_api: Dict[str, Any], loc: Localidad,
     return registros
 
 
-def _formatear_respuesta(precios: List[Dict[str, Any]], loc: Localidad, fuente: str) -> Dict[str, Any]:
+def _precios_desde_registros(registros: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Proyecta los registros recién upserteados al mismo formato que
+    `GasLPRepository.obtener_por_localidad` (un registro por clave única).
+    """
+    unicos = {
+        (r["numero_permiso"], r["tipo"], r["capacidad_recipiente"]): r
+        for r in registros
+    }
+    return [
+        {
+            "numero_permiso":       r["numero_permiso"],
+            "marca_comercial":      r["marca_comercial"],
+            "tipo":                 r["tipo"],
+            "capacidad_recipiente": r["capacidad_recipiente"],
+            "precio":               r["precio"],
+            "entidad_nombre":       r["entidad_nombre"],
+            "municipio_nombre":     r["municipio_nombre"],
+            "localidad_nombre":     r["localidad_nombre"],
+            "fecha_extraccion":     r["fecha_extraccion"],
+            "vigente":              gas_lp_vigente(r["fecha_extraccion"]),
+        }
+        for r in sorted(unicos.values(), key=lambda r: r["precio"])
+    ]
+
+
+def _formatear_respuesta(
+    precios: List[Dict[str, Any]], loc: LocalidadRef, fuente: str,
+    fecha_datos: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """
+    `fecha_datos`: último cambio o última verificación de la localidad (ver
+    `obtener_con_vigencia`); el `fecha_extraccion` de cada precio solo avanza
+    cuando cambia.
+    """
     autotanques = sorted(
         [p for p in precios if p["tipo"] == "autotanque"],
         key=lambda x: x["precio"]
@@ -342,8 +422,6 @@ def _formatear_respuesta(precios: List[Dict[str, Any]], loc: Localidad, fuente:
         key=lambda x: (x["precio"], x["capacidad_recipiente"] or 0)
     )
 
-    fecha = precios[0]["fecha_extraccion"] if precios else None
-
     return {
         "localidad":   loc.nombre,
         "municipio":   precios[0]["municipio_nombre"] if precios else "",
@@ -351,38 +429,14 @@ def _formatear_respuesta(precios: List[Dict[str, Any]], loc: Localidad, fuente:
         "autotanques": autotanques,
         "recipientes": recipientes,
         "fuente":      fuente,
-        "fecha_datos": fecha,
+        "fecha_datos": fecha_datos,
         "total":       len(precios),
     }
 
 
-_cache_nombres: Dict[str, str] = {}
-
 def _get_entidad_nombre(entidad_id: int) -> str:
-    key = f"e_{entidad_id}"
-
-    if key not in _cache_nombres:
-        with get_session() as session:
-            e = session.get(EntidadFederativa, entidad_id)
-            _cache_nombres[key] = str(e.nombre) if e else str(entidad_id)
-
-    return _cache_nombres[key]
+    return get_indice_ubicaciones().nombre_entidad(entidad_id) or str(entidad_id)
 
 
 def _get_municipio_nombre(entidad_id: int, municipio_id: str) -> str:
-    key = f"m_{entidad_id}_{municipio_id}"
-
-    if key not in _cache_nombres:
-        with get_session() as session:
-            m = (
-                session.query(Municipio)
-                .filter_by(
-                    entidad_id=entidad_id,
-                    municipio_id=municipio_id
-                )
-                .first()
-            )
-
-            _cache_nombres[key] = str(m.nombre) if m else municipio_id
-
-    return _cache_nombres[key]
+    return get_indice_ubicaciones().nombre_municipio(entidad_id, municipio_id) or municipio_id
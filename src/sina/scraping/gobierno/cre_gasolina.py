@@ -8,8 +8,18 @@ from typing import Any, Dict, List, Optional
 from bs4 import BeautifulSoup, Tag
 from datetime import datetime
 from sina.config.credentials import DB_URL
-from sina.db.repository import GasolinaRepository
-from sina.scraping.gobierno.refresco import refrescar_en_background
+from sina.db.repository import (
+    GasolinaRepository,
+    VerificacionFuenteRepository,
+    candado_consultivo,
+)
+from sina.scraping.gobierno.cliente_http import http_get
+from sina.scraping.gobierno.refresco import (
+    CACHE_NEGATIVA_TTL_H,
+    PRIMERA_CARGA_TIMEOUT_S,
+    ejecutar_una_vez,
+    refrescar_en_background,
+)
 from sina.config.credentials import (
     gasolina_api_rest,
     cne_refer,
@@ -55,7 +65,9 @@ def extract_gas_prices(entidad_id: int, municipio_id: str) -> Dict[str, Any]:
         "municipioId": municipio_id,
     }
     headers: Dict[str, str] = {"User-Agent": "Mozilla/5.0", "Referer": cne_refer}
-    response = requests.get(gasolina_api_rest, params=params, headers=headers, timeout=15)
+    response = http_get(gasolina_api_rest, params=params, headers=headers)
+    # Un 5xx debe ser error (reintentable), no "municipio sin datos" (caché negativa).
+    response.raise_for_status()
     return response.json()
 
 def transform_gas_prices(estado: str, municipio: str,
@@ -132,7 +144,7 @@ def _get_station_links(estado: str, municipio: str) -> List[str]:
     url = f"{gasolineras_ubi}/{_slugify(estado)}/{_slugify(municipio)}/"
 
     try:
-        response = requests.get(url, headers=HEADERS, timeout=15)
+        response = http_get(url, headers=HEADERS)
 
         if response.status_code == 404:
             log.warning(f"Página no encontrada: {url}")
@@ -158,7 +170,7 @@ def _get_station_links(estado: str, municipio: str) -> List[str]:
 
 def _scrape_station(url: str) -> Optional[Dict[str, Any]]:
     try:
-        response = requests.get(url, headers=HEADERS, timeout=15)
+        response = http_get(url, headers=HEADERS)
         response.raise_for_status()
     except requests.RequestException as e:
         log.error(f"Error de red en detalle {url}: {e}")
@@ -239,8 +251,13 @@ def scrape_municipio(
     log.info(f"  ✅ {municipio}: {len(resultados)}/{total} exitosas")
     return resultados
 
-def _respuesta_gasolina(registros: list, estado: str, municipio: str, fuente: str) -> Dict[str, Any]:
-    fecha_datos = registros[0].get("fecha_extraccion") if registros else None
+def _respuesta_gasolina(registros: list, estado: str, municipio: str, fuente: str,
+                        fecha_datos: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    `fecha_datos`: último cambio o última verificación del municipio (ver
+    `obtener_con_vigencia`); el `fecha_extraccion` de cada fila solo avanza
+    cuando cambia su precio.
+    """
     return {
         "status"     : "ok",
         "fuente"     : fuente,
@@ -258,6 +275,19 @@ def _refrescar_gasolina(estado: str, municipio: str,
     nuevos = transform_gas_prices(estado, municipio, entidad_id, municipio_id)
     if nuevos:
         GasolinaRepository(db_url=DB_URL).upsert_precios(nuevos)
+    # Solo llega aquí si la CRE respondió: 0 filas alimenta la caché negativa.
+    VerificacionFuenteRepository(db_url=DB_URL).registrar(
+        "gasolina", f"{estado}/{municipio}", len(nuevos)
+    )
+
+
+def refrescar_gasolina_en_background(estado: str, municipio: str,
+                                     entidad_id: int, municipio_id: str) -> bool:
+    """Refresco contra la CRE sin esperar (uno por municipio entre workers); True si se lanzó."""
+    return refrescar_en_background(
+        f"gasolina:{estado}/{municipio}",
+        lambda: _refrescar_gasolina(estado, municipio, entidad_id, municipio_id),
+    )
 
 
 def get_precios_gasolina(estado: str, municipio: str,
@@ -268,26 +298,34 @@ def get_precios_gasolina(estado: str, municipio: str,
     inmediato (fuente="cache_vencido") y el refresco contra la CRE corre en
     background. Solo la primera consulta de un municipio espera a la API.
     """
-    repo = GasolinaRepository(db_url=DB_URL)
+    repo  = GasolinaRepository(db_url=DB_URL)
+    clave = f"gasolina:{estado}/{municipio}"
+
+    # Filas + vigencia + fecha de los datos en una sola ida a la DB.
+    registros, vigente, fecha_datos = repo.obtener_con_vigencia(estado, municipio)
 
     # ── 1. Caché vigente ───────────────────────────────────────
-    if not repo.necesita_actualizacion(estado, municipio):
+    if vigente:
         log.info("Devolviendo datos en caché para %s/%s", estado, municipio)
-        registros = repo.obtener_por_municipio(estado, municipio)
-        return _respuesta_gasolina(registros, estado, municipio, "cache")
+        return _respuesta_gasolina(registros, estado, municipio, "cache", fecha_datos)
 
     # ── 2. Vencido pero con datos → servir stale + refrescar en background ──
-    registros = repo.obtener_por_municipio(estado, municipio)
     if registros:
-        refrescar_en_background(
-            f"gasolina:{estado}/{municipio}",
-            lambda: _refrescar_gasolina(estado, municipio, entidad_id, municipio_id),
-        )
-        return _respuesta_gasolina(registros, estado, municipio, "cache_vencido")
+        refrescar_gasolina_en_background(estado, municipio, entidad_id, municipio_id)
+        return _respuesta_gasolina(registros, estado, municipio, "cache_vencido", fecha_datos)
 
-    # ── 3. Sin datos → llamar a CRE en línea (primera vez) ────
+    # ── 3. Sin datos y la CRE ya dijo hace poco que no hay → no volver a preguntar ──
+    if VerificacionFuenteRepository(db_url=DB_URL).sin_datos_reciente(
+        "gasolina", f"{estado}/{municipio}", CACHE_NEGATIVA_TTL_H
+    ):
+        log.info("Caché negativa: %s/%s sin datos en la CRE", estado, municipio)
+        return _respuesta_gasolina([], estado, municipio, "cache_negativa")
+
+    # ── 4. Sin datos → llamar a CRE en línea (primera vez, single-flight) ──
     try:
-        _refrescar_gasolina(estado, municipio, entidad_id, municipio_id)
+        registros, fuente, fecha_datos = ejecutar_una_vez(
+            clave, lambda: _primera_carga_gasolina(clave, estado, municipio, entidad_id, municipio_id)
+        )
     except Exception as e:
         log.error(f"Error actualizando gasolina {estado}/{municipio}: {e}")
         return {
@@ -295,5 +333,20 @@ def get_precios_gasolina(estado: str, municipio: str,
             "detail" : f"API no disponible y sin datos en caché: {e}",
         }
 
-    registros = repo.obtener_por_municipio(estado, municipio)
-    return _respuesta_gasolina(registros, estado, municipio, "api")
+    return _respuesta_gasolina(registros, estado, municipio, fuente, fecha_datos)
+
+
+def _primera_carga_gasolina(clave: str, estado: str, municipio: str,
+                            entidad_id: int, municipio_id: str) -> tuple[list, str, Optional[datetime]]:
+    """
+    Carga inicial de un municipio, una sola vez entre todos los workers: tras
+    obtener el advisory lock se vuelve a leer la DB, por si otro worker ya la hizo.
+    """
+    repo = GasolinaRepository(db_url=DB_URL)
+    with candado_consultivo(clave, PRIMERA_CARGA_TIMEOUT_S):
+        registros, _, fecha_datos = repo.obtener_con_vigencia(estado, municipio)
+        if registros:
+            return registros, "cache", fecha_datos
+        _refrescar_gasolina(estado, municipio, entidad_id, municipio_id)
+        registros, _, fecha_datos = repo.obtener_con_vigencia(estado, municipio)
+        return registros, "api", fecha_datos
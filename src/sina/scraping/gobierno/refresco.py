@@ -5,14 +5,38 @@ Cuando la caché está vencida pero hay datos viejos, el endpoint los devuelve d
 inmediato (fuente="cache_vencido", el frontend ya muestra el aviso de vencido) y
 el refresco contra la API de gobierno corre en un hilo daemon. Así el usuario
 nunca paga la latencia de CRE/CNE en el request path salvo la primera vez que
-se consulta una ubicación.
+se consulta una ubicación. El dedupe es por proceso Y entre workers: la clave
+se reserva también en la caché compartida (`cache_compartida.reservar`) por
+REFRESCO_RESERVA_S, así que N workers con la misma ubicación vencida lanzan UN
+solo refresco contra CRE/CNE.
+
+Esa primera vez (caché vacía) pasa por `ejecutar_una_vez`: single-flight por
+clave, para que N requests simultáneos sobre una ciudad nueva hagan UNA sola
+llamada a la API de gobierno y los demás esperen el resultado del líder.
 """
 import logging
+import os
 import threading
-from typing import Callable
+from typing import Any, Callable, TypeVar
+
+from sina.db.cache_compartida import get_almacen_compartido
 
 log = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Cuánto espera un seguidor (mismo proceso) o un worker (advisory lock en PG) a
+# que el líder termine la primera carga de una ubicación.
+PRIMERA_CARGA_TIMEOUT_S = float(os.getenv("PRIMERA_CARGA_TIMEOUT_S", "45"))
+
+# Horas que se recuerda "la fuente respondió sin datos" para una ubicación
+# (caché negativa, tabla `verificaciones_fuente`).
+CACHE_NEGATIVA_TTL_H = float(os.getenv("CACHE_NEGATIVA_TTL_H", "24"))
+
+# Tope de un refresco en background: si el worker que lo reservó muere, la
+# reserva compartida vence sola y otro worker puede volver a intentarlo.
+REFRESCO_RESERVA_S = float(os.getenv("REFRESCO_RESERVA_S", "120"))
+
 _en_curso: set[str] = set()
 _lock = threading.Lock()
 
@@ -20,13 +44,26 @@ _lock = threading.Lock()
 def refrescar_en_background(clave: str, fn: Callable[[], None]) -> bool:
     """
     Ejecuta `fn` en un hilo daemon si no hay ya un refresco en curso para
-    `clave` (dedupe por instancia). Devuelve True si se lanzó el refresco.
+    `clave`, ni en este proceso ni en otro worker. Devuelve True si se lanzó.
     """
     with _lock:
         if clave in _en_curso:
             return False
         _en_curso.add(clave)
 
+    reserva = f"refresco:{clave}"
+    try:
+        reservado = get_almacen_compartido().reservar(reserva, REFRESCO_RESERVA_S)
+    except Exception:  # noqa: BLE001
+        # Sin caché compartida se degrada al dedupe por proceso.
+        log.warning("Sin reserva compartida para %s; se refresca sin coordinar", clave, exc_info=True)
+        reservado = True
+    if not reservado:
+        with _lock:
+            _en_curso.discard(clave)
+        log.debug("Refresco de %s ya en curso en otro worker", clave)
+        return False
+
     def _worker():
         try:
             fn()
@@ -36,6 +73,60 @@ def refrescar_en_background(clave: str, fn: Callable[[], None]) -> bool:
         finally:
             with _lock:
                 _en_curso.discard(clave)
+            try:
+                get_almacen_compartido().borrar([reserva])
+            except Exception:  # noqa: BLE001
+                log.warning("No se pudo liberar la reserva de %s (vence sola)", clave, exc_info=True)
 
     threading.Thread(target=_worker, name=f"refresco-{clave}", daemon=True).start()
     return True
+
+
+# ── Single-flight (caché vacía) ──────────────────────────────
+class _Vuelo:
+    """Una ejecución en curso: los seguidores esperan `listo` y leen el desenlace."""
+    __slots__ = ("listo", "resultado", "error")
+
+    def __init__(self) -> None:
+        self.listo = threading.Event()
+        self.resultado: Any = None
+        self.error: BaseException | None = None
+
+
+_vuelos: dict[str, _Vuelo] = {}
+
+
+def ejecutar_una_vez(clave: str, fn: Callable[[], T],
+                     timeout_s: float = PRIMERA_CARGA_TIMEOUT_S) -> T:
+    """
+    Single-flight por instancia: el primer hilo que llega con `clave` ejecuta
+    `fn` (líder); los que llegan mientras corre esperan hasta `timeout_s` y
+    reciben el mismo resultado, o la misma excepción. Al terminar se olvida
+    la clave: no es una caché, la siguiente llamada vuelve a ejecutar.
+
+    Un seguidor que agota la espera recibe `TimeoutError` (el líder sigue).
+    Entre workers se coordina aparte, dentro de `fn` (ver `candado_consultivo`).
+    """
+    with _lock:
+        vuelo = _vuelos.get(clave)
+        es_lider = vuelo is None
+        if es_lider:
+            vuelo = _vuelos[clave] = _Vuelo()
+
+    if not es_lider:
+        if not vuelo.listo.wait(timeout_s):
+            raise TimeoutError(f"Tiempo agotado esperando la carga de {clave}")
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.resultado
+
+    try:
+        vuelo.resultado = fn()
+        return vuelo.resultado
+    except BaseException as e:
+        vuelo.error = e
+        raise
+    finally:
+        with _lock:
+            _vuelos.pop(clave, None)
+        vuelo.listo.set()
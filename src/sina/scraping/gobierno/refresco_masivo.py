@@ -0,0 +1,183 @@
+"""
+Motor de refresco masivo para los jobs del scheduler (gasolina diario, gas LP semanal).
+
+El job recorría las ubicaciones en serie: una llamada HTTP tras otra, más un
+upsert por ubicación. A escala nacional (miles de municipios) eso tarda muchos
+minutos. Aquí:
+
+  - Pool de hilos acotado (`max_workers`): las llamadas a la fuente corren en
+    paralelo (el cliente HTTP compartido además limita conexiones por host).
+  - Token bucket (`tasa_por_s`): ritmo máximo de llamadas a la fuente, para no
+    martillar a CRE/CNE aunque sobren workers.
+  - Escrituras por lote: los resultados se acumulan en el hilo principal y se
+    guardan con `guardar(lote)` cada `lote_filas` filas (un upsert multi-fila).
+  - Ventana de tiempo (`ventana_s`): lo que no alcanzó a arrancar antes del
+    límite se cuenta como pendiente, en vez de encimarse con la siguiente corrida.
+  - Devuelve un dict de detalles (tiempos por ítem, fallos) que `_con_registro`
+    deja en la auditoría `registro_jobs`.
+
+Es genérico y sin DB: el scheduler le pasa qué traer (`obtener`) y cómo
+guardarlo (`guardar`).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Generic, Hashable, Iterable, TypeVar
+
+log = logging.getLogger(__name__)
+
+I = TypeVar("I", bound=Hashable)
+
+WORKERS     = int(os.getenv("REFRESCO_WORKERS", "8"))
+TASA_POR_S  = float(os.getenv("REFRESCO_TASA_POR_S", "5"))
+VENTANA_MIN = float(os.getenv("REFRESCO_VENTANA_MIN", "50"))
+LOTE_FILAS  = int(os.getenv("REFRESCO_LOTE_FILAS", "1000"))
+
+_MAX_FALLOS_REGISTRADOS = 200
+
+
+class CuboTokens:
+    """Token bucket: hasta `capacidad` llamadas de golpe, luego `tasa_por_s` sostenidas."""
+
+    def __init__(self, tasa_por_s: float, capacidad: float | None = None,
+                 reloj: Callable[[], float] = time.monotonic,
+                 dormir: Callable[[float], None] = time.sleep) -> None:
+        self.tasa = tasa_por_s
+        self.capacidad = capacidad if capacidad is not None else max(1.0, tasa_por_s)
+        self._tokens = self.capacidad
+        self._ultimo = reloj()
+        self._reloj = reloj
+        self._dormir = dormir
+        self._lock = threading.Lock()
+
+    def tomar(self) -> None:
+        """Bloquea hasta que haya un token disponible y lo consume."""
+        while True:
+            with self._lock:
+                ahora = self._reloj()
+                self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.tasa
+            self._dormir(espera)
+
+
+class RefrescoMasivo(Generic[I]):
+    """
+    Refresca `items` en paralelo. `obtener(item)` trae las filas de la fuente
+    (lista vacía = la fuente no tiene datos; excepción = fallo del ítem).
+    `guardar(lote)` recibe [(item, filas), ...] y persiste el lote completo;
+    si devuelve un dict de conteos, se acumula en `detalles["escrituras"]`.
+    """
+
+    def __init__(
+        self,
+        obtener: Callable[[I], list[dict]],
+        guardar: Callable[[list[tuple[I, list[dict]]]], dict | None],
+        *,
+        etiqueta: Callable[[I], str] = str,
+        max_workers: int = WORKERS,
+        tasa_por_s: float = TASA_POR_S,
+        ventana_s: float = VENTANA_MIN * 60,
+        lote_filas: int = LOTE_FILAS,
+        reloj: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.obtener = obtener
+        self.guardar = guardar
+        self.etiqueta = etiqueta
+        self.max_workers = max(1, max_workers)
+        self.cubo = CuboTokens(tasa_por_s) if tasa_por_s > 0 else None
+        self.ventana_s = ventana_s
+        self.lote_filas = max(1, lote_filas)
+        self._reloj = reloj
+
+    def _tarea(self, item: I, limite: float) -> tuple[list[dict] | None, float]:
+        """Corre en un worker. (None, 0) = no arrancó porque se acabó la ventana."""
+        if self._reloj() >= limite:
+            return None, 0.0
+        if self.cubo is not None:
+            self.cubo.tomar()
+            if self._reloj() >= limite:
+                return None, 0.0
+        inicio = time.perf_counter()
+        filas = self.obtener(item)
+        return filas, time.perf_counter() - inicio
+
+    def ejecutar(self, items: Iterable[I]) -> dict:
+        inicio = self._reloj()
+        limite = inicio + self.ventana_s
+        items = list(items)
+
+        detalles: dict = {
+            "total": len(items), "ok": 0, "sin_datos": 0, "fallidos": 0,
+            "pendientes": 0, "filas": 0, "lotes": 0,
+            "escrituras": {}, "tiempos_ms": [], "fallos": [],
+        }
+        lote: list[tuple[I, list[dict]]] = []
+        filas_en_lote = 0
+
+        def _vaciar() -> None:
+            nonlocal lote, filas_en_lote
+            if not lote:
+                return
+            try:
+                conteo = self.guardar(lote)
+            except Exception as e:  # noqa: BLE001 — un lote fallido no tumba el resto
+                log.exception("[refresco] Error guardando lote de %d ítems", len(lote))
+                detalles["fallidos"] += len(lote)
+                self._anotar_fallo(detalles, f"lote de {len(lote)} ítems", e)
+            else:
+                detalles["lotes"] += 1
+                detalles["filas"] += filas_en_lote
+                # Conteos que devuelva `guardar` (insertados/actualizados/sin_cambios).
+                for k, v in (conteo or {}).items():
+                    detalles["escrituras"][k] = detalles["escrituras"].get(k, 0) + v
+                for _, filas in lote:
+                    detalles["ok" if filas else "sin_datos"] += 1
+            lote, filas_en_lote = [], 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix="refresco-masivo") as pool:
+            futuros: dict[Future, I] = {
+                pool.submit(self._tarea, item, limite): item for item in items
+            }
+            pendientes = set(futuros)
+            while pendientes:
+                listos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                for fut in listos:
+                    item = futuros[fut]
+                    nombre = self.etiqueta(item)
+                    try:
+                        filas, segundos = fut.result()
+                    except Exception as e:  # noqa: BLE001
+                        detalles["fallidos"] += 1
+                        self._anotar_fallo(detalles, nombre, e)
+                        continue
+                    if filas is None:
+                        detalles["pendientes"] += 1
+                        continue
+                    # Pares [ítem, ms] (no dict: los nombres pueden traer "." y van a Mongo).
+                    detalles["tiempos_ms"].append([nombre, round(segundos * 1000)])
+                    lote.append((item, filas))
+                    filas_en_lote += len(filas)
+                    if filas_en_lote >= self.lote_filas:
+                        _vaciar()
+        _vaciar()
+
+        detalles["duracion_s"] = round(self._reloj() - inicio, 2)
+        if detalles["pendientes"]:
+            log.warning("[refresco] Ventana de %.0fs agotada: %d ítems sin refrescar",
+                        self.ventana_s, detalles["pendientes"])
+        return detalles
+
+    @staticmethod
+    def _anotar_fallo(detalles: dict, nombre: str, error: Exception) -> None:
+        # Tope para no inflar el documento de auditoría en una caída total.
+        if len(detalles["fallos"]) < _MAX_FALLOS_REGISTRADOS:
+            detalles["fallos"].append({"item": nombre, "error": str(error)[:200]})
@@ -808,7 +808,7 @@ async function insertarProductos() {
         });
         const data = await r.json();
         if (!r.ok) throw new Error(data.detail || 'HTTP ' + r.status);
-        notify(`Insertados/actualizados: ${data.insertados} productos.`, 'ok');
+        notify(`Insertados: ${data.insertados}, actualizados: ${data.actualizados}, sin cambios: ${data.sin_cambios}.`, 'ok');
         closeModal();
     } catch (e) {
         console.error(e); notify('Error al insertar: ' + e.message, 'error');
@@ -0,0 +1,31 @@
+"""Consulta FTS5 (fallback SQLite) de la búsqueda de productos: plural, acentos y escape."""
+import pytest
+
+from sina.db.busqueda_texto import consulta_fts5, raiz_es
+
+
+@pytest.mark.parametrize("token,esperado", [
+    ("tortillas", "tortilla"),
+    ("limones", "limon"),
+    ("frijoles", "frijol"),
+    ("leche", "leche"),
+    ("gas", "gas"),       # raíz demasiado corta: no se toca
+    ("mes", "mes"),
+])
+def test_raiz_es(token, esperado):
+    assert raiz_es(token) == esperado
+
+
+def test_consulta_ignora_acentos_y_usa_prefijos():
+    assert consulta_fts5("Azúcar  Tortillas") == '"azucar"* AND "tortilla"*'
+
+
+def test_consulta_no_interpreta_sintaxis_fts5():
+    # Comillas, operadores y dos puntos del usuario no llegan a MATCH.
+    assert consulta_fts5('coca "cola" OR -light: 600ml') == (
+        '"coca"* AND "cola"* AND "or"* AND "light"* AND "600ml"*'
+    )
+
+
+def test_consulta_vacia():
+    assert consulta_fts5("  ¿? ") is None
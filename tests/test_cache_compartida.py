@@ -0,0 +1,157 @@
+"""Caché compartida entre workers: almacenes (memoria y SQL), L1+L2 y difusión."""
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from sina.db import cache_compartida as cc
+from sina.db.cache_respuestas import CacheRespuestas, EntradaRespuesta
+
+
+class Reloj:
+    def __init__(self, t: float = 1_000.0):
+        self.t = t
+
+    def __call__(self) -> float:
+        return self.t
+
+
+@pytest.fixture
+def sql(tmp_path):
+    return cc.AlmacenSQL(f"sqlite:///{tmp_path / 'cache.db'}")
+
+
+def test_memoria_ttl_reserva_y_contador():
+    reloj = Reloj()
+    almacen = cc.AlmacenMemoria(reloj)
+    almacen.guardar("a", b"x", 10)
+    assert almacen.obtener("a") == (b"x", 1_010.0)
+    assert almacen.reservar("r", 30) and not almacen.reservar("r", 30)
+    assert almacen.incrementar("c", 60) == (1, 1_060.0)
+    assert almacen.incrementar("c", 60, 2) == (3, 1_060.0)
+    reloj.t += 60
+    assert almacen.obtener("a") is None
+    assert almacen.reservar("r", 30)                      # la reserva vencida se puede retomar
+    assert almacen.incrementar("c", 60) == (1, 1_120.0)   # ventana nueva
+
+
+def test_sql_mismo_contrato(sql):
+    sql.guardar("a", b"\x00bytes", 60)
+    valor, _ = sql.obtener("a")
+    assert valor == b"\x00bytes"
+    assert sql.reservar("r", 60) and not sql.reservar("r", 60)
+    assert sql.obtener("r") is None                       # una reserva no es un valor
+    assert sql.incrementar("c", 60)[0] == 1
+    assert sql.incrementar("c", 60, 4)[0] == 5
+    assert sql.contador("c")[0] == 5
+    sql.borrar(["a", "r"])
+    assert sql.obtener("a") is None and sql.reservar("r", 60)
+    sql.borrar_prefijo("c")
+    assert sql.contador("c")[0] == 0
+
+
+def test_sql_reserva_vencida_y_ventana_nueva(sql):
+    assert sql.reservar("r", -1)                          # nace vencida
+    assert sql.reservar("r", 60)
+    sql.incrementar("c", -1, 7)
+    assert sql.incrementar("c", 60)[0] == 1
+
+
+def test_sql_reserva_atomica_entre_hilos(sql):
+    sql.guardar("calentar", b"", 1)
+    ganadores = []
+    hilos = [threading.Thread(target=lambda: ganadores.append(sql.reservar("r", 60))) for _ in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert ganadores.count(True) == 1
+
+
+def test_sql_difusion_por_sondeo(sql, monkeypatch):
+    monkeypatch.setattr(cc, "CACHE_COMPARTIDA_SONDEO_S", 0.05)
+    recibidos, parar = [], threading.Event()
+    receptor = threading.Thread(target=sql.escuchar, args=(recibidos.append, parar))
+    receptor.start()
+    try:
+        # El receptor arranca leyendo el último id: esperar a que haya empezado.
+        threading.Event().wait(0.2)
+        sql.publicar({"origen": "otro", "canal": "x", "claves": ["k"]})
+        sql.publicar({"origen": cc.ORIGEN, "canal": "x", "claves": ["propio"]})
+        for _ in range(40):
+            if recibidos:
+                break
+            threading.Event().wait(0.05)
+    finally:
+        parar.set()
+        receptor.join()
+    assert recibidos == [{"origen": "otro", "canal": "x", "claves": ["k"]}]
+
+
+def test_entregar_ignora_los_propios(monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(cc, "_handlers", {"canal": [llamadas.append]})
+    cc._entregar({"origen": cc.ORIGEN, "canal": "canal", "claves": ["a"]})
+    cc._entregar({"origen": "otro", "canal": "canal", "claves": ["b"]})
+    cc._entregar({"origen": "otro", "canal": "canal", "claves": None})
+    assert llamadas == [["b"], None]
+
+
+def test_obtener_o_calcular_calcula_una_vez_entre_workers(monkeypatch):
+    monkeypatch.setattr(cc, "_almacen", cc.AlmacenMemoria())
+    monkeypatch.setattr(cc, "_l1", {})
+    calculos = []
+
+    def calcular():
+        calculos.append(1)
+        return {"fecha": datetime(2026, 3, 7, tzinfo=timezone.utc), "n": 1}
+
+    primero = cc.obtener_o_calcular("k", 60, calcular)
+    # Misma forma desde la L1 que desde la L2: ya pasado por JSON.
+    assert primero == {"fecha": "2026-03-07T00:00:00+00:00", "n": 1}
+    assert cc.obtener_o_calcular("k", 60, calcular) == primero
+    cc._l1.clear()                                        # "otro worker": L1 vacía, misma L2
+    segundo = cc.obtener_o_calcular("k", 60, calcular)
+    assert segundo == primero
+    assert calculos == [1]
+
+
+def test_obtener_o_calcular_espera_al_worker_que_ya_calcula(monkeypatch):
+    almacen = cc.AlmacenMemoria()
+    monkeypatch.setattr(cc, "_almacen", almacen)
+    monkeypatch.setattr(cc, "_l1", {})
+    assert almacen.reservar("calculando:k", 30)           # otro worker ganó la reserva
+
+    def publica_el_otro(_segundos):
+        almacen.guardar("valor:k", b'{"n": 2}', 60)
+
+    monkeypatch.setattr(cc, "_dormir", publica_el_otro)
+    assert cc.obtener_o_calcular("k", 60, lambda: pytest.fail("no debía calcular")) == {"n": 2}
+
+
+def test_obtener_o_calcular_no_se_queda_esperando(monkeypatch):
+    almacen = cc.AlmacenMemoria()
+    monkeypatch.setattr(cc, "_almacen", almacen)
+    monkeypatch.setattr(cc, "_l1", {})
+    monkeypatch.setattr(cc, "_ESPERA_CALCULO_S", 0.0)
+    assert almacen.reservar("calculando:k", 30)           # el otro worker murió calculando
+    assert cc.obtener_o_calcular("k", 60, lambda: {"n": 3}) == {"n": 3}
+
+
+def test_respuestas_pasan_por_la_compartida():
+    reloj = Reloj(datetime(2026, 3, 7, tzinfo=timezone.utc).timestamp())
+    l2 = cc.AlmacenMemoria(reloj)
+    worker_a = CacheRespuestas(8, reloj=reloj, compartido=l2)
+    worker_b = CacheRespuestas(8, reloj=reloj, compartido=l2)
+    ultima = datetime(2026, 3, 6, 12, tzinfo=timezone.utc)
+    hasta = datetime.fromtimestamp(reloj.t, timezone.utc) + timedelta(hours=1)
+
+    worker_a.guardar("gasolina:sonora/hermosillo", b'{"total":3}', {"ETag": '"e"'}, hasta, ultima)
+    entrada = worker_b.obtener("gasolina:sonora/hermosillo")
+    assert entrada == EntradaRespuesta(b'{"total":3}', {"ETag": '"e"'}, ultima, hasta.timestamp())
+    assert worker_b.resumen()["aciertos_compartida"] == 1
+
+    worker_a.invalidar(["gasolina:sonora/hermosillo"])
+    assert worker_b.obtener("gasolina:sonora/hermosillo") is not None     # su LRU sigue (espera el aviso)
+    worker_b.invalidar(["gasolina:sonora/hermosillo"], compartida=False)
+    assert worker_b.obtener("gasolina:sonora/hermosillo") is None
@@ -0,0 +1,96 @@
+"""Caché LRU y coalescedor de vectores de consulta (sina.embedder.cache_consultas)."""
+import threading
+
+import pytest
+
+from sina.embedder.cache_consultas import CacheConsultas, CoalescedorConsultas, normalizar_consulta
+
+
+def test_normaliza_mayusculas_y_espacios():
+    assert normalizar_consulta("  Leche   LALA ") == "leche lala"
+
+
+def test_lru_expulsa_la_menos_usada_y_cuenta_aciertos():
+    cache = CacheConsultas(capacidad=2)
+    cache.guardar("leche", [1.0])
+    cache.guardar("huevo", [2.0])
+    assert cache.obtener("leche") == [1.0]      # leche pasa a ser la más reciente
+    cache.guardar("frijol", [3.0])              # expulsa huevo
+    assert cache.obtener("huevo") is None
+    assert cache.resumen() == {
+        "entradas": 2, "capacidad": 2, "aciertos": 1, "fallos": 1, "tasa_acierto": 0.5,
+    }
+
+
+def test_persistencia_solo_con_la_misma_identidad(tmp_path):
+    archivo = str(tmp_path / "cache.json")
+    cache = CacheConsultas(capacidad=10, archivo=archivo, identidad="m1|1024")
+    cache.guardar("leche", [1.0, 0.0])
+    cache.persistir()
+
+    misma = CacheConsultas(capacidad=10, archivo=archivo, identidad="m1|1024")
+    assert misma.cargar() == 1
+    assert misma.obtener("leche") == [1.0, 0.0]
+    assert CacheConsultas(capacidad=10, archivo=archivo, identidad="m2|1024").cargar() == 0
+
+
+def test_coalescedor_junta_consultas_concurrentes_en_un_batch():
+    lotes = []
+
+    def vectorizar_lote(textos):
+        lotes.append(sorted(textos))
+        return [[float(len(t))] for t in textos]
+
+    encolados = threading.Event()
+    # La "ventana" del líder dura hasta que los otros hilos ya encolaron su texto.
+    coalescedor = CoalescedorConsultas(vectorizar_lote, ventana_s=1,
+                                       dormir=lambda s: encolados.wait(5))
+    resultados = []
+
+    def consultar(texto):
+        resultados.append((texto, coalescedor.vectorizar(texto)))
+
+    hilos = [threading.Thread(target=consultar, args=(t,)) for t in ("arroz", "leche", "leche")]
+    for h in hilos:
+        h.start()
+    for _ in range(500):
+        if len(coalescedor._pendientes) == 2:
+            break
+        threading.Event().wait(0.01)
+    encolados.set()
+    for h in hilos:
+        h.join(timeout=5)
+    assert lotes == [["arroz", "leche"]]
+    assert sorted(resultados) == [("arroz", [5.0]), ("leche", [5.0]), ("leche", [5.0])]
+
+
+def test_coalescedor_propaga_el_error_del_provider():
+    def falla(textos):
+        raise RuntimeError("ollama caído")
+
+    with pytest.raises(RuntimeError):
+        CoalescedorConsultas(falla, ventana_s=0).vectorizar("leche")
+
+
+def test_coalescedor_falla_si_el_provider_devuelve_menos_vectores():
+    # Antes el futuro sin vector quedaba pendiente y su hilo esperaba para siempre.
+    with pytest.raises(ValueError):
+        CoalescedorConsultas(lambda textos: [], ventana_s=0).vectorizar("leche")
+
+
+def test_servicio_solo_llama_al_modelo_en_el_primer_fallo():
+    from sina.embedder.base import EmbeddingProvider
+    from sina.embedder.embeddings import EmbeddingService
+
+    class Contador(EmbeddingProvider):
+        llamadas = 0
+
+        def generate_embedding(self, text):
+            Contador.llamadas += 1
+            return [3.0, 4.0]
+
+    service = EmbeddingService(Contador(), dim=2, cache=CacheConsultas(capacidad=8))
+    assert service.vectorizar_consulta("Leche") == pytest.approx([0.6, 0.8])
+    assert service.vectorizar_consulta("  leche ") == pytest.approx([0.6, 0.8])
+    assert Contador.llamadas == 1
+    assert service.cache.resumen()["aciertos"] == 1
@@ -0,0 +1,101 @@
+"""Caché de respuestas por ubicación (sina.db.cache_respuestas) y fronteras de vigencia."""
+from datetime import datetime, timedelta, timezone
+
+from sina.db.cache_respuestas import CacheRespuestas, clave_respuesta
+from sina.db.models import (
+    gas_lp_vigente, gas_lp_vigente_hasta, gasolina_vigente, gasolina_vigente_hasta,
+)
+
+T0 = datetime(2026, 3, 7, 12, 0, tzinfo=timezone.utc)
+
+
+class Reloj:
+    def __init__(self, ahora: datetime):
+        self.t = ahora.timestamp()
+
+    def __call__(self) -> float:
+        return self.t
+
+
+def test_vence_exactamente_en_vigente_hasta():
+    reloj = Reloj(T0)
+    cache = CacheRespuestas(8, reloj=reloj)
+    cache.guardar("k", b"{}", {"ETag": '"a"'}, T0 + timedelta(seconds=10), T0)
+    reloj.t += 9.999
+    entrada = cache.obtener("k")
+    assert entrada is not None and entrada.cuerpo == b"{}" and entrada.ultima == T0
+    reloj.t += 0.001
+    assert cache.obtener("k") is None
+    assert cache.resumen()["entradas"] == 0
+
+
+def test_no_guarda_vencidas_ni_sin_fecha():
+    cache = CacheRespuestas(8, reloj=Reloj(T0))
+    cache.guardar("a", b"x", {}, T0)
+    cache.guardar("b", b"x", {}, None)
+    assert cache.obtener("a") is None and cache.obtener("b") is None
+
+
+def test_lru_e_invalidacion():
+    cache = CacheRespuestas(2, reloj=Reloj(T0))
+    hasta = T0 + timedelta(hours=1)
+    cache.guardar("a", b"a", {}, hasta)
+    cache.guardar("b", b"b", {}, hasta)
+    assert cache.obtener("a") is not None      # "a" pasa a ser la más reciente
+    cache.guardar("c", b"c", {}, hasta)        # desaloja "b"
+    assert cache.obtener("b") is None
+    assert cache.invalidar(["a", "zzz"]) == 1
+    assert cache.obtener("a") is None and cache.obtener("c") is not None
+
+
+def test_invalidacion_durante_la_carga_impide_guardar():
+    cache = CacheRespuestas(8, reloj=Reloj(T0))
+    hasta = T0 + timedelta(hours=1)
+    generacion = cache.generacion("a")
+    cache.invalidar(["a"])                     # un upsert mientras se leía la DB
+    assert not cache.guardar("a", b"viejo", {}, hasta, generacion=generacion)
+    assert cache.obtener("a") is None
+    generacion = cache.generacion("a")
+    cache.invalidar(["b"])                     # otra ubicación no afecta
+    assert cache.guardar("a", b"nuevo", {}, hasta, generacion=generacion)
+    generacion = cache.generacion("a")
+    cache.limpiar()                            # invalidación total (otro worker)
+    assert not cache.guardar("a", b"x", {}, hasta, generacion=generacion)
+
+
+def test_capacidad_cero_la_desactiva():
+    cache = CacheRespuestas(0, reloj=Reloj(T0))
+    assert not cache.habilitada
+    cache.guardar("a", b"a", {}, T0 + timedelta(hours=1))
+    assert cache.obtener("a") is None
+
+
+def test_clave_respuesta():
+    assert clave_respuesta("gasolina", "sonora/hermosillo") == "gasolina:sonora/hermosillo"
+
+
+def test_gasolina_vigente_hasta():
+    assert gasolina_vigente_hasta(None) is None
+    assert gasolina_vigente_hasta(T0) == T0 + timedelta(days=1)
+    # Naive = UTC.
+    assert gasolina_vigente_hasta(T0.replace(tzinfo=None)) == T0 + timedelta(days=1)
+
+
+def test_gas_lp_vigente_hasta_es_el_sabado_siguiente():
+    mx = timezone(timedelta(hours=-6))
+    viernes = datetime(2026, 3, 6, 23, 59, tzinfo=mx)
+    sabado = datetime(2026, 3, 7, 0, 0, tzinfo=mx)
+    assert gas_lp_vigente_hasta(viernes) == sabado
+    # Un dato del mismo sábado vale hasta el sábado de la semana siguiente.
+    assert gas_lp_vigente_hasta(sabado) == sabado + timedelta(days=7)
+    assert gas_lp_vigente_hasta(sabado + timedelta(days=3)) == sabado + timedelta(days=7)
+    assert gas_lp_vigente_hasta(None) is None
+
+
+def test_vigente_hasta_coincide_con_las_reglas_de_vigencia():
+    # La entrada de caché no debe sobrevivir a la vigencia de sus datos ni morir antes.
+    ahora = datetime.now(timezone.utc)
+    for horas in range(0, 24 * 15, 5):
+        fecha = ahora - timedelta(hours=horas, minutes=17)
+        assert gas_lp_vigente(fecha) == (gas_lp_vigente_hasta(fecha) > ahora)
+        assert gasolina_vigente(fecha) == (gasolina_vigente_hasta(fecha) > ahora)
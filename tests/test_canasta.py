@@ -0,0 +1,36 @@
+"""Resumen de la canasta precalculada (sina.config.canasta.resumir_canasta)."""
+from sina.config.canasta import CANASTA_BASICA, resumir_canasta
+
+
+def _p(tienda, precio):
+    return {"tienda": tienda, "producto": f"x {tienda}", "precio": precio}
+
+
+def test_canasta_minima_toma_el_mas_barato_de_cada_rubro():
+    r = resumir_canasta({
+        "Aceite": [_p("Ley", 30.0), _p("Soriana", 35.5)],
+        "Arroz":  [_p("Soriana", 20.25)],
+    })
+    assert r["costo_canasta_minima"] == 50.25
+    assert r["encontrados"] == 2
+    assert r["total_items"] == len(CANASTA_BASICA)
+    assert [i["item"] for i in r["items"]] == list(CANASTA_BASICA)
+    assert not next(i for i in r["items"] if i["item"] == "Huevo")["encontrado"]
+
+
+def test_costo_por_tienda_con_faltantes():
+    r = resumir_canasta({
+        "Aceite": [_p("Ley", 30.0), _p("Soriana", 35.5)],
+        "Arroz":  [_p("Soriana", 20.25)],
+    })
+    soriana, ley = r["tiendas"]["Soriana"], r["tiendas"]["Ley"]
+    assert soriana["total"] == 55.75 and soriana["items"] == 2
+    assert ley["total"] == 30.0 and "Arroz" in ley["faltantes"]
+    # La tienda con más rubros va primero.
+    assert list(r["tiendas"]) == ["Soriana", "Ley"]
+
+
+def test_sin_datos():
+    r = resumir_canasta({})
+    assert r["costo_canasta_minima"] == 0.0
+    assert r["tiendas"] == {} and r["encontrados"] == 0
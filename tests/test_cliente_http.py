@@ -0,0 +1,109 @@
+"""Cliente HTTP de fuentes de gobierno: reintentos y circuit breaker."""
+import pytest
+import requests
+
+from sina.scraping.gobierno.cliente_http import Circuito, CircuitoAbierto, ClienteHTTP
+
+
+class Reloj:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+class Resp:
+    def __init__(self, status):
+        self.status_code = status
+
+
+class SesionFalsa:
+    """Devuelve (o lanza) las respuestas programadas en orden."""
+
+    def __init__(self, *salidas):
+        self.salidas = list(salidas)
+        self.llamadas = 0
+
+    def get(self, url, **kwargs):
+        self.llamadas += 1
+        salida = self.salidas.pop(0) if len(self.salidas) > 1 else self.salidas[0]
+        if isinstance(salida, Exception):
+            raise salida
+        return Resp(salida)
+
+
+def _cliente(sesion, reintentos=2, umbral=2, reloj=None):
+    circuito = Circuito(umbral=umbral, enfriamiento_s=30, reloj=reloj or Reloj())
+    return ClienteHTTP("cre.test", sesion=sesion, reintentos=reintentos,
+                       circuito=circuito, dormir=lambda s: None)
+
+
+def test_reintenta_5xx_y_devuelve_exito():
+    sesion = SesionFalsa(503, requests.ConnectionError("reset"), 200)
+    cliente = _cliente(sesion)
+    assert cliente.get("https://cre.test/x").status_code == 200
+    assert sesion.llamadas == 3
+    assert cliente.circuito.estado == "cerrado"
+    assert cliente.resumen()["errores"] == 2
+
+
+def test_4xx_no_se_reintenta():
+    sesion = SesionFalsa(404)
+    assert _cliente(sesion).get("https://cre.test/x").status_code == 404
+    assert sesion.llamadas == 1
+
+
+def test_circuito_se_abre_y_falla_rapido():
+    reloj = Reloj()
+    sesion = SesionFalsa(requests.ConnectionError("caída"))
+    cliente = _cliente(sesion, reintentos=0, umbral=2, reloj=reloj)
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            cliente.get("https://cre.test/x")
+    assert cliente.circuito.estado == "abierto"
+
+    with pytest.raises(CircuitoAbierto):
+        cliente.get("https://cre.test/x")
+    assert sesion.llamadas == 2            # no salió a la red
+    assert cliente.resumen()["rechazadas"] == 1
+
+
+def test_semiabierto_una_sonda_y_cierra_con_exito():
+    reloj = Reloj()
+    circuito = Circuito(umbral=1, enfriamiento_s=30, reloj=reloj)
+    circuito.fallo()
+    assert not circuito.permitir()
+
+    reloj.t = 31
+    assert circuito.estado == "semiabierto"
+    assert circuito.permitir()             # la sonda
+    assert not circuito.permitir()         # los demás siguen rechazados
+    circuito.exito()
+    assert circuito.estado == "cerrado" and circuito.permitir()
+
+
+def test_sonda_fallida_reabre():
+    reloj = Reloj()
+    circuito = Circuito(umbral=3, enfriamiento_s=30, reloj=reloj)
+    for _ in range(3):
+        circuito.fallo()
+    reloj.t = 31
+    assert circuito.permitir()
+    circuito.fallo()
+    assert circuito.estado == "abierto"
+    reloj.t = 45
+    assert not circuito.permitir()
+
+
+def test_sonda_con_error_ajeno_a_la_red_se_libera():
+    reloj = Reloj()
+    cliente = _cliente(SesionFalsa(requests.ConnectionError("caída")), reintentos=0, umbral=1, reloj=reloj)
+    with pytest.raises(requests.ConnectionError):
+        cliente.get("https://cre.test/x")
+    reloj.t = 31
+    cliente._sesion = SesionFalsa(ValueError("URL inválida"))
+    with pytest.raises(ValueError):
+        cliente.get("https://cre.test/x")   # la sonda: ni éxito ni fallo
+    assert cliente.circuito.estado == "semiabierto"
+    assert cliente.circuito.permitir()      # otra sonda puede salir
@@ -0,0 +1,46 @@
+"""ETag / Last-Modified y la decisión de 304 (sina.api.condicional)."""
+from datetime import datetime, timedelta, timezone
+
+from sina.api.condicional import cabeceras_cache, etag_fuerte, no_modificado
+
+ULTIMA = datetime(2026, 3, 7, 12, 30, 15, 123456, tzinfo=timezone.utc)
+
+
+def test_etag_depende_de_version_y_parametros():
+    base = etag_fuerte("gasolina", "sonora", "hermosillo", ULTIMA, 42)
+    assert base.startswith('"') and base.endswith('"')
+    assert base == etag_fuerte("gasolina", "sonora", "hermosillo", ULTIMA, 42)
+    assert base != etag_fuerte("gasolina", "sonora", "cajeme", ULTIMA, 42)
+    assert base != etag_fuerte("gasolina", "sonora", "hermosillo", ULTIMA + timedelta(seconds=1), 42)
+    # None y "" no deben colapsar con el vecino: el separador los mantiene en su lugar.
+    assert etag_fuerte("a", None, "b") != etag_fuerte("a", "b", None)
+
+
+def test_cabeceras_last_modified_en_gmt():
+    cab = cabeceras_cache('"x"', ULTIMA)
+    assert cab["Last-Modified"] == "Sat, 07 Mar 2026 12:30:15 GMT"
+    assert cab["Cache-Control"] == "no-cache"
+    # Naive = UTC (misma convención que los repositorios).
+    assert cabeceras_cache('"x"', ULTIMA.replace(tzinfo=None))["Last-Modified"] == cab["Last-Modified"]
+    assert "Last-Modified" not in cabeceras_cache('"x"', None)
+
+
+def test_if_none_match():
+    etag = etag_fuerte("v1")
+    assert no_modificado({"if-none-match": etag}, etag, ULTIMA)
+    assert no_modificado({"if-none-match": f'"otro", W/{etag}'}, etag, ULTIMA)
+    assert no_modificado({"if-none-match": "*"}, etag, None)
+    assert not no_modificado({"if-none-match": '"otro"'}, etag, ULTIMA)
+    # Con If-None-Match presente, If-Modified-Since se ignora.
+    assert not no_modificado(
+        {"if-none-match": '"otro"', "if-modified-since": "Sun, 08 Mar 2026 00:00:00 GMT"}, etag, ULTIMA
+    )
+
+
+def test_if_modified_since():
+    etag = etag_fuerte("v1")
+    assert no_modificado({"if-modified-since": "Sat, 07 Mar 2026 12:30:15 GMT"}, etag, ULTIMA)
+    assert not no_modificado({"if-modified-since": "Sat, 07 Mar 2026 12:30:14 GMT"}, etag, ULTIMA)
+    assert not no_modificado({"if-modified-since": "no es fecha"}, etag, ULTIMA)
+    assert not no_modificado({"if-modified-since": "Sat, 07 Mar 2026 12:30:15 GMT"}, etag, None)
+    assert not no_modificado({}, etag, ULTIMA)
@@ -0,0 +1,10 @@
+"""Utilidades geográficas (sina.config.geo)."""
+import pytest
+
+from sina.config.geo import haversine_km
+
+
+def test_haversine_conocida():
+    # Hermosillo → Guaymas, ~128 km en línea recta.
+    assert haversine_km(29.0729, -110.9559, 27.9179, -110.8975) == pytest.approx(128.5, abs=1.0)
+
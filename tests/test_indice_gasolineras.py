@@ -0,0 +1,93 @@
+"""Índice espacial de gasolineras: k vecinos, más baratas en radio y geocodificación inversa."""
+import random
+
+import pytest
+
+from sina.config.geo import haversine_km
+from sina.db.indice_gasolineras import IndiceGasolineras
+
+
+def _estaciones(n=2000, semilla=7):
+    rnd = random.Random(semilla)
+    filas = []
+    for i in range(n):
+        # Dos "municipios" pegados: el límite en lng = -110.9 no importa al índice.
+        lat, lng = rnd.uniform(28.9, 29.2), rnd.uniform(-111.1, -110.7)
+        municipio = "hermosillo" if lng < -110.9 else "vecino"
+        premium = None if i % 4 else round(rnd.uniform(25, 27), 2)
+        filas.append((f"PL{i}", "sonora", municipio, f"E{i}", "x", lat, lng,
+                      round(rnd.uniform(22, 24), 2), premium, 24.5))
+    filas.append(("SIN_COORD", "sonora", "hermosillo", "S", "x", None, None, 22.0, None, None))
+    filas.append(("SIN_PRECIO", "sonora", "hermosillo", "S", "x", 29.0, -110.9, None, None, None))
+    return filas
+
+
+@pytest.fixture(scope="module")
+def filas():
+    return _estaciones()
+
+
+@pytest.fixture(scope="module")
+def indice(filas):
+    return IndiceGasolineras(filas)
+
+
+def test_descarta_sin_coordenadas_o_sin_precio(indice, filas):
+    assert indice.total == len(filas) - 2
+
+
+@pytest.mark.parametrize("punto", [(29.05, -110.9), (28.9, -111.1), (29.5, -110.0)])
+def test_k_vecinos_igual_que_fuerza_bruta(indice, filas, punto):
+    lat, lng = punto
+    esperado = sorted(
+        (f for f in filas[:-2]), key=lambda f: haversine_km(lat, lng, f[5], f[6])
+    )[:7]
+    obtenido = indice.cercanas(lat, lng, k=7)
+    assert [e["numero"] for e in obtenido] == [f[0] for f in esperado]
+    distancias = [e["distancia_km"] for e in obtenido]
+    assert distancias == sorted(distancias)
+
+
+def test_cruza_el_limite_municipal(indice):
+    municipios = {e["municipio"] for e in indice.cercanas(29.05, -110.9, k=20)}
+    assert municipios == {"hermosillo", "vecino"}
+
+
+def test_radio_y_tipo(indice, filas):
+    lat, lng, radio = 29.05, -110.9, 3.0
+    dentro = [f for f in filas[:-2]
+              if f[8] is not None and haversine_km(lat, lng, f[5], f[6]) <= radio]
+    obtenido = indice.cercanas(lat, lng, k=1000, radio_km=radio, columna="premium")
+    assert {e["numero"] for e in obtenido} == {f[0] for f in dentro}
+    assert all(e["precio"] is not None and e["distancia_km"] <= radio for e in obtenido)
+
+
+def test_mas_baratas_en_radio(indice, filas):
+    lat, lng, radio = 29.05, -110.9, 4.0
+    dentro = [f for f in filas[:-2] if haversine_km(lat, lng, f[5], f[6]) <= radio]
+    esperado = sorted(f[7] for f in dentro)[:5]
+    obtenido = indice.cercanas(lat, lng, k=5, radio_km=radio, columna="magna", ordenar_por="precio")
+    assert [e["precio"] for e in obtenido] == esperado
+    with pytest.raises(ValueError):
+        indice.cercanas(lat, lng, ordenar_por="precio")
+
+
+def test_indice_vacio():
+    assert IndiceGasolineras([]).cercanas(29.0, -110.9, k=3) == []
+
+
+def test_municipio_en_por_votacion():
+    filas = [
+        # Hermosillo: cúmulo alrededor de (29.07, -110.95).
+        *[(f"H{i}", "sonora", "hermosillo", "h", "x", 29.07 + i * 1e-3, -110.95, 22.0, None, None)
+          for i in range(5)],
+        # Una estación de otro municipio mal capturada, justo en medio del cúmulo.
+        ("X", "sonora", "cajeme", "x", "x", 29.072, -110.951, 22.0, None, None),
+        *[(f"C{i}", "sonora", "cajeme", "c", "x", 27.49 + i * 1e-3, -109.93, 22.0, None, None)
+          for i in range(5)],
+    ]
+    indice = IndiceGasolineras(filas)
+    assert indice.municipio_en(29.071, -110.949) == ("sonora", "hermosillo")
+    assert indice.municipio_en(27.5, -109.94) == ("sonora", "cajeme")
+    # Lejos de cualquier gasolinera conocida.
+    assert indice.municipio_en(19.4, -99.1) is None
@@ -0,0 +1,84 @@
+"""Índice en memoria de ubicaciones: resolución sin acentos/mayúsculas y por IDs."""
+import pytest
+
+from sina.db.indice_ubicaciones import IndiceUbicaciones, normalizar_nombre
+
+MUNICIPIOS = [
+    (26, "Sonora", "030", "Hermosillo"),
+    (26, "Sonora", "018", "Cajeme"),
+    (24, "San Luis Potosí", "028", "San Luis Potosí"),
+    (19, "Nuevo León", "039", "Monterrey"),
+]
+LOCALIDADES = [
+    (26, "030", 1, "Hermosillo"),
+    (26, "030", 289, "Bahía de Kino"),
+    (26, "018", 1, "Ciudad Obregón"),
+]
+
+
+@pytest.fixture
+def indice():
+    return IndiceUbicaciones(MUNICIPIOS, LOCALIDADES)
+
+
+@pytest.mark.parametrize(
+    ("texto", "esperado"),
+    [
+        ("San Luis Potosí", "san luis potosi"),
+        ("  NUEVO   león ", "nuevo leon"),
+        ("", ""),
+    ],
+)
+def test_normalizar_nombre(texto, esperado):
+    assert normalizar_nombre(texto) == esperado
+
+
+@pytest.mark.parametrize(
+    ("estado", "municipio"),
+    [
+        ("sonora", "hermosillo"),
+        ("SONORA", "Hermosillo"),
+        (" sonora ", "hermosillo  "),
+    ],
+)
+def test_resolver_municipio_normaliza(indice, estado, municipio):
+    assert indice.resolver_municipio(estado, municipio) == ("sonora", "hermosillo", 26, "030")
+
+
+def test_resolver_municipio_insensible_a_acentos(indice):
+    assert indice.resolver_municipio("san luis potosi", "San Luis Potosi") == (
+        "san luis potosí", "san luis potosí", 24, "028",
+    )
+
+
+def test_resolver_municipio_combinacion_invalida(indice):
+    # Ambos nombres existen, pero Monterrey no es de Sonora.
+    assert indice.es_nombre_valido("sonora")
+    assert indice.es_nombre_valido("monterrey")
+    assert indice.resolver_municipio("sonora", "monterrey") is None
+    assert indice.resolver_municipio("atlantida", "hermosillo") is None
+
+
+def test_resolver_localidad(indice):
+    loc = indice.resolver_localidad("Sonora", "Hermosillo", "bahia de kino")
+    assert loc is not None
+    assert (loc.entidad_id, loc.municipio_id, loc.localidad_id) == (26, "030", 289)
+    assert loc.nombre == "Bahía de Kino"   # conserva el nombre original
+    assert indice.resolver_localidad("sonora", "cajeme", "bahia de kino") is None
+
+
+def test_localidades_y_nombres_por_ids(indice):
+    assert indice.localidad_por_ids(26, "018", 1).nombre == "Ciudad Obregón"
+    assert indice.localidad_por_ids(26, "018", 289) is None
+    assert [l.nombre for l in indice.localidades_de(26, "030")] == ["Bahía de Kino", "Hermosillo"]
+    assert indice.nombre_entidad(19) == "Nuevo León"
+    assert indice.nombre_municipio(26, "018") == "Cajeme"
+    assert indice.nombre_municipio(26, "999") is None
+
+
+def test_catalogo_en_minusculas_y_ordenado(indice):
+    assert indice.catalogo() == {
+        "sonora": ["cajeme", "hermosillo"],
+        "san luis potosí": ["san luis potosí"],
+        "nuevo león": ["monterrey"],
+    }
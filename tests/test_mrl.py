@@ -0,0 +1,53 @@
+"""Recorte MRL de embeddings a la dimensión fija de la columna (sina.embedder.base)."""
+import math
+
+import pytest
+
+from sina.embedder.base import EmbeddingProvider, recortar_mrl
+from sina.embedder.embeddings import EmbeddingService
+
+
+def test_recorta_y_renormaliza():
+    v = recortar_mrl([3.0, 4.0, 100.0, -7.0], dim=2)
+    assert v == pytest.approx([0.6, 0.8])
+    assert math.isclose(sum(x * x for x in v), 1.0)
+
+
+def test_vector_mas_corto_que_la_dimension_falla():
+    with pytest.raises(ValueError):
+        recortar_mrl([1.0, 0.0], dim=4)
+
+
+def test_vector_cero_no_divide_entre_cero():
+    assert recortar_mrl([0.0, 0.0, 1.0], dim=2) == [0.0, 0.0]
+
+
+class _Fijo(EmbeddingProvider):
+    def generate_embedding(self, text):
+        return [1.0, 1.0, 5.0, 5.0]
+
+
+def test_servicio_entrega_la_dimension_configurada():
+    service = EmbeddingService(_Fijo(), dim=2)
+    assert len(service.vectorizar_consulta("arroz")) == 2
+    assert [len(v) for v in service.vectorizar_productos([{"producto": "a"}, {"producto": "b"}])] == [2, 2]
+
+
+class _Nombrado(_Fijo):
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+
+def test_hash_producto_ignora_el_precio():
+    s = EmbeddingService(_Nombrado("m1"), dim=2)
+    a = {"producto": "Leche Lala 1 L", "tienda": "Soriana", "precio": 25.5}
+    b = {**a, "precio": 27.0}
+    assert s.hash_producto(a) == s.hash_producto(b)
+    assert s.hash_producto(a) != s.hash_producto({**a, "marca": "Lala"})
+
+
+def test_hash_producto_cambia_con_modelo_y_dimension():
+    p = {"producto": "Arroz", "tienda": "Soriana"}
+    h = EmbeddingService(_Nombrado("m1"), dim=2).hash_producto(p)
+    assert h != EmbeddingService(_Nombrado("m2"), dim=2).hash_producto(p)
+    assert h != EmbeddingService(_Nombrado("m1"), dim=4).hash_producto(p)
@@ -0,0 +1,89 @@
+"""Single-flight de la primera carga: una sola ejecución por clave concurrente."""
+import threading
+import time
+
+import pytest
+
+from sina.scraping.gobierno.refresco import _vuelos, ejecutar_una_vez
+
+
+def _en_paralelo(n, objetivo):
+    resultados, errores = [], []
+
+    def _hilo():
+        try:
+            resultados.append(objetivo())
+        except Exception as e:  # noqa: BLE001
+            errores.append(e)
+
+    hilos = [threading.Thread(target=_hilo) for _ in range(n)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return resultados, errores
+
+
+def test_seguidores_reciben_el_resultado_del_lider():
+    llamadas = []
+    arranco = threading.Event()
+
+    def carga():
+        llamadas.append(1)
+        arranco.set()
+        time.sleep(0.2)
+        return "datos"
+
+    def pedir():
+        return ejecutar_una_vez("gasolina:sonora/hermosillo", carga, timeout_s=5)
+
+    lider = threading.Thread(target=pedir)
+    lider.start()
+    arranco.wait(2)
+    resultados, errores = _en_paralelo(8, pedir)
+    lider.join()
+
+    assert len(llamadas) == 1
+    assert resultados == ["datos"] * 8 and not errores
+    assert not _vuelos   # la clave se olvida al terminar
+
+
+def test_error_del_lider_se_propaga_y_no_se_cachea():
+    arranco = threading.Event()
+
+    def falla():
+        arranco.set()
+        time.sleep(0.1)
+        raise RuntimeError("CRE caída")
+
+    lider = threading.Thread(target=lambda: pytest.raises(RuntimeError, ejecutar_una_vez, "k", falla))
+    lider.start()
+    arranco.wait(2)
+    with pytest.raises(RuntimeError, match="CRE caída"):
+        ejecutar_una_vez("k", lambda: "no debería correr", timeout_s=5)
+    lider.join()
+
+    # Sin vuelo en curso, la siguiente llamada vuelve a ejecutar.
+    assert ejecutar_una_vez("k", lambda: "ok") == "ok"
+
+
+def test_timeout_del_seguidor():
+    arranco, soltar = threading.Event(), threading.Event()
+
+    def lenta():
+        arranco.set()
+        soltar.wait(5)
+        return "tarde"
+
+    lider = threading.Thread(target=ejecutar_una_vez, args=("lenta", lenta))
+    lider.start()
+    arranco.wait(2)
+    with pytest.raises(TimeoutError):
+        ejecutar_una_vez("lenta", lenta, timeout_s=0.05)
+    soltar.set()
+    lider.join()
+
+
+def test_claves_distintas_no_se_bloquean():
+    assert ejecutar_una_vez("a", lambda: 1) == 1
+    assert ejecutar_una_vez("b", lambda: 2) == 2
@@ -0,0 +1,76 @@
+"""Motor de refresco masivo: token bucket, lotes, fallos y ventana de tiempo."""
+import threading
+
+from sina.scraping.gobierno.refresco_masivo import CuboTokens, RefrescoMasivo
+
+
+class Reloj:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+    def dormir(self, s):
+        self.t += s
+
+
+def test_cubo_tokens_rafaga_y_ritmo():
+    reloj = Reloj()
+    cubo = CuboTokens(tasa_por_s=2, capacidad=2, reloj=reloj, dormir=reloj.dormir)
+    cubo.tomar()
+    cubo.tomar()
+    assert reloj.t == 0          # la ráfaga inicial no espera
+    for _ in range(4):
+        cubo.tomar()
+    assert reloj.t == 2.0        # luego 2 por segundo
+
+
+def test_lotes_fallos_y_sin_datos():
+    lotes = []
+    lock = threading.Lock()
+
+    def obtener(n):
+        if n == 3:
+            raise RuntimeError("CRE 500")
+        return [] if n == 4 else [{"n": n}] * 2
+
+    def guardar(lote):
+        with lock:
+            lotes.append(sorted(i for i, _ in lote))
+        return {"insertados": len(lote)}
+
+    motor = RefrescoMasivo(obtener, guardar, max_workers=4, tasa_por_s=0, lote_filas=4)
+    detalles = motor.ejecutar(range(6))
+
+    assert detalles["ok"] == 4 and detalles["sin_datos"] == 1 and detalles["fallidos"] == 1
+    assert detalles["filas"] == 8
+    assert detalles["escrituras"] == {"insertados": 5}
+    assert detalles["fallos"] == [{"item": "3", "error": "CRE 500"}]
+    assert sorted(i for lote in lotes for i in lote) == [0, 1, 2, 4, 5]
+    assert all(len(lote) <= 3 for lote in lotes)   # se vacía al llegar a 4 filas
+    assert {n for n, _ in detalles["tiempos_ms"]} == {"0", "1", "2", "4", "5"}
+
+
+def test_lote_que_falla_al_guardar_cuenta_como_fallido():
+    def guardar(lote):
+        raise RuntimeError("DB caída")
+
+    detalles = RefrescoMasivo(lambda n: [{"n": n}], guardar, tasa_por_s=0).ejecutar([1, 2])
+    assert detalles["fallidos"] == 2 and detalles["ok"] == 0
+
+
+def test_ventana_agotada_deja_pendientes():
+    reloj = Reloj()
+    llamados = []
+
+    def obtener(n):
+        llamados.append(n)
+        reloj.t += 10          # cada ítem "tarda" 10 s
+        return [{"n": n}]
+
+    motor = RefrescoMasivo(obtener, lambda lote: None, max_workers=1,
+                           tasa_por_s=0, ventana_s=25, reloj=reloj)
+    detalles = motor.ejecutar(range(5))
+    assert llamados == [0, 1, 2]
+    assert detalles["ok"] == 3 and detalles["pendientes"] == 2
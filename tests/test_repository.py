@@ -0,0 +1,144 @@
+"""Escritura masiva del repositorio (sina.db.repository) contra una SQLite temporal."""
+import locale
+
+import pytest
+from sqlalchemy import create_engine, event, func, literal, select, text, union_all
+from sqlalchemy.orm import sessionmaker
+
+try:
+    from sina.db import repository as r
+except locale.Error:   # sina.config.paths fija es_MX.UTF-8 al importarse
+    pytest.skip("requiere el locale es_MX.UTF-8", allow_module_level=True)
+from sina.db import cache_compartida as cc
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """El engine global del repositorio apuntando a una DB vacía (sin tocar la de dev)."""
+    eng = create_engine(f"sqlite:///{tmp_path / 'sina.db'}")
+    r.Base.metadata.create_all(eng)
+    monkeypatch.setattr(r, "_engine", eng)
+    monkeypatch.setattr(r, "_SessionFactory", sessionmaker(bind=eng, expire_on_commit=False))
+    monkeypatch.setattr(cc, "_almacen", cc.AlmacenMemoria())
+    return eng
+
+
+def _gasolinera(n: int, magna: float = 22.5) -> dict:
+    return {
+        "numero": f"PL/{n}/EXP/ES/2015", "estado": "sonora", "municipio": "hermosillo",
+        "nombre": f"Estación {n}", "direccion": "Blvd. Kino", "magna": magna,
+        "premium": 24.9, "diesel": 25.3, "fecha_registro": None,
+    }
+
+
+def _gas_lp(permiso: str, tipo: str = "autotanque", capacidad: int | None = None,
+            precio: float = 10.5) -> dict:
+    return {
+        "entidad_id": 26, "municipio_id": "030", "localidad_id": 1,
+        "entidad_nombre": "Sonora", "municipio_nombre": "Hermosillo", "localidad_nombre": "Hermosillo",
+        "numero_permiso": permiso, "marca_comercial": "Gas", "tipo": tipo,
+        "capacidad_recipiente": capacidad, "precio": precio,
+    }
+
+
+def test_upsert_cuenta_insertados_sin_cambios_y_actualizados(engine):
+    repo = r.GasolinaRepository()
+    filas = [_gasolinera(n) for n in range(5)]
+    assert repo.upsert_precios(filas) == {"insertados": 5, "actualizados": 0, "sin_cambios": 0}
+    # Mismas filas: el WHERE IS DISTINCT FROM no reescribe nada.
+    assert repo.upsert_precios(filas) == {"insertados": 0, "actualizados": 0, "sin_cambios": 5}
+    filas[2] = _gasolinera(2, magna=23.1)
+    assert repo.upsert_precios(filas + [_gasolinera(9)]) == {
+        "insertados": 1, "actualizados": 1, "sin_cambios": 4,
+    }
+
+
+def test_upsert_gas_lp_autotanques_no_se_duplican(engine):
+    repo = r.GasLPRepository()
+    filas = [_gas_lp("A"), _gas_lp("B", "recipiente", 20)]
+    assert repo.upsert_precios_gas_lp(filas) == {"insertados": 2, "actualizados": 0, "sin_cambios": 0}
+    # Capacidad NULL: sin el COALESCE del índice cada refresco insertaba otra vez.
+    assert repo.upsert_precios_gas_lp(filas) == {"insertados": 0, "actualizados": 0, "sin_cambios": 2}
+    filas[0] = _gas_lp("A", precio=11.0)
+    assert repo.upsert_precios_gas_lp(filas) == {"insertados": 0, "actualizados": 1, "sin_cambios": 1}
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(r.GasLPPrecio)).scalar() == 2
+
+
+def test_migracion_clave_gas_lp_depura_y_es_idempotente(engine):
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX uq_gas_lp_clave"))          # DB anterior al índice
+    r.GasLPRepository().guardar_en_bulk(
+        [_gas_lp("A", precio=10.0), _gas_lp("A", precio=10.5), _gas_lp("B", "recipiente", 20)]
+    )
+    with engine.begin() as conn:
+        assert r._migrar_clave_gas_lp(conn) == 1
+    with engine.begin() as conn:
+        assert r._migrar_clave_gas_lp(conn) is None
+        # Se conserva la fila más reciente (mayor id) de cada clave.
+        precios = conn.execute(
+            select(r.GasLPPrecio.numero_permiso, r.GasLPPrecio.precio).order_by(r.GasLPPrecio.numero_permiso)
+        ).all()
+    assert precios == [("A", 10.5), ("B", 10.5)]
+
+
+def test_trozos_respeta_el_tope_de_parametros():
+    filas = [{"a": i, "b": i, "c": i, "d": i} for i in range(10)]
+    # 4 columnas y 10 parámetros por sentencia → lotes de 2, aunque `lote` pida 500.
+    assert [len(t) for t in r._trozos(filas, 500, max_parametros=10)] == [2] * 5
+    assert [len(t) for t in r._trozos(filas, 3)] == [3, 3, 3, 1]
+
+
+def test_upsert_por_lotes_cuenta_igual_que_en_una_sentencia(engine):
+    repo = r.GasolinaRepository()
+    sentencias = []
+    conflicto = lambda ins: ins.on_conflict_do_update(
+        index_elements=["numero"], set_={"magna": ins.excluded.magna},
+        where=r._cambio_en(r.PrecioGasolina, ins.excluded, ["magna"]),
+    )
+    filas = [_gasolinera(n) for n in range(7)]
+    assert repo._upsert_masivo(filas, conflicto, lote=3) == {"insertados": 7, "actualizados": 0, "sin_cambios": 0}
+    filas[6] = _gasolinera(6, magna=30.0)
+
+    event.listen(engine, "before_cursor_execute",
+                 lambda *a: sentencias.append(a[2]) if a[2].startswith("INSERT") else None)
+    assert repo._upsert_masivo(filas + [_gasolinera(7)], conflicto, lote=3) == {
+        "insertados": 1, "actualizados": 1, "sin_cambios": 6,
+    }
+    assert len(sentencias) == 3                      # 8 filas en lotes de 3
+    with pytest.raises(ValueError):
+        repo._upsert_masivo(filas, conflicto, estrategia="copy")   # COPY es solo PostgreSQL
+
+
+def test_fusion_rrf_premia_lo_que_sale_en_ambas_ramas(engine):
+    def rama(nombre, filas):
+        return union_all(
+            *(select(literal(i).label("id"), literal(rango).label("rango")) for i, rango in filas)
+        ).cte(nombre)
+
+    # 3 es tercero en ambas ramas; 1 y 2 encabezan una sola.
+    lexico = rama("lexico", [(1, 1), (4, 2), (3, 3)])
+    semantico = rama("semantico", [(2, 1), (5, 2), (3, 3)])
+    fusion = r.SupermercadoRepository._fusion_rrf(lexico, semantico).subquery()
+    with engine.connect() as conn:
+        filas = conn.execute(select(fusion.c.id, fusion.c.puntaje).order_by(fusion.c.puntaje.desc(), fusion.c.id)).all()
+    assert [f.id for f in filas] == [3, 1, 2, 4, 5]
+    assert filas[0].puntaje == pytest.approx(2 / (r.RRF_K + 3))
+
+
+def test_buscar_muchos_respeta_el_orden_de_las_consultas(engine):
+    repo = r.SupermercadoRepository()
+    repo.upsert_productos([
+        {"pid": 1, "producto": "Leche entera 1 L", "precio": 28.0},
+        {"pid": 2, "producto": "Leche deslactosada 1 L", "precio": 26.5},
+        {"pid": 3, "producto": "Huevo blanco 12 pzas", "precio": 45.0},
+        {"pid": 4, "producto": "Tortilla de maíz 1 kg", "precio": 22.0},
+    ])
+    resultados = repo.buscar_muchos(["huevo", "leche", "café", " huevo "], limit=2, modo="texto")
+    assert [[p["producto"] for p in fila] for fila in resultados] == [
+        ["Huevo blanco 12 pzas"],
+        ["Leche deslactosada 1 L", "Leche entera 1 L"],      # por precio ascendente
+        [],
+        ["Huevo blanco 12 pzas"],                            # repetida: misma respuesta
+    ]
+    assert repo.buscar_muchos([], modo="texto") == []
@@ -0,0 +1,62 @@
+"""Ejecución en paralelo de las tools de un turno (RegistroTools.ejecutar_varios)."""
+import threading
+import time
+
+from sina.agent.llm.base import ToolCall
+from sina.agent.tools.base import RegistroTools, Tool
+
+
+def _registro(**tools):
+    reg = RegistroTools()
+    for nombre, fn in tools.items():
+        reg.registrar(Tool(nombre=nombre, descripcion="", parametros={}, fn=fn))
+    return reg
+
+
+def _llamada(nombre, **args):
+    return ToolCall(id=nombre, nombre=nombre, argumentos=args)
+
+
+def test_corren_a_la_vez_y_respetan_el_orden():
+    barrera = threading.Barrier(3, timeout=2)
+
+    def tool(valor):
+        barrera.wait()          # solo pasa si las tres corren al mismo tiempo
+        time.sleep(0.02 * (3 - valor))
+        return {"v": valor}
+
+    reg = _registro(a=tool, b=tool, c=tool)
+    salida = reg.ejecutar_varios(
+        [_llamada("a", valor=1), _llamada("b", valor=2), _llamada("c", valor=3)], paralelas=3,
+    )
+    # La de valor 1 termina al último, pero su resultado sigue siendo el primero.
+    assert [r.strip() for r, _, _ in salida] == ["v: 1", "v: 2", "v: 3"]
+    assert all(ms > 0 and not vencida for _, ms, vencida in salida)
+
+
+def test_timeout_por_llamada_no_bloquea_a_las_demas():
+    liberar = threading.Event()
+    reg = _registro(lenta=lambda: liberar.wait(5), rapida=lambda: {"ok": 1})
+    t0 = time.perf_counter()
+    salida = reg.ejecutar_varios([_llamada("lenta"), _llamada("rapida")], paralelas=2, timeout_s=0.1)
+    liberar.set()
+    assert time.perf_counter() - t0 < 1
+    (r_lenta, _, vencida_lenta), (r_rapida, _, vencida_rapida) = salida
+    assert vencida_lenta and "tardó demasiado" in r_lenta
+    assert not vencida_rapida and "ok" in r_rapida
+
+
+def test_en_cola_no_cuenta_el_tiempo_de_espera():
+    # Con un solo hilo, la segunda espera a la primera; su timeout empieza al arrancar.
+    reg = _registro(a=lambda: time.sleep(0.15) or 1, b=lambda: time.sleep(0.15) or 2)
+    salida = reg.ejecutar_varios([_llamada("a"), _llamada("b")], paralelas=1, timeout_s=0.25)
+    assert [vencida for _, _, vencida in salida] == [False, False]
+    assert all(ms < 250 for _, ms, _ in salida)
+
+
+def test_en_serie_sin_timeout_y_errores_corregibles():
+    reg = _registro(a=lambda: 1)
+    salida = reg.ejecutar_varios([_llamada("a", sobra=1), _llamada("nada")], paralelas=1)
+    assert "argumentos inválidos" in salida[0][0]
+    assert "tool desconocida" in salida[1][0]
+    assert reg.ejecutar_varios([], paralelas=4) == []